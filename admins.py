@@ -0,0 +1,85 @@
+import os
+import time
+import asyncio
+from pyrogram import enums
+import tracing
+
+# How long a fetched admin roster is trusted without a chat-member update (seconds)
+ADMIN_CACHE_TTL = int(os.environ.get("ADMIN_CACHE_TTL", 900))
+# Retry delay after a failed roster fetch, so one broken chat can't flood the API
+FETCH_RETRY_DELAY = 30
+# Rosters fetched at the same time by preload()
+PRELOAD_CONCURRENCY = 5
+
+
+class AdminCache:
+    # Per-chat set of admin user IDs, fetched once with the administrators
+    # filter and kept fresh by ChatMemberUpdated events.
+    def __init__(self, ttl=ADMIN_CACHE_TTL):
+        self.ttl = ttl
+        self._rosters = {}   # chat_id -> (admin_ids, expires_at)
+        self._pending = {}   # chat_id -> fetch task, shared by concurrent callers
+        self.hits = 0
+        self.misses = 0
+
+    async def get_admins(self, client, chat_id):
+        entry = self._rosters.get(chat_id)
+        if entry and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[0]
+        self.misses += 1
+
+        task = self._pending.get(chat_id)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(client, chat_id))
+            self._pending[chat_id] = task
+            task.add_done_callback(lambda _: self._pending.pop(chat_id, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, client, chat_id):
+        admins = set()
+        try:
+            with tracing.span("api.get_chat_members", chat_id=chat_id):
+                async for member in client.get_chat_members(chat_id, filter=enums.ChatMembersFilter.ADMINISTRATORS):
+                    if member.user:
+                        admins.add(member.user.id)
+        except Exception as e:
+            # Keep trusting the last roster (admins must not turn into
+            # ordinary users because of a FloodWait); empty only if there
+            # has never been one
+            print(f"Failed to fetch admins for {chat_id}: {e}")
+            previous = self._rosters.get(chat_id)
+            admins = previous[0] if previous else admins
+            self._rosters[chat_id] = (admins, time.monotonic() + FETCH_RETRY_DELAY)
+            return admins
+        self._rosters[chat_id] = (admins, time.monotonic() + self.ttl)
+        return admins
+
+    async def preload(self, client, chat_ids):
+        # Fetches the rosters of chats likely to send messages soon (at startup)
+        slots = asyncio.Semaphore(PRELOAD_CONCURRENCY)
+
+        async def fetch(chat_id):
+            async with slots:
+                await self.get_admins(client, chat_id)
+
+        await asyncio.gather(*(fetch(chat_id) for chat_id in chat_ids))
+
+    async def is_admin(self, client, chat_id, user_id):
+        return user_id in await self.get_admins(client, chat_id)
+
+    def update_member(self, chat_id, user_id, is_admin):
+        # Only patch rosters we already hold; unknown chats are fetched on demand
+        entry = self._rosters.get(chat_id)
+        if not entry:
+            return
+        if is_admin:
+            entry[0].add(user_id)
+        else:
+            entry[0].discard(user_id)
+
+    def invalidate(self, chat_id):
+        self._rosters.pop(chat_id, None)
+
+    def stats(self):
+        return {"size": len(self._rosters), "hits": self.hits, "misses": self.misses, "evictions": 0}
@@ -0,0 +1,150 @@
+import os
+import time
+import asyncio
+from collections import Counter, OrderedDict, deque
+
+# Group messages are queued here and handled by a fixed number of tasks,
+# instead of Pyrogram starting a handler per update with no limit. Under a
+# raid the queue is bounded and shared fairly between chats, and the bot
+# falls back to deleting only (see `degraded`) until it catches up.
+
+# Messages handled at the same time
+HANDLER_CONCURRENCY = int(os.environ.get("HANDLER_CONCURRENCY", 64))
+# Of those, at most this many from one chat (0 = an eighth of the above)
+HANDLER_CHAT_CONCURRENCY = int(os.environ.get("HANDLER_CHAT_CONCURRENCY", 0))
+# Messages queued in total / per chat before the oldest are dropped
+INTAKE_QUEUE_SIZE = int(os.environ.get("INTAKE_QUEUE_SIZE", 5000))
+INTAKE_PER_CHAT = int(os.environ.get("INTAKE_PER_CHAT", 500))
+# Queue depth at which the bot switches to delete-only mode; it switches
+# back once the queue is down to a quarter of this
+DEGRADED_QUEUE_DEPTH = int(os.environ.get("DEGRADED_QUEUE_DEPTH", 1000))
+# Seconds stop() waits for queued messages before dropping them
+INTAKE_STOP_TIMEOUT = 10
+
+
+class Admission:
+    # submit() never blocks or awaits. Each chat has its own queue and the
+    # handler tasks take one message per chat in turn, so a flooded group
+    # waits behind itself, not in front of every other group. A chat also
+    # can't hold more than `chat_concurrency` of the tasks at once, so
+    # handlers stuck on one slow chat leave the rest free for the others.
+    def __init__(self, handler, concurrency=HANDLER_CONCURRENCY, size=INTAKE_QUEUE_SIZE,
+                 per_chat=INTAKE_PER_CHAT, degraded_depth=DEGRADED_QUEUE_DEPTH,
+                 chat_concurrency=HANDLER_CHAT_CONCURRENCY):
+        self.handler = handler
+        self.concurrency = concurrency
+        self.chat_concurrency = chat_concurrency or max(1, concurrency // 8)
+        self.size = size
+        self.per_chat = per_chat
+        self.degraded_depth = degraded_depth
+        self._queues = OrderedDict()  # chat_id -> deque of (queued at, args), in turn order
+        self._depth = 0
+        self._wakeup = asyncio.Event()
+        self._tasks = []
+        self.active = 0
+        self._active = Counter()  # chat_id -> messages being handled
+        self.degraded = False
+        self.degraded_count = 0  # Times delete-only mode was entered
+        self.shed = Counter()    # reason -> messages dropped
+
+    def __len__(self):
+        return self._depth
+
+    def start(self):
+        if self._tasks: return
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+
+    def submit(self, chat_id, *args):
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = deque()
+        if len(queue) >= self.per_chat:
+            # This chat alone is over its share, it loses its oldest message
+            queue.popleft()
+            self._depth -= 1
+            self.shed["chat_full"] += 1
+        elif self._depth >= self.size:
+            # Make room in the busiest chat (only scanned when full), so a
+            # quiet chat's message still gets in
+            busiest = max(self._queues.values(), key=len)
+            busiest.popleft()
+            self._depth -= 1
+            self.shed["queue_full"] += 1
+        queue.append((time.monotonic(), args))
+        self._depth += 1
+        self._update_mode()
+        self._wakeup.set()
+
+    def oldest_age(self):
+        # Seconds the longest-waiting queued message has waited
+        if not self._depth: return 0.0
+        oldest = min(queue[0][0] for queue in self._queues.values() if queue)
+        return time.monotonic() - oldest
+
+    async def stop(self, timeout=INTAKE_STOP_TIMEOUT):
+        # Handles what is queued (for up to `timeout` seconds), then stops
+        deadline = time.monotonic() + timeout
+        while (self._depth or self.active) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        if self._depth:
+            self.shed["shutdown"] += self._depth
+            self._queues.clear()
+            self._depth = 0
+
+    def _next(self):
+        # (chat_id, message) from the first chat in turn order that isn't at
+        # its handler limit; that chat goes to the back. Chats at the limit
+        # keep their place. At most concurrency / chat_concurrency chats can
+        # be at the limit, so the scan stays short.
+        while True:
+            for chat_id, queue in self._queues.items():
+                if not queue or self._active[chat_id] < self.chat_concurrency:
+                    break
+            else:
+                return None
+            if not queue:
+                del self._queues[chat_id]
+                continue
+            item = queue.popleft()
+            self._depth -= 1
+            if queue:
+                self._queues.move_to_end(chat_id)
+            else:
+                del self._queues[chat_id]
+            return chat_id, item
+
+    def _update_mode(self):
+        if not self.degraded and self._depth >= self.degraded_depth:
+            self.degraded = True
+            self.degraded_count += 1
+            print(f"Intake queue at {self._depth} messages, switching to delete-only mode")
+        elif self.degraded and self._depth <= self.degraded_depth // 4:
+            self.degraded = False
+            print("Intake queue drained, leaving delete-only mode")
+
+    async def _run(self):
+        while True:
+            picked = self._next()
+            if picked is None:
+                # Also reached when only chats at their limit have messages;
+                # the task that frees a slot goes straight back to _next
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+            chat_id, item = picked
+            self._update_mode()
+            self.active += 1
+            self._active[chat_id] += 1
+            try:
+                await self.handler(*item[1])
+            except Exception as e:
+                print(f"Failed to handle message: {e}")
+            finally:
+                self.active -= 1
+                self._active[chat_id] -= 1
+                if not self._active[chat_id]:
+                    del self._active[chat_id]
@@ -0,0 +1,65 @@
+import re
+import unicodedata
+from domains import parse_host
+
+# The text work shared by every detection stage (see detection.evaluate),
+# done at most once per message instead of each stage lowercasing,
+# regex-scanning and slicing the text on its own. Nothing is kept between
+# stages: the lowercased copy (as large as the text) is freed once the
+# blacklist has seen it, and links and mentions are only collected for
+# messages that get past the blacklist. Parts a message doesn't have are
+# shared empty constants.
+
+url_pattern = re.compile(r"(https?://\S+|www\.\S+)")
+# Characters outside the BMP take two UTF-16 code units but one str index
+_ASTRAL = re.compile("[\U00010000-\U0010FFFF]")
+_NONE = ()
+_NO_HOSTS = frozenset()
+_UNSET = object()
+
+
+def normalized(text):
+    # Lowercased, and NFKC-folded when there is anything to fold, so
+    # "ＣＡＳＩＮＯ" (fullwidth) matches the blacklist like "casino"
+    if text.isascii() or unicodedata.is_normalized("NFKC", text):
+        # Many chat messages are lowercase already: no copy for those
+        return text if text.islower() else text.lower()
+    return unicodedata.normalize("NFKC", text).lower()
+
+
+def scan(text, entities):
+    # (mentions, hosts) of a message; `entities` as in the payload of
+    # detection.message_payload(): (type name, offset, length, url), with
+    # offsets and lengths in UTF-16 code units as Telegram sends them.
+    # Hosts are None for links that can't be parsed, which keeps the
+    # message from counting as whitelisted.
+    mentions, hosts = _NONE, _NO_HOSTS
+    # url_pattern can only match where one of these appears
+    if "http" in text or "www." in text:
+        hosts = {parse_host(url) for url in url_pattern.findall(text)}
+    utf16 = _UNSET
+    for kind, offset, length, url in entities:
+        if kind == "TEXT_LINK":
+            value = url or ""
+        elif kind == "MENTION" or kind == "URL":
+            if utf16 is _UNSET:
+                # Entity text is sliced by UTF-16 offsets only when str indexes differ
+                utf16 = text.encode("utf-16-le", "surrogatepass") if not text.isascii() and _ASTRAL.search(text) else None
+            value = _slice(text, utf16, offset, length)
+            if kind == "MENTION":
+                if mentions is _NONE:
+                    mentions = []
+                mentions.append(value.strip("@"))
+                continue
+        else:
+            continue
+        if hosts is _NO_HOSTS:
+            hosts = set()
+        hosts.add(parse_host(value))
+    return mentions, hosts
+
+
+def _slice(text, utf16, offset, length):
+    if utf16 is None:
+        return text[offset:offset + length]
+    return utf16[offset * 2:(offset + length) * 2].decode("utf-16-le", "surrogatepass")
@@ -0,0 +1,161 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from bench.common import summarize, print_table, write_json
+from bench.bench_handler import MIXES, setup, make_message
+
+# A raid on one group while other groups keep talking, replayed at fixed
+# arrival rates through bot.message_handler, e.g.
+#   python -m bench.bench_admission --mode fifo
+#   python -m bench.bench_admission --mode admission
+# "fifo" hands messages to a fixed number of tasks in arrival order, like
+# Pyrogram's update workers did before admission.py; "admission" goes
+# through admission.Admission (per-chat turns, bounded queue, delete-only
+# mode). Latency is from arrival to the end of handling.
+
+
+async def run(bot, args):
+    from admission import Admission
+
+    mongo, client, chats, users, members = await setup(bot, args)
+    raid_chat, quiet_chats = chats[0], chats[1:]
+    rng = random.Random(args.seed)
+    mix = MIXES["mixed"]
+
+    # (arrival time, group, message), sorted by arrival
+    arrivals = []
+    for i in range(int(args.raid_rate * args.seconds)):
+        arrivals.append((i / args.raid_rate, "raid", make_message("link", client, rng, [raid_chat], users, members)))
+    for i in range(int(args.rate * args.seconds)):
+        kind = rng.choices(list(mix), weights=list(mix.values()))[0]
+        arrivals.append((i / args.rate, "quiet", make_message(kind, client, rng, quiet_chats, users, members)))
+    arrivals.sort(key=lambda a: a[0])
+
+    latencies = {"raid": [], "quiet": []}
+
+    async def handle(group, arrived, message):
+        await bot.message_handler(client, message)
+        latencies[group].append(time.perf_counter() - arrived)
+
+    if args.mode == "admission":
+        intake = Admission(handle, concurrency=args.concurrency, size=args.queue_size,
+                           per_chat=args.per_chat, degraded_depth=args.degraded_depth,
+                           chat_concurrency=args.chat_concurrency)
+        bot.admission = intake  # moderate_message reads its delete-only flag
+        intake.start()
+        submit = intake.submit
+    else:
+        queue = asyncio.Queue()
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                try:
+                    await handle(*item)
+                finally:
+                    queue.task_done()
+        tasks = [asyncio.create_task(worker()) for _ in range(args.concurrency)]
+        submit = lambda chat_id, *item: queue.put_nowait(item)
+
+    bot.api.start()
+    bot.event_writer.start()
+    bot.db.start_journal()
+    await bot.workers.start()
+    mongo.reset_counters()
+    client.reset_counters()
+
+    start = time.perf_counter()
+    for at, group, message in arrivals:
+        delay = start + at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        submit(message.chat.id, group, time.perf_counter(), message)
+    if args.mode == "admission":
+        await intake.stop(timeout=600)
+        shed, degraded = dict(intake.shed), intake.degraded_count
+    else:
+        await queue.join()
+        for task in tasks:
+            task.cancel()
+        shed, degraded = {}, 0
+    elapsed = time.perf_counter() - start
+    await bot.warning_notices.stop()
+    await bot.api.stop(timeout=60)
+    await bot.event_writer.stop()
+    await bot.db.stop_journal()
+    await bot.workers.stop()
+
+    sent = {"raid": int(args.raid_rate * args.seconds), "quiet": int(args.rate * args.seconds)}
+    return {
+        "mode": args.mode,
+        "seconds": args.seconds,
+        "raid_rate": args.raid_rate,
+        "rate": args.rate,
+        "concurrency": args.concurrency,
+        "api_latency": args.api_latency,
+        "db_latency": args.db_latency,
+        "drained_after_s": round(elapsed, 3),
+        "latency": {group: summarize(values) for group, values in latencies.items()},
+        "handled": {group: len(values) for group, values in latencies.items()},
+        "sent": sent,
+        "shed": shed,
+        "degraded_entered": degraded,
+        "api_calls": dict(client.calls),
+    }
+
+
+def print_report(report):
+    print(f"Mode: {report['mode']}, {report['seconds']}s of traffic: raid {report['raid_rate']} msg/s, "
+          f"other chats {report['rate']} msg/s, concurrency {report['concurrency']}, "
+          f"API latency {report['api_latency'] * 1000:g}ms, DB latency {report['db_latency'] * 1000:g}ms")
+    print(f"Queue drained {report['drained_after_s']}s after the first message")
+    print(f"Shed: {report['shed'] or 'none'}, delete-only mode entered {report['degraded_entered']} time(s)")
+    print()
+    rows = [(group, report["sent"][group], report["handled"][group], s["p50_ms"], s["p99_ms"], s["max_ms"])
+            for group, s in report["latency"].items()]
+    print_table(["group", "sent", "handled", "p50 ms", "p99 ms", "max ms"], rows)
+    print()
+    print_table(["api call", "calls"], sorted(report["api_calls"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Update handling under a raid: FIFO workers vs admission control")
+    parser.add_argument("--mode", choices=("fifo", "admission"), default="admission")
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--raid-rate", type=float, default=400, help="Spam messages per second in the raided chat")
+    parser.add_argument("--rate", type=float, default=20, help="Messages per second across the other chats")
+    parser.add_argument("--concurrency", type=int, default=32, help="Messages handled at the same time")
+    parser.add_argument("--chat-concurrency", type=int, default=0, help="Messages from one chat handled at the same time (0 = concurrency / 8)")
+    parser.add_argument("--queue-size", type=int, default=2000)
+    parser.add_argument("--per-chat", type=int, default=1000)
+    parser.add_argument("--degraded-depth", type=int, default=200)
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--api-latency", type=float, default=0.05, help="Seconds added to every Telegram call")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Seconds added to every MongoDB call")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # bot.py reads its configuration at import time
+    for name in ("API_ID", "API_HASH", "BOT_TOKEN"):
+        os.environ.setdefault(name, "1" if name == "API_ID" else "bench")
+    os.environ.pop("MONGO_URL", None)
+    os.environ.pop("LOG_CHANNEL_ID", None)
+    os.environ["JOURNAL_PATH"] = ":memory:"
+    os.environ["WORKERS"] = "0"
+    os.environ["API_GLOBAL_RATE"] = os.environ["API_CHAT_RATE"] = "1000000"
+    os.environ["API_CHAT_BURST"] = "1000000"
+    import bot
+
+    report = asyncio.run(run(bot, args))
+    print_report(report)
+    if args.json:
+        write_json(args.json, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+import re
+import sys
+import time
+import argparse
+import tracemalloc
+from bench.common import print_table, write_json
+from detection import Policy, evaluate
+from domains import parse_host
+
+# Per-message cost of detection.evaluate() against the previous
+# implementation, which scanned the text once per stage, e.g.
+#   python -m bench.bench_analysis --iterations 20000
+# Allocation figures come from tracemalloc: the peak memory allocated while
+# one message is evaluated, averaged over the runs. Messages whose mentions
+# differ between the two are listed below the table.
+
+WORDS = ["casino", "viagra", "free*money", "crypto*pump"] + [f"word{i}" for i in range(200)]
+DOMAINS = ["youtube.com", "github.com", "t.me"]
+
+_url_pattern = re.compile(r"(https?://\S+|www\.\S+)")
+
+
+def legacy_evaluate(payload, policy):
+    # The implementation before analysis.py, kept as the baseline
+    text = payload["text"]
+    entities = payload["entities"]
+    result = {
+        "matched_word": policy.blacklist_matcher.find(text),
+        "has_link": bool(_url_pattern.search(text)),
+        "mentions": [],
+        "link_whitelisted": False,
+    }
+    if result["matched_word"]:
+        return result
+    for kind, offset, length, _ in entities:
+        if kind in ("URL", "TEXT_LINK"):
+            result["has_link"] = True
+        elif kind == "MENTION":
+            result["mentions"].append(text[offset:offset + length].strip("@"))
+    if result["has_link"]:
+        hosts = set()
+        for url in _url_pattern.findall(text):
+            hosts.add(parse_host(url))
+        for kind, offset, length, url in entities:
+            if kind == "URL":
+                hosts.add(parse_host(text[offset:offset + length]))
+            elif kind == "TEXT_LINK":
+                hosts.add(parse_host(url))
+        result["link_whitelisted"] = bool(hosts) and all(policy.domain_index.match(h) for h in hosts)
+    return result
+
+
+def utf16_len(text):
+    return len(text.encode("utf-16-le")) // 2
+
+
+def payload(text, spans=()):
+    # spans: (substring, entity type[, url]); offsets in UTF-16 units like Telegram's
+    entities, start = [], 0
+    for span in spans:
+        index = text.index(span[0], start)
+        url = span[2] if len(span) > 2 else None
+        entities.append((span[1], utf16_len(text[:index]), utf16_len(span[0]), url))
+        start = index + len(span[0])
+    return {"chat_id": 1, "text": text, "entities": entities}
+
+
+MESSAGES = {
+    "clean": payload("has anyone tried the new release yet? the changelog looks great " * 2),
+    "clean_emoji": payload("lol same here 😂😂 that was wild 🔥🔥 see you tomorrow 👋"),
+    "blacklisted": payload("best casino deals in town, sign up today"),
+    "link": payload("check this out https://promo.example.com/offer now",
+                    [("https://promo.example.com/offer", "URL")]),
+    "mention": payload("join @promo_channel for signals", [("@promo_channel", "MENTION")]),
+    "mention_emoji": payload("🔥🔥🔥 join @promo_channel 🚀 for signals", [("@promo_channel", "MENTION")]),
+    "text_link": payload("click here for the video", [("here", "TEXT_LINK", "https://www.youtube.com/watch?v=1")]),
+}
+
+
+def measure(func, message, policy, iterations):
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func(message, policy)
+    elapsed = time.perf_counter() - start
+
+    # Fewer rounds under tracemalloc, it slows every allocation down
+    rounds = max(1, iterations // 10)
+    tracemalloc.start()
+    peaks = 0
+    for _ in range(rounds):
+        tracemalloc.reset_peak()
+        base = tracemalloc.get_traced_memory()[0]
+        func(message, policy)
+        peaks += tracemalloc.get_traced_memory()[1] - base
+    tracemalloc.stop()
+    return elapsed / iterations * 1e6, peaks / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Per-message cost of detection.evaluate()")
+    parser.add_argument("--iterations", type=int, default=20000)
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+
+    policy = Policy(WORDS, DOMAINS)
+    results, rows = {}, []
+    for name, message in MESSAGES.items():
+        old_us, old_bytes = measure(legacy_evaluate, message, policy, args.iterations)
+        new_us, new_bytes = measure(evaluate, message, policy, args.iterations)
+        results[name] = {"legacy_us": round(old_us, 2), "legacy_peak_bytes": round(old_bytes),
+                         "us": round(new_us, 2), "peak_bytes": round(new_bytes)}
+        rows.append((name, round(old_us, 2), round(new_us, 2), round(old_bytes), round(new_bytes)))
+        # Mentions must come out right even where the old slicing was off
+        old_mentions = legacy_evaluate(message, policy)["mentions"]
+        new_mentions = evaluate(message, policy)["mentions"]
+        if list(old_mentions) != list(new_mentions):
+            results[name]["mentions"] = {"legacy": old_mentions, "new": new_mentions}
+    print_table(["message", "legacy µs", "µs", "legacy peak B", "peak B"], rows)
+
+    for name, result in results.items():
+        if "mentions" in result:
+            print(f"\n{name}: legacy mentions {result['mentions']['legacy']}, now {result['mentions']['new']}")
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
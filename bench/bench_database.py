@@ -0,0 +1,180 @@
+import os
+import sys
+import time
+import asyncio
+import inspect
+import argparse
+from datetime import datetime, timezone
+from bench.common import summarize, print_table, write_json
+from bench.fakes import FakeMongoClient
+from database import Database, GLOBAL_SCOPE
+from events import rollup_increments
+
+# Per-method microbenchmarks for Database against the in-memory motor
+# stand-in, e.g.
+#   python -m bench.bench_database --iterations 2000 --only warnings
+# With --db-latency 0 the numbers are the Python-side cost of each method
+# (plus the stand-in's own bookkeeping).
+
+CHAT_ID = -1001000000000
+USERS = 200
+# Start/stop plumbing, nothing to measure
+SKIPPED = {"stop_policy_sync", "stop_journal"}
+# Database arguments for the "(mongo)" cases: warnings without the journal
+MONGO_ONLY = {"journal_path": ""}
+
+
+def cases():
+    # name -> (setup, call[, Database kwargs]); call gets (db, i) and returns an awaitable
+    async def seed_policies(db):
+        for i in range(100):
+            await db.add_whitelist_domain(CHAT_ID, f"site{i}.com")
+            await db.add_blacklist_word(CHAT_ID, f"word{i}")
+            await db.add_whitelist_user(CHAT_ID, i)
+            await db.add_blacklist_word(GLOBAL_SCOPE, f"global{i}")
+        await db.load_policies()
+        await db.get_policy(CHAT_ID)
+
+    async def seed_legacy(db):
+        await db.db["blacklist"].insert_one({"type": "word", "list": [f"word{i}" for i in range(100)]})
+
+    async def seed_warnings(db):
+        for user_id in range(USERS):
+            await db.add_warning(CHAT_ID, user_id, user_id)
+
+    async def seed_mongo_warnings(db):
+        now = datetime.now(timezone.utc)
+        await db.warnings.insert_many([
+            {"chat_id": CHAT_ID, "user_id": user_id, "count": 1, "msg_ids": [user_id], "updated_at": now}
+            for user_id in range(USERS)
+        ])
+
+    async def journal_then_flush(db, i):
+        # Like one background flush during a spam wave: 100 strikes, then one write
+        for j in range(100):
+            await db.add_warning(CHAT_ID, (i * 100 + j) % USERS, j)
+        await db.flush_journal()
+
+    async def seed_deletes(db):
+        now = time.time()
+        await db.add_scheduled_deletes([(now + 60, CHAT_ID, i) for i in range(500)])
+
+    def event_batch(i):
+        # Like one flush of EventWriter during a spam wave
+        now = datetime.now(timezone.utc)
+        return [
+            {"ts": now, "meta": {"chat_id": CHAT_ID - j % 10, "action": "delete"}, "user_id": (i + j) % USERS, "reason": "link", "domains": ["promo.example.com"]}
+            for j in range(100)
+        ]
+
+    async def seed_events(db):
+        for i in range(10):
+            batch = event_batch(i)
+            await db.write_events(batch, rollup_increments(batch))
+
+    hosts = {"www.site5.com", "cdn.site42.com"}
+    text = "a perfectly ordinary message that mentions nothing on the list " * 3
+    return {
+        "ping": (None, lambda db, i: db.ping()),
+        "prepare": (None, lambda db, i: db.prepare()),
+        "ensure_indexes": (None, lambda db, i: db.ensure_indexes()),
+        "migrate_policies": (seed_legacy, lambda db, i: db.migrate_policies()),
+        "load_policies": (seed_policies, lambda db, i: db.load_policies()),
+        "get_policy": (seed_policies, lambda db, i: db.get_policy(CHAT_ID)),
+        "active_chats": (seed_policies, lambda db, i: db.active_chats(1000)),
+        "preload_policies": (seed_policies, lambda db, i: db.preload_policies([CHAT_ID - j for j in range(100)])),
+        "get_policy (cold)": (seed_policies, lambda db, i: db.get_policy(CHAT_ID - 1 - i)),
+        "get_warnings": (seed_warnings, lambda db, i: db.get_warnings(CHAT_ID, i % USERS)),
+        "get_warnings (mongo)": (seed_warnings, lambda db, i: db.get_warnings(CHAT_ID, i % USERS), MONGO_ONLY),
+        "add_warning": (None, lambda db, i: db.add_warning(CHAT_ID, i % USERS, i)),
+        "add_warning (mongo)": (None, lambda db, i: db.add_warning(CHAT_ID, i % USERS, i), MONGO_ONLY),
+        "add_warning_message": (seed_warnings, lambda db, i: db.add_warning_message(CHAT_ID, i % USERS, i)),
+        "get_warning_message_ids": (seed_warnings, lambda db, i: db.get_warning_message_ids(CHAT_ID, i % USERS)),
+        "reset_warnings": (seed_warnings, lambda db, i: db.reset_warnings(CHAT_ID, i % USERS)),
+        "reset_warnings (mongo)": (seed_warnings, lambda db, i: db.reset_warnings(CHAT_ID, i % USERS), MONGO_ONLY),
+        "load_journal": (seed_mongo_warnings, lambda db, i: db.load_journal()),
+        "flush_journal": (None, journal_then_flush),
+        "add_scheduled_deletes": (None, lambda db, i: db.add_scheduled_deletes([(time.time() + 60, CHAT_ID, i)])),
+        "remove_scheduled_deletes": (seed_deletes, lambda db, i: db.remove_scheduled_deletes(CHAT_ID, [i % 500])),
+        "get_scheduled_deletes": (seed_deletes, lambda db, i: db.get_scheduled_deletes()),
+        "set_chat_settings": (seed_policies, lambda db, i: db.set_chat_settings(CHAT_ID, flood_limit=10 + i % 5, flood_window=10)),
+        "write_events": (None, lambda db, i: (lambda batch: db.write_events(batch, rollup_increments(batch)))(event_batch(i))),
+        "get_rollups": (seed_events, lambda db, i: db.get_rollups(CHAT_ID, "hour", datetime(2000, 1, 1, tzinfo=timezone.utc))),
+        "add_policy_entry": (seed_policies, lambda db, i: db.add_policy_entry(CHAT_ID, "word", f"new{i}")),
+        "add_policy_entries": (None, lambda db, i: db.add_policy_entries(CHAT_ID, [("word", f"bulk{i % 10}_{j}") for j in range(100)])),
+        "get_policy_entries": (seed_policies, lambda db, i: db.get_policy_entries(CHAT_ID)),
+        "remove_policy_entry": (seed_policies, lambda db, i: db.remove_policy_entry(CHAT_ID, "word", f"word{i % 100}")),
+        "list_policy_entries": (seed_policies, lambda db, i: db.list_policy_entries(CHAT_ID, "domain")),
+        "count_policy_entries": (seed_policies, lambda db, i: db.count_policy_entries(CHAT_ID, "domain")),
+        "add_whitelist_domain": (None, lambda db, i: db.add_whitelist_domain(CHAT_ID, f"new{i % 100}.com")),
+        "remove_whitelist_domain": (seed_policies, lambda db, i: db.remove_whitelist_domain(CHAT_ID, f"site{i % 100}.com")),
+        "are_hosts_whitelisted": (seed_policies, lambda db, i: db.are_hosts_whitelisted(CHAT_ID, hosts)),
+        "add_whitelist_user": (None, lambda db, i: db.add_whitelist_user(CHAT_ID, i % 100)),
+        "remove_whitelist_user": (seed_policies, lambda db, i: db.remove_whitelist_user(CHAT_ID, i % 100)),
+        "is_user_whitelisted": (seed_policies, lambda db, i: db.is_user_whitelisted(CHAT_ID, i)),
+        "add_blacklist_word": (None, lambda db, i: db.add_blacklist_word(CHAT_ID, f"new{i % 100}")),
+        "remove_blacklist_word": (seed_policies, lambda db, i: db.remove_blacklist_word(CHAT_ID, f"word{i % 100}")),
+        "find_blacklisted_word": (seed_policies, lambda db, i: db.find_blacklisted_word(CHAT_ID, text)),
+    }
+
+
+def uncovered(names):
+    # Public coroutine methods of Database without a benchmark
+    return sorted(
+        name for name, member in inspect.getmembers(Database, inspect.iscoroutinefunction)
+        if not name.startswith("_") and name not in names and name not in SKIPPED
+    )
+
+
+async def bench(name, setup, call, args, options=None):
+    mongo = FakeMongoClient(latency=args.db_latency)
+    db = Database(client=mongo, **{"journal_path": ":memory:", **(options or {})})
+    await db.prepare()
+    if setup:
+        await setup(db)
+    mongo.reset_counters()
+
+    latencies = []
+    start = time.perf_counter()
+    for i in range(args.iterations):
+        t = time.perf_counter()
+        await call(db, i)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - start
+    stats = summarize(latencies)
+    stats["ops_per_s"] = round(args.iterations / elapsed, 1)
+    stats["db_calls_per_op"] = round(sum(mongo.calls.values()) / args.iterations, 3)
+    return stats
+
+
+async def run(args):
+    results = {}
+    for name, (setup, call, *options) in cases().items():
+        if args.only and not any(word in name for word in args.only):
+            continue
+        results[name] = await bench(name, setup, call, args, *options)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Microbenchmarks for each Database method")
+    parser.add_argument("--iterations", type=int, default=1000)
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds added to every MongoDB call")
+    parser.add_argument("--only", nargs="*", help="Run only methods whose name contains one of these")
+    parser.add_argument("--json", help="Also write the results to this file")
+    args = parser.parse_args(argv)
+    os.environ.pop("MONGO_URL", None)
+
+    results = asyncio.run(run(args))
+    rows = [(name, s["ops_per_s"], s["p50_ms"], s["p99_ms"], s["db_calls_per_op"]) for name, s in results.items()]
+    print_table(["method", "ops/s", "p50 ms", "p99 ms", "db calls/op"], rows)
+
+    missing = uncovered(cases())
+    if missing:
+        print(f"\nNot benchmarked: {', '.join(missing)}")
+    if args.json:
+        write_json(args.json, results)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
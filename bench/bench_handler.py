@@ -0,0 +1,249 @@
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+from collections import defaultdict
+from pyrogram import enums
+from bench.common import summarize, print_table, write_json
+from bench.fakes import FakeClient, FakeMongoClient, entity
+
+# Replays synthetic group traffic through bot.message_handler against the
+# in-memory Telegram client and database, e.g.
+#   python -m bench.bench_handler --mix mixed --messages 5000 --api-latency 0.05
+
+MIXES = {
+    "clean": {"clean": 1.0},
+    "links": {"clean": 0.5, "link": 0.4, "whitelisted_link": 0.1},
+    "blacklisted": {"clean": 0.5, "blacklisted": 0.5},
+    "mentions": {"clean": 0.4, "mention_spam": 0.35, "member_mention": 0.15, "too_many_mentions": 0.1},
+    "spam_wave": {"clean": 0.3, "spam_wave": 0.7},
+    # A few users posting clean messages as fast as they can
+    "flood": {"clean": 0.5, "flood": 0.5},
+    "mixed": {
+        "clean": 0.65, "link": 0.08, "whitelisted_link": 0.04, "blacklisted": 0.05, "spam_wave": 0.05,
+        "mention_spam": 0.05, "member_mention": 0.04, "too_many_mentions": 0.02, "admin": 0.02,
+    },
+}
+
+ADMIN_ID = 10
+WHITELISTED_USER_ID = 11
+FIRST_USER_ID = 1000
+FLOODERS = 5
+BLACKLIST = ["casino", "viagra", "free*money"]
+# The same promo copied by many accounts
+SPAM_WAVE = "🔥 Earn $500 a day from home! No experience needed, DM now: https://t.me/+promo_invite"
+WHITELIST_DOMAINS = ["youtube.com", "github.com"]
+CLEAN_TEXTS = [
+    "good morning everyone",
+    "has anyone tried the new release yet? the changelog looks great",
+    "thanks, that fixed it for me",
+    "I think the meeting is at 5pm, not 6",
+    "lol same here 😂",
+    "can someone explain how the second step works? I keep getting an error on startup",
+]
+
+
+def _with_entities(text, spans):
+    # spans: (substring, entity type[, url]) in order of appearance
+    entities, start = [], 0
+    for span in spans:
+        offset = text.index(span[0], start)
+        entities.append(entity(span[1], offset, len(span[0]), *span[2:]))
+        start = offset + len(span[0])
+    return entities
+
+
+def make_message(kind, client, rng, chats, users, members):
+    chat_id = rng.choice(chats)
+    user_id = ADMIN_ID if kind == "admin" else rng.choice(users)
+    if kind == "flood":
+        chat_id, user_id = chats[0], users[rng.randrange(FLOODERS)]
+    n = rng.randrange(10 ** 6)
+
+    if kind in ("clean", "flood"):
+        text, entities = rng.choice(CLEAN_TEXTS), None
+    elif kind in ("link", "admin"):
+        url = f"https://promo{n}.example.com/offer"
+        text = f"check this out {url} now"
+        entities = _with_entities(text, [(url, enums.MessageEntityType.URL)])
+    elif kind == "whitelisted_link":
+        url = f"https://www.youtube.com/watch?v={n}"
+        text = f"great video {url}"
+        entities = _with_entities(text, [(url, enums.MessageEntityType.URL)])
+    elif kind == "spam_wave":
+        url = SPAM_WAVE.rsplit(" ", 1)[1]
+        text = SPAM_WAVE
+        entities = _with_entities(text, [(url, enums.MessageEntityType.URL)])
+    elif kind == "blacklisted":
+        text, entities = f"best {rng.choice(['casino', 'viagra'])} deals {n}", None
+    elif kind == "mention_spam":
+        handle = f"@promo_channel{n % 50}"
+        text = f"join {handle} for signals"
+        entities = _with_entities(text, [(handle, enums.MessageEntityType.MENTION)])
+    elif kind == "member_mention":
+        handle = "@" + rng.choice(members)
+        text = f"{handle} did you see this?"
+        entities = _with_entities(text, [(handle, enums.MessageEntityType.MENTION)])
+    elif kind == "too_many_mentions":
+        handles = [f"@user{n}_{i}" for i in range(7)]
+        text = "hey " + " ".join(handles)
+        entities = _with_entities(text, [(h, enums.MessageEntityType.MENTION) for h in handles])
+    else:
+        raise ValueError(f"Unknown message kind: {kind}")
+    return client.message(chat_id, user_id, text, entities=entities)
+
+
+def parse_mix(value):
+    if value in MIXES:
+        return MIXES[value]
+    # Custom mix: clean=70,link=20,blacklisted=10
+    mix = {}
+    for part in value.split(","):
+        kind, _, weight = part.partition("=")
+        mix[kind.strip()] = float(weight or 1)
+    return mix
+
+
+async def setup(bot, args):
+    from database import Database, GLOBAL_SCOPE
+
+    mongo = FakeMongoClient(latency=args.db_latency)
+    bot.db = Database(client=mongo)
+    bot.delete_scheduler.db = bot.db
+    bot.event_writer.db = bot.db
+    await bot.db.prepare()
+    chats = [-1001000000000 - i for i in range(args.chats)]
+    # Half the lists global, half per chat, so both scopes are exercised
+    for domain in WHITELIST_DOMAINS:
+        await bot.db.add_whitelist_domain(GLOBAL_SCOPE, domain)
+    for word in BLACKLIST[:1]:
+        await bot.db.add_blacklist_word(GLOBAL_SCOPE, word)
+    await bot.db.load_policies()
+    for chat_id in chats:
+        for word in BLACKLIST[1:]:
+            await bot.db.add_blacklist_word(chat_id, word)
+        await bot.db.add_whitelist_user(chat_id, WHITELISTED_USER_ID)
+
+    members = [f"member{i}" for i in range(20)]
+    client = FakeClient(
+        latency=args.api_latency,
+        admins={chat_id: {ADMIN_ID} for chat_id in chats},
+        members={chat_id: set(members) for chat_id in chats},
+    )
+    # Same warm-up as bot.main() before it lets messages through
+    await bot.prepare_database()
+    await bot.admin_cache.preload(client, chats[:bot.PRELOAD_ADMIN_CHATS])
+    bot.ready.set()
+    users = list(range(FIRST_USER_ID, FIRST_USER_ID + args.users)) + [WHITELISTED_USER_ID]
+    return mongo, client, chats, users, members
+
+
+async def run(bot, args):
+    mongo, client, chats, users, members = await setup(bot, args)
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    kinds = rng.choices(list(mix), weights=list(mix.values()), k=args.messages)
+    messages = [make_message(k, client, rng, chats, users, members) for k in kinds]
+
+    fast_path_before = bot.metrics.FAST_PATH.value()
+    bot.api.start()
+    bot.event_writer.start()
+    bot.db.start_journal()
+    await bot.workers.start()
+    mongo.reset_counters()
+    client.reset_counters()
+
+    latencies = defaultdict(list)
+    slots = asyncio.Semaphore(args.concurrency)
+
+    async def handle(kind, message):
+        async with slots:
+            start = time.perf_counter()
+            await bot.message_handler(client, message)
+            latencies[kind].append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(handle(k, m) for k, m in zip(kinds, messages)))
+    elapsed = time.perf_counter() - start
+    # Fire-and-forget notices and cleanups count towards the API calls too
+    await bot.warning_notices.stop()
+    await bot.api.stop(timeout=60)
+    await bot.event_writer.stop()
+    await bot.db.stop_journal()
+    await bot.workers.stop()
+
+    overall = [l for values in latencies.values() for l in values]
+    report = {
+        "mix": mix,
+        "messages": args.messages,
+        "concurrency": args.concurrency,
+        "workers": args.workers,
+        "api_latency": args.api_latency,
+        "db_latency": args.db_latency,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msgs_per_s": round(args.messages / elapsed, 1),
+        "latency": summarize(overall),
+        "latency_by_kind": {kind: summarize(values) for kind, values in sorted(latencies.items())},
+        "fast_path_share": round((bot.metrics.FAST_PATH.value() - fast_path_before) / args.messages, 3),
+        "db_calls_per_msg": round(sum(mongo.calls.values()) / args.messages, 3),
+        "api_calls_per_msg": round(sum(client.calls.values()) / args.messages, 3),
+        "db_calls": dict(mongo.calls),
+        "api_calls": dict(client.calls),
+    }
+    return report
+
+
+def print_report(report):
+    print(f"Mix: {report['mix']}")
+    print(f"{report['messages']} messages, concurrency {report['concurrency']}, workers {report['workers']}, "
+          f"API latency {report['api_latency'] * 1000:g}ms, DB latency {report['db_latency'] * 1000:g}ms")
+    print(f"Throughput: {report['throughput_msgs_per_s']} msg/s ({report['elapsed_s']}s)")
+    print(f"Latency: p50 {report['latency']['p50_ms']}ms, p99 {report['latency']['p99_ms']}ms, max {report['latency']['max_ms']}ms")
+    print(f"Calls per message: DB {report['db_calls_per_msg']}, API {report['api_calls_per_msg']}")
+    print(f"Fast path (no admin/whitelist/member lookups): {report['fast_path_share'] * 100:.1f}% of messages")
+    print()
+    rows = [(kind, s["count"], s["p50_ms"], s["p99_ms"], s["max_ms"]) for kind, s in report["latency_by_kind"].items()]
+    print_table(["kind", "count", "p50 ms", "p99 ms", "max ms"], rows)
+    print()
+    print_table(["db op", "calls"], sorted(report["db_calls"].items()))
+    print()
+    print_table(["api call", "calls"], sorted(report["api_calls"].items()))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Throughput benchmark for bot.message_handler")
+    parser.add_argument("--mix", default="mixed", help=f"One of {', '.join(MIXES)} or kind=weight,... (default: mixed)")
+    parser.add_argument("--messages", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50, help="Messages handled at the same time")
+    parser.add_argument("--chats", type=int, default=20)
+    parser.add_argument("--users", type=int, default=500)
+    parser.add_argument("--api-latency", type=float, default=0.0, help="Seconds added to every Telegram call")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Seconds added to every MongoDB call")
+    parser.add_argument("--real-rate-limits", action="store_true", help="Keep the dispatcher's Telegram rate limits")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes for detection (0 = in-process)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="Also write the report to this file")
+    args = parser.parse_args(argv)
+
+    # bot.py reads its configuration at import time
+    for name in ("API_ID", "API_HASH", "BOT_TOKEN"):
+        os.environ.setdefault(name, "1" if name == "API_ID" else "bench")
+    os.environ.pop("MONGO_URL", None)
+    os.environ.pop("LOG_CHANNEL_ID", None)
+    os.environ["JOURNAL_PATH"] = ":memory:"
+    os.environ["WORKERS"] = str(args.workers)
+    if not args.real_rate_limits:
+        os.environ["API_GLOBAL_RATE"] = os.environ["API_CHAT_RATE"] = "1000000"
+        os.environ["API_CHAT_BURST"] = "1000000"
+    import bot
+
+    report = asyncio.run(run(bot, args))
+    print_report(report)
+    if args.json:
+        write_json(args.json, report)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
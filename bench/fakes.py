@@ -0,0 +1,487 @@
+import copy
+import asyncio
+import itertools
+from collections import Counter
+from types import SimpleNamespace
+from bson import ObjectId
+from pyrogram import enums
+from pyrogram.errors import UserNotParticipant
+from pymongo.errors import PyMongoError, DuplicateKeyError, BulkWriteError
+
+# In-memory stand-ins for motor and Pyrogram, just enough of both for the
+# code paths in bot.py and database.py. Every call can be given a fixed
+# latency and is counted, so benchmarks can report calls per message.
+
+
+# --- MongoDB ---
+def _get(doc, path):
+    for part in path.split("."):
+        if not isinstance(doc, dict) or part not in doc:
+            return None, False
+        doc = doc[part]
+    return doc, True
+
+
+def _match_value(value, found, condition):
+    if isinstance(condition, dict) and any(k.startswith("$") for k in condition):
+        for op, arg in condition.items():
+            if op == "$exists":
+                if found != bool(arg): return False
+            elif op == "$in":
+                if value not in arg: return False
+            elif op == "$nin":
+                if value in arg: return False
+            elif op == "$ne":
+                if value == arg: return False
+            elif op == "$gt":
+                if not found or not value > arg: return False
+            elif op == "$gte":
+                if not found or not value >= arg: return False
+            elif op == "$lt":
+                if not found or not value < arg: return False
+            elif op == "$lte":
+                if not found or not value <= arg: return False
+            elif op == "$not":
+                if _match_value(value, found, arg): return False
+            else:
+                raise NotImplementedError(f"Query operator {op}")
+        return True
+    if isinstance(value, list) and not isinstance(condition, list):
+        return condition in value
+    return found and value == condition
+
+
+def matches(doc, query):
+    for key, condition in query.items():
+        if key == "$or":
+            if not any(matches(doc, q) for q in condition): return False
+            continue
+        if key == "$and":
+            if not all(matches(doc, q) for q in condition): return False
+            continue
+        value, found = _get(doc, key)
+        if not _match_value(value, found, condition):
+            return False
+    return True
+
+
+def _set(doc, path, value):
+    parts = path.split(".")
+    for part in parts[:-1]:
+        doc = doc.setdefault(part, {})
+    doc[parts[-1]] = value
+
+
+def apply_update(doc, update, inserting=False):
+    for op, fields in update.items():
+        for path, arg in fields.items():
+            current, found = _get(doc, path)
+            if op == "$set":
+                _set(doc, path, copy.deepcopy(arg))
+            elif op == "$setOnInsert":
+                if inserting: _set(doc, path, copy.deepcopy(arg))
+            elif op == "$unset":
+                parent_path, _, leaf = path.rpartition(".")
+                parent = _get(doc, parent_path)[0] if parent_path else doc
+                if isinstance(parent, dict): parent.pop(leaf, None)
+            elif op == "$inc":
+                _set(doc, path, (current if found else 0) + arg)
+            elif op == "$max":
+                if not found or arg > current: _set(doc, path, arg)
+            elif op == "$min":
+                if not found or arg < current: _set(doc, path, arg)
+            elif op == "$push":
+                items = list(current) if found else []
+                if isinstance(arg, dict) and "$each" in arg:
+                    items.extend(copy.deepcopy(arg["$each"]))
+                    if "$slice" in arg:
+                        n = arg["$slice"]
+                        items = items[n:] if n < 0 else items[:n]
+                else:
+                    items.append(copy.deepcopy(arg))
+                _set(doc, path, items)
+            elif op == "$addToSet":
+                items = list(current) if found else []
+                values = arg["$each"] if isinstance(arg, dict) and "$each" in arg else [arg]
+                items.extend(v for v in values if v not in items)
+                _set(doc, path, items)
+            elif op == "$pull":
+                if found:
+                    _set(doc, path, [v for v in current if v != arg])
+            else:
+                raise NotImplementedError(f"Update operator {op}")
+
+
+def _project(doc, projection):
+    if not projection:
+        return copy.deepcopy(doc)
+    doc = copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        doc = {k: v for k, v in doc.items() if k in include or (k == "_id" and projection.get("_id", 1))}
+    else:
+        for key, value in projection.items():
+            if not value: doc.pop(key, None)
+    return doc
+
+
+class FakeResult(SimpleNamespace):
+    pass
+
+
+class FakeCursor:
+    def __init__(self, collection, query, projection):
+        self._collection = collection
+        self._query = query
+        self._projection = projection
+        self._sort = []
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key, direction=1):
+        self._sort = key if isinstance(key, list) else [(key, direction)]
+        return self
+
+    def skip(self, n):
+        self._skip = n
+        return self
+
+    def limit(self, n):
+        self._limit = n
+        return self
+
+    def _documents(self):
+        docs = [d for d in self._collection.docs if matches(d, self._query)]
+        for key, direction in reversed(self._sort):
+            docs.sort(key=lambda d: _get(d, key)[0], reverse=direction < 0)
+        docs = docs[self._skip:]
+        if self._limit:
+            docs = docs[:self._limit]
+        return [_project(d, self._projection) for d in docs]
+
+    async def to_list(self, length=None):
+        await self._collection._op("find")
+        docs = self._documents()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        await self._collection._op("find")
+        for doc in self._documents():
+            yield doc
+
+
+class FakeCollection:
+    def __init__(self, client, name):
+        self.client = client
+        self.name = name
+        self.docs = []
+        self.indexes = []
+
+    async def _op(self, name):
+        self.client.calls[name] += 1
+        if self.client.latency:
+            await asyncio.sleep(self.client.latency)
+        else:
+            await asyncio.sleep(0)
+
+    def _new_doc(self, fields):
+        doc = {"_id": ObjectId()}
+        doc.update(copy.deepcopy(fields))
+        self.docs.append(doc)
+        return doc
+
+    def _check_unique(self, doc):
+        # Unique indexes (without a partial filter) are enforced on upserts
+        for keys, options in self.indexes:
+            if not options.get("unique") or "partialFilterExpression" in options:
+                continue
+            fields = [k for k, _ in keys] if isinstance(keys, list) else [keys]
+            values = [_get(doc, f) for f in fields]
+            if any(d is not doc and [_get(d, f) for f in fields] == values for d in self.docs):
+                self.docs.remove(doc)
+                raise DuplicateKeyError(f"E11000 duplicate key on {fields}", 11000)
+
+    def _upsert_seed(self, query):
+        return {k: v for k, v in query.items() if not k.startswith("$") and not isinstance(v, dict)}
+
+    def _first(self, query):
+        return next((d for d in self.docs if matches(d, query)), None)
+
+    async def find_one(self, query=None, projection=None):
+        await self._op("find_one")
+        doc = self._first(query or {})
+        return _project(doc, projection) if doc else None
+
+    def find(self, query=None, projection=None):
+        return FakeCursor(self, query or {}, projection)
+
+    async def distinct(self, key, query=None):
+        await self._op("distinct")
+        values = []
+        for doc in self.docs:
+            if matches(doc, query or {}):
+                value, found = _get(doc, key)
+                if found and value not in values:
+                    values.append(value)
+        return values
+
+    async def count_documents(self, query):
+        await self._op("count_documents")
+        return sum(1 for d in self.docs if matches(d, query))
+
+    async def insert_one(self, document):
+        await self._op("insert_one")
+        return FakeResult(inserted_id=self._new_doc(document)["_id"])
+
+    async def insert_many(self, documents, ordered=True):
+        await self._op("insert_many")
+        return FakeResult(inserted_ids=[self._new_doc(d)["_id"] for d in documents])
+
+    def _update(self, query, update, upsert, many=False):
+        matched = [d for d in self.docs if matches(d, query)]
+        if not many:
+            matched = matched[:1]
+        for doc in matched:
+            apply_update(doc, update)
+        if matched or not upsert:
+            return matched, None
+        doc = self._new_doc(self._upsert_seed(query))
+        apply_update(doc, update, inserting=True)
+        self._check_unique(doc)
+        return [doc], doc["_id"]
+
+    async def update_one(self, query, update, upsert=False):
+        await self._op("update_one")
+        matched, upserted_id = self._update(query, update, upsert)
+        return FakeResult(matched_count=len(matched) if upserted_id is None else 0, upserted_id=upserted_id)
+
+    async def update_many(self, query, update, upsert=False):
+        await self._op("update_many")
+        matched, upserted_id = self._update(query, update, upsert, many=True)
+        return FakeResult(matched_count=len(matched) if upserted_id is None else 0, upserted_id=upserted_id)
+
+    async def find_one_and_update(self, query, update, upsert=False, return_document=False, projection=None):
+        await self._op("find_one_and_update")
+        before = self._first(query)
+        before = copy.deepcopy(before) if before else None
+        matched, _ = self._update(query, update, upsert)
+        if return_document:  # ReturnDocument.AFTER is True
+            return _project(matched[0], projection) if matched else None
+        return _project(before, projection) if before else None
+
+    async def delete_one(self, query):
+        await self._op("delete_one")
+        doc = self._first(query)
+        if doc:
+            self.docs.remove(doc)
+        return FakeResult(deleted_count=1 if doc else 0)
+
+    async def delete_many(self, query):
+        await self._op("delete_many")
+        before = len(self.docs)
+        self.docs = [d for d in self.docs if not matches(d, query)]
+        return FakeResult(deleted_count=before - len(self.docs))
+
+    async def bulk_write(self, requests, ordered=True):
+        await self._op("bulk_write")
+        inserted = upserted = modified = deleted = 0
+        errors = []
+        for index, request in enumerate(requests):
+            kind = type(request).__name__
+            doc = getattr(request, "_doc", None)
+            query = getattr(request, "_filter", None)
+            update = getattr(request, "_doc", None)
+            upsert = bool(getattr(request, "_upsert", False))
+            if kind == "InsertOne":
+                self._new_doc(doc)
+                inserted += 1
+            elif kind in ("UpdateOne", "UpdateMany"):
+                try:
+                    matched, upserted_id = self._update(query, update, upsert, many=kind == "UpdateMany")
+                except DuplicateKeyError as e:
+                    errors.append({"index": index, "code": 11000, "errmsg": str(e)})
+                    if ordered:
+                        break
+                    continue
+                if upserted_id is None:
+                    modified += len(matched)
+                else:
+                    upserted += 1
+            elif kind in ("DeleteOne", "DeleteMany"):
+                for d in [d for d in self.docs if matches(d, query)][:None if kind == "DeleteMany" else 1]:
+                    self.docs.remove(d)
+                    deleted += 1
+            else:
+                raise NotImplementedError(f"Bulk operation {kind}")
+        if errors:
+            raise BulkWriteError({"writeErrors": errors, "writeConcernErrors": [], "nUpserted": upserted})
+        return FakeResult(inserted_count=inserted, upserted_count=upserted, modified_count=modified, deleted_count=deleted)
+
+    async def create_index(self, keys, **kwargs):
+        await self._op("create_index")
+        self.indexes.append((keys, kwargs))
+        return str(keys)
+
+    async def drop(self):
+        await self._op("drop")
+        self.docs = []
+
+
+class FakeDatabase:
+    def __init__(self, client):
+        self.client = client
+        self._collections = {}
+
+    def __getitem__(self, name):
+        if name not in self._collections:
+            self._collections[name] = FakeCollection(self.client, name)
+        return self._collections[name]
+
+    def watch(self, *args, **kwargs):
+        # Behaves like a standalone server: no change streams
+        raise PyMongoError("Change streams are not supported by the in-memory database")
+
+    async def create_collection(self, name, **kwargs):
+        return self[name]
+
+    async def list_collection_names(self):
+        return list(self._collections)
+
+
+class FakeAdmin:
+    def __init__(self, client):
+        self.client = client
+
+    async def command(self, name, *args, **kwargs):
+        self.client.calls[name] += 1
+        await asyncio.sleep(self.client.latency)
+        return {"ok": 1}
+
+
+class FakeMongoClient:
+    # Drop-in for AsyncIOMotorClient: Database(client=FakeMongoClient())
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self._databases = {}
+        self.admin = FakeAdmin(self)
+
+    def __getitem__(self, name):
+        if name not in self._databases:
+            self._databases[name] = FakeDatabase(self)
+        return self._databases[name]
+
+    def reset_counters(self):
+        self.calls.clear()
+
+
+# --- Telegram ---
+class FakeUser(SimpleNamespace):
+    def __init__(self, id, username=None, is_self=False):
+        super().__init__(id=id, username=username, is_self=is_self, first_name=f"user{id}")
+
+    @property
+    def mention(self):
+        return f"[{self.first_name}](tg://user?id={self.id})"
+
+
+class FakeChat(SimpleNamespace):
+    def __init__(self, id, title=None):
+        super().__init__(id=id, title=title or f"Chat {id}", type=enums.ChatType.SUPERGROUP)
+
+
+def entity(type, offset, length, url=None):
+    return SimpleNamespace(type=type, offset=offset, length=length, url=url)
+
+
+class FakeMessage:
+    # Supports the Message attributes and bound methods the handlers use
+    def __init__(self, client, chat, from_user, text=None, caption=None, entities=None, caption_entities=None, id=None, sender_chat=None, reply_to_message=None):
+        self._client = client
+        self.id = id or next(client._message_ids)
+        self.chat = chat
+        self.from_user = from_user
+        self.sender_chat = sender_chat
+        self.text = text
+        self.caption = caption
+        self.entities = entities
+        self.caption_entities = caption_entities
+        self.reply_to_message = reply_to_message
+        self.command = text[1:].split() if text and text.startswith("/") else None
+
+    async def delete(self, revoke=True):
+        await self._client._call("delete")
+        return True
+
+    async def reply(self, text, quote=None, **kwargs):
+        await self._client._call("reply")
+        return FakeMessage(self._client, self.chat, self._client.me, text=text)
+
+    async def reply_document(self, document, **kwargs):
+        await self._client._call("reply_document")
+        return FakeMessage(self._client, self.chat, self._client.me)
+
+    async def edit_text(self, text, **kwargs):
+        await self._client._call("edit_text")
+        self.text = text
+        return self
+
+
+class FakeClient:
+    # Stand-in for pyrogram.Client. `admins` maps chat_id -> admin user IDs and
+    # `members` maps chat_id -> lowercase usernames that resolve in that chat.
+    def __init__(self, latency=0.0, admins=None, members=None):
+        self.latency = latency
+        self.admins = admins or {}
+        self.members = members or {}
+        self.calls = Counter()
+        self.me = FakeUser(1, "link_remover_bot", is_self=True)
+        self._message_ids = itertools.count(1)
+
+    async def _call(self, name):
+        self.calls[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        else:
+            await asyncio.sleep(0)
+
+    def reset_counters(self):
+        self.calls.clear()
+
+    def message(self, chat_id, user_id, text, entities=None, **kwargs):
+        return FakeMessage(self, FakeChat(chat_id), FakeUser(user_id), text=text, entities=entities, **kwargs)
+
+    async def get_chat_member(self, chat_id, user_id):
+        await self._call("get_chat_member")
+        if isinstance(user_id, str) and user_id.lower() not in self.members.get(chat_id, ()):
+            raise UserNotParticipant()
+        status = enums.ChatMemberStatus.ADMINISTRATOR if user_id in self.admins.get(chat_id, ()) else enums.ChatMemberStatus.MEMBER
+        return SimpleNamespace(user=FakeUser(user_id if isinstance(user_id, int) else 0, user_id), status=status)
+
+    async def get_chat_members(self, chat_id, filter=None, **kwargs):
+        await self._call("get_chat_members")
+        for user_id in self.admins.get(chat_id, ()):
+            yield SimpleNamespace(user=FakeUser(user_id), status=enums.ChatMemberStatus.ADMINISTRATOR)
+
+    async def restrict_chat_member(self, chat_id, user_id, permissions, until_date=None):
+        await self._call("restrict_chat_member")
+        return True
+
+    async def delete_messages(self, chat_id, message_ids, revoke=True):
+        await self._call("delete_messages")
+        return len(message_ids) if isinstance(message_ids, list) else 1
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._call("send_message")
+        return FakeMessage(self, FakeChat(chat_id), self.me, text=text)
+
+    async def send_document(self, chat_id, document, **kwargs):
+        await self._call("send_document")
+        return FakeMessage(self, FakeChat(chat_id), self.me)
+
+    async def edit_message_text(self, chat_id, message_id, text, **kwargs):
+        await self._call("edit_message_text")
+        return FakeMessage(self, FakeChat(chat_id), self.me, text=text, id=message_id)
@@ -1,18 +1,45 @@
+import time
+# Startup is timed from here, so the imports below are part of it
+_imports_started = time.perf_counter()
 import os
-import os
-import re
+import io
 import asyncio
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from pyrogram import Client, filters, types, enums
-from threading import Thread
-from http.server import HTTPServer, BaseHTTPRequestHandler
-from database import Database
-from deep_translator import GoogleTranslator
-import time
-
-# Cache for member checks: (chat_id, username) -> (is_member, timestamp)
-member_cache = {}
-CACHE_DURATION = 600 # 10 minutes
+from bson import ObjectId
+from database import Database, GLOBAL_SCOPE
+from detection import message_payload, fingerprint, MENTION_WHITELIST
+from admins import AdminCache
+from log_writer import LogWriter
+from scheduler import DeleteScheduler
+from dispatcher import Dispatcher, PRIORITY_ACTION, PRIORITY_NOTICE, PRIORITY_LOG
+from translator import TranslationService
+from health import HealthServer
+from workers import WorkerPool, MAX_WORKERS
+from events import EventWriter, ACTIONS, merge_rollups, period_start
+from notices import WarningNotices
+from admission import Admission
+import listfile
+from flood import FloodTracker, FLOOD_LIMIT, FLOOD_WINDOW, MAX_FLOOD_LIMIT, MAX_FLOOD_WINDOW
+import metrics
+import tracing
+from cache import TTLCache
+_imports_done = time.perf_counter()
+
+# Cache for member checks: (chat_id, username) -> is_member
+member_cache = TTLCache(
+    maxsize=int(os.environ.get("MEMBER_CACHE_SIZE", 50000)),
+    ttl=600, # 10 minutes
+    negative_ttl=120 # Non-members may join soon, recheck sooner
+)
+
+# Detection results for recently seen content, so copies of a spam wave skip
+# the checks: (chat_id, policy revision, content fingerprint) -> result.
+# A list change gives the chat a new revision, which retires its entries.
+verdict_cache = TTLCache(
+    maxsize=int(os.environ.get("VERDICT_CACHE_SIZE", 20000)),
+    ttl=600
+)
 
 
 # Telegram bot credentials
@@ -25,54 +52,204 @@ try:
     log_channel_id = int(log_channel_id)
 except ValueError:
     pass # Keep as string (e.g. @channelname)
+# Entries shown per /list page
+LIST_PAGE_SIZE = 50
+# Longest period /stats reports on (days)
+MAX_STATS_DAYS = 90
+# Upper bound for /profile, the profiler slows the bot down while it runs
+MAX_PROFILE_SECONDS = 60
+# User IDs allowed to run /profile (comma-separated); it profiles the whole
+# process, so it is off unless the bot's operator lists themselves here
+PROFILE_ADMIN_IDS = {int(u) for u in os.environ.get("PROFILE_ADMIN_IDS", "").replace(" ", "").split(",") if u.isdigit()}
+# Chats whose lists / admin rosters are loaded at startup, before messages are handled
+PRELOAD_CHATS = int(os.environ.get("PRELOAD_CHATS", 1000))
+PRELOAD_ADMIN_CHATS = int(os.environ.get("PRELOAD_ADMIN_CHATS", 50))
+# Messages are handled after this long even if admin rosters are still loading (seconds)
+PRELOAD_TIMEOUT = 30
 
 app = Client("link_remover_bot", api_id=api_id, api_hash=api_hash, bot_token=bot_token)
 db = Database()
-
-# Regex pattern for links
-url_pattern = re.compile(r"(https?://\S+|www\.\S+)")
+api = Dispatcher()
+admin_cache = AdminCache()
+log_writer = LogWriter(log_channel_id, api)
+delete_scheduler = DeleteScheduler(db, api)
+event_writer = EventWriter(db)
+warning_notices = WarningNotices(api, delete_scheduler)
+# Group messages are queued here and handled by a fixed pool of tasks (see intake_handler)
+admission = Admission(lambda client, message: message_handler(client, message))
+translator = TranslationService()
+workers = WorkerPool()
+# Set once startup has warmed the caches; messages wait for it
+ready = asyncio.Event()
+startup_timings = {}  # phase -> seconds
+flood_tracker = FloodTracker()
+
+metrics.register_cache("member", member_cache)
+metrics.register_cache("verdict", verdict_cache)
+metrics.register_cache("admin", admin_cache)
+metrics.register_cache("translation", translator.cache)
+metrics.Gauge("bot_api_queue_depth", "Outbound Telegram calls waiting", callback=api.qsize)
+metrics.CallbackCounter("bot_api_flood_waits_total", "FloodWait errors received", callback=lambda: api.flood_waits)
+metrics.CallbackCounter("bot_log_events_dropped_total", "Log events dropped (queue full)", callback=lambda: log_writer.dropped_events)
+metrics.Gauge("bot_event_queue_depth", "Moderation events waiting to be written", callback=lambda: len(event_writer))
+metrics.CallbackCounter("bot_events_written_total", "Moderation events written to MongoDB", callback=lambda: event_writer.written)
+metrics.CallbackCounter("bot_events_dropped_total", "Moderation events dropped (queue full or write failed)", callback=lambda: event_writer.dropped + event_writer.failed)
+metrics.Gauge("bot_warning_notices", "Warning notices still taking updates", callback=lambda: len(warning_notices))
+metrics.CallbackCounter("bot_warning_notices_sent_total", "Warning notices sent", callback=lambda: warning_notices.sent)
+metrics.CallbackCounter("bot_warning_notices_coalesced_total", "Warnings shown by updating an existing notice", callback=lambda: warning_notices.coalesced)
+metrics.Gauge("bot_journal_users", "Users with warnings held in the local journal", callback=lambda: len(db.journal) if db.journal is not None else 0)
+metrics.Gauge("bot_journal_backlog", "Users whose latest warnings are not in MongoDB yet", callback=lambda: db.journal_backlog())
+metrics.Gauge("bot_journal_lag_seconds", "Age of the oldest warning change not in MongoDB yet", callback=lambda: round(db.journal_lag(), 3))
+metrics.Gauge("bot_scheduled_deletes", "Messages waiting for auto-deletion", callback=lambda: len(delete_scheduler))
+metrics.Gauge("bot_intake_queue_depth", "Group messages waiting to be handled", callback=lambda: len(admission))
+metrics.Gauge("bot_intake_oldest_seconds", "Time the longest-waiting queued message has waited", callback=admission.oldest_age)
+metrics.Gauge("bot_intake_active", "Group messages being handled", callback=lambda: admission.active)
+metrics.CallbackCounter("bot_intake_shed_total", "Group messages dropped without being handled", ["reason"], callback=lambda: {(k,): v for k, v in admission.shed.items()})
+metrics.Gauge("bot_degraded", "1 while the bot only deletes (warnings and logs skipped)", callback=lambda: int(admission.degraded))
+metrics.CallbackCounter("bot_degraded_entered_total", "Times delete-only mode was entered", callback=lambda: admission.degraded_count)
+metrics.Gauge("bot_worker_processes", "Worker processes evaluating messages", callback=lambda: len(workers))
+metrics.Gauge("bot_worker_pending", "Messages waiting for a worker verdict", callback=workers.pending)
+metrics.CallbackCounter("bot_worker_fallbacks_total", "Messages evaluated locally after a worker failure", callback=lambda: workers.fallbacks)
+metrics.Gauge("bot_flood_tracked_users", "Users with recent messages tracked for flood detection", callback=lambda: len(flood_tracker))
+metrics.CallbackCounter("bot_floods_total", "Floods detected", callback=lambda: flood_tracker.floods)
+metrics.Gauge("bot_startup_seconds", "Time spent in each startup phase", ["phase"], callback=lambda: {(k,): round(v, 3) for k, v in startup_timings.items()})
+metrics.CallbackCounter("bot_trace_spans_dropped_total", "Trace spans dropped (export backlog full)", callback=lambda: tracing.dropped_spans)
 
 # Helper for auto-deleting messages
-async def scheduled_delete(message, delay=120):
-    await asyncio.sleep(delay)
-    try:
-        await message.delete()
-    except Exception:
-        pass
+def schedule_delete(message, delay=120):
+    delete_scheduler.schedule(message.chat.id, message.id, delay)
 
-async def log_action(client, action, details, message=None):
-    if log_channel_id != 0:
-        try:
-            text = f"**{action}**\n{details}"
-            await client.send_message(log_channel_id, text)
-        except Exception as e:
-            print(f"Failed to log action: {e}")
-            if message:
-                try:
-                    await message.reply(f"⚠️ **Log Error:** {e}\nCheck Bot Permissions in Log Channel.")
-                except:
-                    pass
-    elif message:
-        # Warn if Log Channel ID is not set but we tried to log
-        pass
+# --- Outbound API helpers (every Telegram call goes through the dispatcher) ---
+async def delete_message(message):
+    return await api.call(PRIORITY_ACTION, message.chat.id, message.delete)
+
+async def restrict_member(client, chat_id, user_id, permissions, **kwargs):
+    return await api.call(PRIORITY_ACTION, chat_id, client.restrict_chat_member, chat_id, user_id, permissions, **kwargs)
+
+async def reply(message, text, **kwargs):
+    return await api.call(PRIORITY_NOTICE, message.chat.id, message.reply, text, **kwargs)
+
+async def edit_text(message, text, **kwargs):
+    return await api.call(PRIORITY_NOTICE, message.chat.id, message.edit_text, text, **kwargs)
+
+def send_notice(message, text, delay=120, **kwargs):
+    # Reply without waiting for it, the reply deletes itself after `delay` seconds
+    def on_sent(future):
+        if not future.cancelled() and not future.exception():
+            schedule_delete(future.result(), delay=delay)
+    api.send(PRIORITY_NOTICE, message.chat.id, message.reply, text, **kwargs).add_done_callback(on_sent)
+
+def log_action(action, details):
+    # Queued, sent to the log channel in batches by log_writer
+    log_writer.log(action, details)
 
 async def delete_previous_warnings(client, chat_id, user_id, exclude_id=None):
     try:
-        msg_ids = await db.get_warning_message_ids(user_id)
+        msg_ids = await db.get_warning_message_ids(chat_id, user_id)
         if msg_ids:
             if exclude_id:
                 msg_ids = [mid for mid in msg_ids if mid != exclude_id]
             if msg_ids:
-                await client.delete_messages(chat_id, msg_ids)
+                api.send(PRIORITY_LOG, chat_id, client.delete_messages, chat_id, msg_ids)
     except Exception:
         pass
 
+def sender_mention(message):
+    # Users, and chats posting as themselves (channels, anonymous admins)
+    if message.from_user:
+        return message.from_user.mention
+    return message.sender_chat.title if message.sender_chat else "Unknown sender"
+
+async def warn_user(client, message, reason, warn_text, mute_text, fail_text):
+    # Adds a warning and shows it in the user's warning notice (one edited
+    # message per burst, see notices.py); mutes for 24h at the limit.
+    # Returns True if the user was muted.
+    if not message.from_user:
+        return False # Posted as a chat: nobody to warn or mute
+    if admission.degraded:
+        # Delete-only mode: no strike, no reply
+        metrics.DEGRADED_SKIPS.inc()
+        return False
+    chat_id = message.chat.id
+    user_id = message.from_user.id
+    mention = message.from_user.mention
+    warnings = await db.add_warning(chat_id, user_id)
+    event_writer.record(chat_id, "warn", user_id, reason)
+    limit = 3
+
+    if warnings >= limit:
+        # Punish
+        try:
+            await delete_previous_warnings(client, chat_id, user_id)
+            warning_notices.forget(chat_id, user_id)
+            until_date = datetime.now() + timedelta(hours=24)
+            await restrict_member(
+                client,
+                chat_id,
+                user_id,
+                types.ChatPermissions(can_send_messages=False),
+                until_date=until_date
+            )
+        except Exception as e:
+            text = f"⚠️ {mention}, {fail_text}! (Warning {warnings}/{limit})\nI tried to mute you but failed: {e}"
+        else:
+            # Muted: the strikes are spent whatever happens to the notice
+            event_writer.record(chat_id, "mute", user_id, reason)
+            try:
+                await db.reset_warnings(chat_id, user_id)
+            except Exception as e:
+                print(f"Failed to reset warnings for {user_id} in {chat_id}: {e}")
+            button = types.InlineKeyboardMarkup([
+                [types.InlineKeyboardButton("🔓 Unmute (Admin Only)", callback_data=f"unmute_{user_id}")]
+            ])
+            # Mute message stays forever; not awaited, like the warning notices
+            api.send(PRIORITY_NOTICE, chat_id, message.reply, f"🚫 {mention} has been muted for 24h due to {mute_text}.", reply_markup=button)
+            return True
+    else:
+        text = f"⚠️ {mention}, {warn_text}! (Warning {warnings}/{limit})"
+
+    # Not awaited: the notice can wait on the chat's rate limit, the handler doesn't
+    warning_notices.show(message, user_id, text,
+                         on_sent=lambda notice_id: db.add_warning_message(chat_id, user_id, notice_id))
+    return False
+
+async def is_chat_member(client, chat_id, username):
+    async def lookup():
+        try:
+            with tracing.span("api.get_chat_member"):
+                await client.get_chat_member(chat_id, username)
+            return True
+        except Exception:
+            # User not found or not in chat
+            return False
+    return await member_cache.get_or_load((chat_id, username.lower()), lookup)
+
 def is_admin(chat_member):
     return chat_member.status in [enums.ChatMemberStatus.ADMINISTRATOR, enums.ChatMemberStatus.OWNER]
 
+async def is_sender_admin(client, message):
+    # Anonymous admins post as the group itself
+    if not message.from_user:
+        return bool(message.sender_chat and message.sender_chat.id == message.chat.id)
+    return await admin_cache.is_admin(client, message.chat.id, message.from_user.id)
+
+@app.on_chat_member_updated(filters.group)
+async def chat_member_updated(client, update):
+    # Keep the cached admin roster in sync with promotions/demotions
+    member = update.new_chat_member or update.old_chat_member
+    if not member or not member.user:
+        return
+    new = update.new_chat_member
+    if member.user.is_self and (not new or new.status in [enums.ChatMemberStatus.LEFT, enums.ChatMemberStatus.BANNED]):
+        # Bot left the group, drop its roster
+        admin_cache.invalidate(update.chat.id)
+        return
+    promoted = bool(new and is_admin(new))
+    admin_cache.update_member(update.chat.id, member.user.id, promoted)
+
 @app.on_message(filters.command("ping"))
 async def ping_command(client, message):
-    await message.reply("Pong! 🏓\nI am alive.")
+    await reply(message, "Pong! 🏓\nI am alive.")
 
 @app.on_message(filters.command("start") & filters.private)
 async def start_command(client, message):
@@ -91,7 +268,7 @@ async def start_command(client, message):
         [types.InlineKeyboardButton("👨‍💻 Developer", url="https://t.me/justinixx")],
         [types.InlineKeyboardButton("📦 Source Code", url="https://github.com/PerspicaciousGuy/telegram-link-bot")]
     ])
-    await message.reply(text, reply_markup=buttons, disable_web_page_preview=True)
+    await reply(message, text, reply_markup=buttons, disable_web_page_preview=True)
 
 
 
@@ -99,21 +276,13 @@ async def start_command(client, message):
 
 @app.on_message(filters.command("whitelist") & filters.group)
 async def whitelist_command(client, message):
-    # Check Admin (Handle Anonymous Admin)
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
-    else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
-
-    if not is_sender_admin:
-        await message.delete()
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
         return
 
     if len(message.command) < 2:
-        await message.reply("Usage: `/whitelist <domain>` or reply to a user to whitelist them.")
+        await reply(message, "Usage: `/whitelist <domain>` or reply to a user to whitelist them.")
         return
 
     target = message.command[1]
@@ -122,117 +291,100 @@ async def whitelist_command(client, message):
     if message.reply_to_message:
         target_user = message.reply_to_message.from_user
         try:
-            await db.add_whitelist_user(target_user.id)
-            msg = await message.reply(f"✅ **User Whitelisted!**\n{target_user.mention} has been added to the database.\nThey can now send links without being restricted.")
-            asyncio.create_task(scheduled_delete(msg, delay=120))
-            await log_action(client, "User Whitelisted", f"**Admin:** {message.from_user.mention}\n**User:** {target_user.mention} (`{target_user.id}`)", message)
+            await db.add_whitelist_user(message.chat.id, target_user.id)
+            send_notice(message, f"✅ **User Whitelisted!**\n{target_user.mention} has been added to the database.\nThey can now send links without being restricted.", delay=120)
+            log_action("User Whitelisted", f"**Admin:** {message.from_user.mention}\n**User:** {target_user.mention} (`{target_user.id}`)")
         except Exception as e:
-            await message.reply(f"❌ **Database Error:** {e}")
-        await message.delete()
+            await reply(message, f"❌ **Database Error:** {e}")
+        await delete_message(message)
         return
 
-    # Else whitelist domain
+    # Else whitelist domain, as it will be stored
+    domain = listfile.normalize("domain", target)
+    if domain is None:
+        await reply(message, f"❌ `{target}` is not a domain. Usage: `/whitelist example.com`")
+        return
+    target = domain
     try:
-        await db.add_whitelist_domain(target)
-        msg = await message.reply(f"✅ **Domain Whitelisted!**\nThe domain `{target}` has been added to the database.\nLinks containing this domain will now be ignored by the bot.")
-        asyncio.create_task(scheduled_delete(msg, delay=120))
-        await log_action(client, "Domain Whitelisted", f"**Admin:** {message.from_user.mention}\n**Domain:** `{target}`", message)
+        await db.add_whitelist_domain(message.chat.id, target)
+        send_notice(message, f"✅ **Domain Whitelisted!**\nThe domain `{target}` has been added to the database.\nLinks containing this domain will now be ignored by the bot.", delay=120)
+        log_action("Domain Whitelisted", f"**Admin:** {message.from_user.mention}\n**Domain:** `{target}`")
     except Exception as e:
-        await message.reply(f"❌ **Database Error:** {e}")
-    await message.delete()
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
 
 @app.on_message(filters.command("unlist") & filters.group)
 async def unlist_command(client, message):
-    # Check Admin (Handle Anonymous Admin)
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
-    else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
-
-    if not is_sender_admin:
-        await message.delete()
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
         return
 
     if len(message.command) < 2:
-        await message.reply("Usage: `/unlist <domain>` to remove a domain from whitelist.")
+        await reply(message, "Usage: `/unlist <domain>` to remove a domain from whitelist.")
         return
 
-    target = message.command[1]
-
-    # Unlist domain
+    # Unlist domain (shown as stored; older entries may be stored as typed)
+    target = listfile.normalize("domain", message.command[1]) or message.command[1].lower()
     try:
-        await db.remove_whitelist_domain(target)
-        msg = await message.reply(f"✅ **Domain Unlisted!**\nThe domain `{target}` has been removed from the whitelist.\nLinks containing this domain will now be deleted.")
-        asyncio.create_task(scheduled_delete(msg, delay=120))
-        await log_action(client, "Domain Unlisted", f"**Admin:** {message.from_user.mention}\n**Domain:** `{target}`", message)
+        if not await db.remove_whitelist_domain(message.chat.id, message.command[1]):
+            send_notice(message, not_listed_text("domain", target, f"`{target}`", "whitelist"), delay=60)
+            await delete_message(message)
+            return
+        send_notice(message, f"✅ **Domain Unlisted!**\nThe domain `{target}` has been removed from the whitelist.\nLinks containing this domain will now be deleted.", delay=120)
+        log_action("Domain Unlisted", f"**Admin:** {message.from_user.mention}\n**Domain:** `{target}`")
     except Exception as e:
-        await message.reply(f"❌ **Database Error:** {e}")
-    await message.delete()
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
 
 @app.on_message(filters.command("unlistuser") & filters.group)
 async def unlistuser_command(client, message):
     # Check Admin
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
-    else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
-
-    if not is_sender_admin:
-        await message.delete()
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
         return
 
     if not message.reply_to_message:
-        await message.reply("Usage: Reply to a user with `/unlistuser` to remove them from whitelist.")
+        await reply(message, "Usage: Reply to a user with `/unlistuser` to remove them from whitelist.")
         return
 
     target_user = message.reply_to_message.from_user
     try:
-        await db.remove_whitelist_user(target_user.id)
-        msg = await message.reply(f"✅ **User Unlisted!**\n{target_user.mention} has been removed from the whitelist.\nTheir links will now be deleted.")
-        asyncio.create_task(scheduled_delete(msg, delay=120))
-        await log_action(client, "User Unlisted", f"**Admin:** {message.from_user.mention}\n**User:** {target_user.mention} (`{target_user.id}`)", message)
+        if not await db.remove_whitelist_user(message.chat.id, target_user.id):
+            send_notice(message, not_listed_text("user", target_user.id, target_user.mention, "whitelist"), delay=60)
+            await delete_message(message)
+            return
+        send_notice(message, f"✅ **User Unlisted!**\n{target_user.mention} has been removed from the whitelist.\nTheir links will now be deleted.", delay=120)
+        log_action("User Unlisted", f"**Admin:** {message.from_user.mention}\n**User:** {target_user.mention} (`{target_user.id}`)")
     except Exception as e:
-        await message.reply(f"❌ **Database Error:** {e}")
-    await message.delete()
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
 
 @app.on_message(filters.command("unwarn") & filters.group)
 async def unwarn_command(client, message):
-    # Check Admin (Handle Anonymous Admin)
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
-    else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
-
-    if not is_sender_admin:
-        await message.delete()
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
         return
 
     if not message.reply_to_message:
-        await message.reply("Reply to a user to reset their warnings.")
+        await reply(message, "Reply to a user to reset their warnings.")
         return
     
     target_user = message.reply_to_message.from_user
     
     # Reset warnings
     try:
-        await db.reset_warnings(target_user.id)
-        await log_action(client, "Warnings Reset", f"**Admin:** {message.from_user.mention}\n**User:** {target_user.mention} (`{target_user.id}`)", message)
+        await db.reset_warnings(message.chat.id, target_user.id)
+        log_action("Warnings Reset", f"**Admin:** {message.from_user.mention}\n**User:** {target_user.mention} (`{target_user.id}`)")
     except Exception as e:
-        await message.reply(f"❌ **Database Error (Reset Warnings):** {e}")
+        await reply(message, f"❌ **Database Error (Reset Warnings):** {e}")
         return
     
     # Also Unmute to ensure they can chat
     try:
-        await client.restrict_chat_member(
+        await restrict_member(
+            client,
             message.chat.id,
             target_user.id,
             types.ChatPermissions(
@@ -249,354 +401,555 @@ async def unwarn_command(client, message):
     except Exception:
         pass # If fails (e.g. user not muted), just ignore
 
-    msg = await message.reply(f"✅ **Warnings Reset!**\nWarnings for {target_user.mention} have been cleared.\nThey have been unmuted and can now send messages again.")
-    asyncio.create_task(scheduled_delete(msg, delay=120))
-    await message.delete()
+    send_notice(message, f"✅ **Warnings Reset!**\nWarnings for {target_user.mention} have been cleared.\nThey have been unmuted and can now send messages again.", delay=120)
+    await delete_message(message)
 
 @app.on_message(filters.command("blacklist") & filters.group)
 async def blacklist_command(client, message):
     # Check Admin
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
-    else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
-
-    if not is_sender_admin:
-        await message.delete()
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
         return
 
     if len(message.command) < 2:
-        await message.reply("Usage: `/blacklist <word>` to ban a word.")
+        await reply(message, "Usage: `/blacklist <word>` to ban a word.")
         return
 
     word = message.command[1].lower()
     try:
-        await db.add_blacklist_word(word)
-        msg = await message.reply(f"🚫 **Word Blacklisted!**\nThe word `{word}` has been banned.\nMessages containing this word will be auto-deleted.")
-        asyncio.create_task(scheduled_delete(msg, delay=120))
-        await log_action(client, "Word Blacklisted", f"**Admin:** {message.from_user.mention}\n**Word:** `{word}`", message)
+        await db.add_blacklist_word(message.chat.id, word)
+        send_notice(message, f"🚫 **Word Blacklisted!**\nThe word `{word}` has been banned.\nMessages containing this word will be auto-deleted.", delay=120)
+        log_action("Word Blacklisted", f"**Admin:** {message.from_user.mention}\n**Word:** `{word}`")
     except Exception as e:
-        await message.reply(f"❌ **Database Error:** {e}")
-    await message.delete()
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
 
-@app.on_message(filters.command("unblacklist") & filters.group)
-async def unblacklist_command(client, message):
+@app.on_message(filters.command("flood") & filters.group)
+async def flood_command(client, message):
     # Check Admin
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
+        return
+
+    args = message.command[1:]
+    if not args:
+        policy = await db.get_policy(message.chat.id)
+        limit = policy.settings.get("flood_limit", FLOOD_LIMIT)
+        window = policy.settings.get("flood_window", FLOOD_WINDOW)
+        status = f"{limit} messages in {window:g} seconds" if limit > 0 else "off"
+        await reply(message, f"🌊 **Flood limit:** {status}\n\nUsage: `/flood <messages> <seconds>` or `/flood off`")
+        return
+
+    if args[0].lower() == "off":
+        limit, window = 0, FLOOD_WINDOW
     else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
+        try:
+            limit = int(args[0])
+            window = float(args[1]) if len(args) > 1 else FLOOD_WINDOW
+        except ValueError:
+            await reply(message, "Usage: `/flood <messages> <seconds>` or `/flood off`")
+            return
+        if not (2 <= limit <= MAX_FLOOD_LIMIT and 1 <= window <= MAX_FLOOD_WINDOW):
+            await reply(message, f"❌ Use 2-{MAX_FLOOD_LIMIT} messages in 1-{MAX_FLOOD_WINDOW} seconds.")
+            return
 
-    if not is_sender_admin:
-        await message.delete()
+    try:
+        await db.set_chat_settings(message.chat.id, flood_limit=limit, flood_window=window)
+        status = f"{limit} messages in {window:g} seconds" if limit > 0 else "off"
+        send_notice(message, f"🌊 **Flood Limit Updated!**\nUsers sending {status} will be warned." if limit > 0 else "🌊 **Flood protection turned off.**", delay=120)
+        log_action("Flood Limit Changed", f"**Admin:** {sender_mention(message)}\n**Limit:** {status}")
+    except Exception as e:
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
+
+@app.on_message(filters.command("unblacklist") & filters.group)
+async def unblacklist_command(client, message):
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
         return
 
     if len(message.command) < 2:
-        await message.reply("Usage: `/unblacklist <word>` to unban a word.")
+        await reply(message, "Usage: `/unblacklist <word>` to unban a word.")
         return
 
     word = message.command[1].lower()
     try:
-        await db.remove_blacklist_word(word)
-        msg = await message.reply(f"✅ **Word Unblacklisted!**\nThe word `{word}` has been unbanned.")
-        asyncio.create_task(scheduled_delete(msg, delay=120))
-        await log_action(client, "Word Unblacklisted", f"**Admin:** {message.from_user.mention}\n**Word:** `{word}`", message)
+        if not await db.remove_blacklist_word(message.chat.id, word):
+            send_notice(message, not_listed_text("word", word, f"`{word}`", "blacklist"), delay=60)
+            await delete_message(message)
+            return
+        send_notice(message, f"✅ **Word Unblacklisted!**\nThe word `{word}` has been unbanned.", delay=120)
+        log_action("Word Unblacklisted", f"**Admin:** {message.from_user.mention}\n**Word:** `{word}`")
     except Exception as e:
-        await message.reply(f"❌ **Database Error:** {e}")
-    await message.delete()
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
+
+LIST_KINDS = {
+    "word": ("🚫", "Blacklisted Words"),
+    "domain": ("✅", "Whitelisted Domains"),
+    "user": ("👤", "Whitelisted Users"),
+}
+
+def not_listed_text(kind, value, shown, list_name):
+    if db.is_global_entry(kind, value):
+        return f"ℹ️ {shown} is on the global {list_name}, which applies to every group. Only the bot's operators can change it (`/global`)."
+    return f"ℹ️ {shown} is not on this group's {list_name}."
+
+async def build_list_menu(chat_id):
+    text = "📋 **Bot Configuration**\n\n"
+    buttons = []
+    for kind, (icon, title) in LIST_KINDS.items():
+        own = await db.count_policy_entries(chat_id, kind)
+        text += f"{icon} **{title}:** {own}"
+        shared = db.count_global_entries(kind)
+        if shared:
+            text += f" (+{shared} global)"
+        text += "\n"
+        if own and kind != "user":  # User IDs stay hidden for privacy
+            buttons.append(types.InlineKeyboardButton(f"{icon} {title.split()[-1]}", callback_data=f"list_{kind}_"))
+    return text, types.InlineKeyboardMarkup([buttons]) if buttons else None
+
+async def build_list_page(chat_id, kind, after=None):
+    # One page of the chat's own entries; `after` is the last _id of the previous page
+    icon, title = LIST_KINDS[kind]
+    values, next_after = await db.list_policy_entries(chat_id, kind, after=after, limit=LIST_PAGE_SIZE)
+    text = f"{icon} **{title}:**\n"
+    text += ", ".join(f"`{v}`" for v in values) if values else "_None_"
+    buttons = [types.InlineKeyboardButton("⬅️ Menu", callback_data="list_menu_")]
+    if next_after is not None:
+        buttons.append(types.InlineKeyboardButton("Next ➡️", callback_data=f"list_{kind}_{next_after}"))
+    return text, types.InlineKeyboardMarkup([buttons])
 
 @app.on_message(filters.command("list") & filters.group)
 async def list_command(client, message):
     # Check Admin
-    is_sender_admin = False
-    if not message.from_user:
-        if message.sender_chat and message.sender_chat.id == message.chat.id:
-            is_sender_admin = True
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
+        return
+
+    try:
+        text, markup = await build_list_menu(message.chat.id)
+        send_notice(message, text, delay=120, reply_markup=markup)
+    except Exception as e:
+        await reply(message, f"❌ **Database Error:** {e}")
+    await delete_message(message)
+
+@app.on_callback_query(filters.regex(r"^list_"))
+async def list_callback(client, callback_query):
+    # Check Admin
+    if not await admin_cache.is_admin(client, callback_query.message.chat.id, callback_query.from_user.id):
+        await callback_query.answer("❌ Only admins can browse the lists!", show_alert=True)
+        return
+
+    _, kind, cursor = callback_query.data.split("_", 2)
+    chat_id = callback_query.message.chat.id
+    try:
+        if kind == "menu":
+            text, markup = await build_list_menu(chat_id)
+        else:
+            after = ObjectId(cursor) if cursor else None
+            text, markup = await build_list_page(chat_id, kind, after)
+        await edit_text(callback_query.message, text, reply_markup=markup)
+        await callback_query.answer()
+    except Exception as e:
+        await callback_query.answer(f"Failed to load the list: {e}", show_alert=True)
+
+@app.on_message(filters.command("import") & filters.group)
+async def import_command(client, message):
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
+        return
+
+    # The file is attached to the command or the command replies to it
+    source = message if message.document else message.reply_to_message
+    document = source.document if source else None
+    kind = listfile.KINDS.get(message.command[1].lower()) if len(message.command) > 1 else None
+    fmt = listfile.file_format(document.file_name or "") if document else None
+    if not fmt:
+        await reply(message, "Usage: send a `.csv`, `.json` or `.txt` file with `/import` as the caption, or reply to one with `/import`.\nAdd `blacklist`, `whitelist` or `users` to import only that list (required for `.txt`).")
+        return
+    if document.file_size and document.file_size > listfile.MAX_IMPORT_SIZE:
+        await reply(message, f"❌ The file is too large (max {listfile.MAX_IMPORT_SIZE // 1024} KB).")
+        return
+
+    try:
+        data = await api.call(PRIORITY_NOTICE, message.chat.id, client.download_media, source, in_memory=True)
+        result = listfile.parse(bytes(data.getbuffer()), fmt, kind)
+    except ValueError as e:
+        await reply(message, f"❌ **Import failed:** {e}")
+        return
+    except Exception as e:
+        await reply(message, f"❌ **Import failed:** Could not download the file ({e})")
+        return
+
+    try:
+        added = await db.add_policy_entries(message.chat.id, result.entries)
+    except Exception as e:
+        await reply(message, f"❌ **Database Error:** {e}")
+        return
+
+    counts = {}
+    for entry_kind, _ in result.entries:
+        counts[entry_kind] = counts.get(entry_kind, 0) + 1
+    text = f"📥 **Import Finished!**\n**Added:** {added}\n**Already listed:** {len(result.entries) - added}"
+    text += "".join(f"\n{LIST_KINDS[k][0]} {LIST_KINDS[k][1]}: {n} in file" for k, n in counts.items())
+    if result.duplicates:
+        text += f"\n**Duplicates skipped:** {result.duplicates}"
+    if result.invalid:
+        shown = ", ".join(f"`{v}`" for v in result.invalid[:5])
+        text += f"\n**Invalid, skipped:** {len(result.invalid)} ({shown}{', ...' if len(result.invalid) > 5 else ''})"
+    send_notice(message, text, delay=120)
+    log_action("Lists Imported", f"**Admin:** {sender_mention(message)}\n**File:** `{document.file_name}`\n**Added:** {added} of {len(result.entries)}")
+    await delete_message(message)
+
+@app.on_message(filters.command("export") & filters.group)
+async def export_command(client, message):
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
+        return
+
+    args = [a.lower() for a in message.command[1:]]
+    fmt = next((a for a in args if a in listfile.FORMATS), "csv")
+    kind = next((listfile.KINDS[a] for a in args if a in listfile.KINDS), None)
+    try:
+        lists = await db.get_policy_entries(message.chat.id)
+        content = listfile.export(lists, fmt, kind)
+    except ValueError as e:
+        await reply(message, f"❌ {e}")
+        return
+    except Exception as e:
+        await reply(message, f"❌ **Database Error:** {e}")
+        return
+
+    document = io.BytesIO(content)
+    document.name = f"{kind or 'lists'}.{fmt}"
+    total = sum(len(values) for k, values in lists.items() if not kind or k == kind)
+    try:
+        await api.call(PRIORITY_NOTICE, message.chat.id, client.send_document, message.chat.id, document, caption=f"📤 {total} entries exported")
+    except Exception as e:
+        print(f"Failed to send export: {e}")
+    log_action("Lists Exported", f"**Admin:** {sender_mention(message)}\n**Entries:** {total}")
+    await delete_message(message)
+
+VIOLATION_NAMES = {
+    "link": "Links",
+    "blacklisted_word": "Banned words",
+    "external_mention": "External mentions",
+    "too_many_mentions": "Too many mentions",
+    "flood": "Flooding",
+}
+
+@app.on_message(filters.command("stats") & filters.group)
+async def stats_command(client, message):
+    # Check Admin
+    if not await is_sender_admin(client, message):
+        await delete_message(message)
+        return
+
+    days = 1
+    if len(message.command) > 1 and message.command[1].isdigit():
+        days = max(1, min(int(message.command[1]), MAX_STATS_DAYS))
+    # Last 24 hourly counters for one day, else one counter per calendar day
+    now = datetime.now(timezone.utc)
+    if days == 1:
+        period, since, label = "hour", period_start(now - timedelta(hours=23), "hour"), "the last 24 hours"
     else:
-        member = await client.get_chat_member(message.chat.id, message.from_user.id)
-        is_sender_admin = is_admin(member)
+        period, since, label = "day", period_start(now - timedelta(days=days - 1), "day"), f"the last {days} days"
+    try:
+        totals = merge_rollups(await db.get_rollups(message.chat.id, period, since))
+    except Exception as e:
+        await reply(message, f"❌ **Database Error:** {e}")
+        return
 
-    if not is_sender_admin:
-        await message.delete()
+    text = f"📊 **Moderation Stats ({label})**\n\n"
+    if not totals["actions"]:
+        text += "Nothing to report, the group has been clean."
+    else:
+        text += "**Actions:** " + ", ".join(f"{a} {totals['actions'][a]}" for a in ACTIONS if totals["actions"][a]) + "\n\n"
+        text += "**Violations:**\n" + "".join(f"• {VIOLATION_NAMES.get(r, r)}: {n}\n" for r, n in totals["violations"].most_common())
+        if totals["users"]:
+            text += "\n**Top offenders:**\n" + "".join(f"• [{u}](tg://user?id={u}): {n}\n" for u, n in totals["users"].most_common(5))
+        if totals["domains"]:
+            text += "\n**Top link domains:**\n" + "".join(f"• `{d}`: {n}\n" for d, n in totals["domains"].most_common(5))
+    send_notice(message, text, delay=300)
+    await delete_message(message)
+
+@app.on_message(filters.command("profile") & (filters.group | filters.private))
+async def profile_command(client, message):
+    # Only the operators in PROFILE_ADMIN_IDS, group admins don't qualify
+    if not message.from_user or message.from_user.id not in PROFILE_ADMIN_IDS:
+        if message.chat.type != enums.ChatType.PRIVATE:
+            await delete_message(message)
         return
 
+    seconds = 10
+    if len(message.command) > 1 and message.command[1].isdigit():
+        seconds = min(int(message.command[1]), MAX_PROFILE_SECONDS)
+    if message.chat.type != enums.ChatType.PRIVATE:
+        await delete_message(message)
+
+    status = await reply(message, f"⏱ Profiling the bot for {seconds}s...")
     try:
-        blacklist = await db.get_blacklist()
-        whitelist_domains = await db.get_whitelist_domains()
-        whitelist_users = await db.get_whitelist_users()
+        report = await tracing.profile(seconds)
+    except RuntimeError as e:
+        await edit_text(status, f"❌ {e}")
+        schedule_delete(status, delay=30)
+        return
 
-        text = "📋 **Bot Configuration**\n\n"
-        
-        text += "🚫 **Blacklisted Words:**\n"
-        if blacklist:
-            text += ", ".join([f"`{w}`" for w in blacklist])
-        else:
-            text += "_None_"
-        text += "\n\n"
+    document = io.BytesIO(report.encode())
+    document.name = "profile.txt"
+    try:
+        await api.call(PRIORITY_NOTICE, message.chat.id, client.send_document, message.chat.id, document, caption=f"📊 Profile of the last {seconds}s")
+    except Exception as e:
+        print(f"Failed to send profile: {e}")
+    await delete_message(status)
+
+@app.on_message(filters.command("workers") & filters.private)
+async def workers_command(client, message):
+    # Operators only (PROFILE_ADMIN_IDS): changes how many processes run the
+    # message checks without a restart, e.g. when one core is saturated
+    if not message.from_user or message.from_user.id not in PROFILE_ADMIN_IDS:
+        return
 
-        text += "✅ **Whitelisted Domains:**\n"
-        if whitelist_domains:
-            text += ", ".join([f"`{d}`" for d in whitelist_domains])
-        else:
-            text += "_None_"
-        text += "\n\n"
+    if len(message.command) < 2:
+        await reply(message, f"⚙️ **Worker processes:** {len(workers)}\n\nUsage: `/workers <0-{MAX_WORKERS}>` (0 or 1 runs the checks in the bot process)")
+        return
+    arg = message.command[1]
+    if not arg.isdigit() or int(arg) > MAX_WORKERS:
+        await reply(message, f"❌ Use a number from 0 to {MAX_WORKERS}.")
+        return
 
-        text += "👤 **Whitelisted Users:**\n"
-        if whitelist_users:
-            text += f"{len(whitelist_users)} users (IDs hidden for privacy)"
-        else:
-            text += "_None_"
+    count = int(arg) if int(arg) > 1 else 0
+    status = await reply(message, f"⏳ Switching to {count} worker processes...")
+    await workers.resize(count)
+    await edit_text(status, f"✅ **Worker processes:** {len(workers)}")
 
-        msg = await message.reply(text)
-        asyncio.create_task(scheduled_delete(msg, delay=60)) # Delete after 60s
-        
+GLOBAL_LISTS = {"word": "blacklist", "domain": "whitelist", "user": "user whitelist"}
+
+@app.on_message(filters.command("global") & filters.private)
+async def global_command(client, message):
+    # Operators only (PROFILE_ADMIN_IDS): the global lists apply in every
+    # group, so group admins can't change them
+    if not message.from_user or message.from_user.id not in PROFILE_ADMIN_IDS:
+        return
+
+    args = message.command[1:]
+    if len(args) < 3 or args[0] not in ("add", "remove") or args[1] not in GLOBAL_LISTS:
+        counts = ", ".join(f"{db.count_global_entries(kind)} in the {name}" for kind, name in GLOBAL_LISTS.items())
+        await reply(message, f"🌐 **Global lists:** {counts}\n\nUsage: `/global add|remove word|domain|user <value>`")
+        return
+    action, kind, raw = args[0], args[1], args[2]
+    name = GLOBAL_LISTS[kind]
+
+    try:
+        if action == "add":
+            value = listfile.normalize(kind, raw)
+            if value is None:
+                await reply(message, f"❌ `{raw}` is not a valid {kind}.")
+                return
+            changed = await db.add_policy_entry(GLOBAL_SCOPE, kind, value)
+        else:
+            value = listfile.normalize(kind, raw) or raw.lower()
+            if kind == "domain":
+                changed = await db.remove_whitelist_domain(GLOBAL_SCOPE, raw)
+            else:
+                changed = await db.remove_policy_entry(GLOBAL_SCOPE, kind, value)
     except Exception as e:
-        await message.reply(f"❌ **Database Error:** {e}")
-    await message.delete()
+        await reply(message, f"❌ **Database Error:** {e}")
+        return
+
+    if not changed:
+        await reply(message, f"ℹ️ `{value}` {'is already' if action == 'add' else 'is not'} on the global {name}.")
+        return
+    done = "added to" if action == "add" else "removed from"
+    await reply(message, f"✅ `{value}` {done} the global {name}. It applies in every group.")
+    log_action("Global List Changed", f"**Operator:** {sender_mention(message)}\n**{name.capitalize()}:** `{value}` {done}")
 
 @app.on_message(filters.command(["tr", "translate"]) & filters.group)
 async def translate_command(client, message):
     if not message.reply_to_message:
-        await message.reply("Reply to a message to translate it.")
+        await reply(message, "Reply to a message to translate it.")
         return
 
     target_msg = message.reply_to_message
     text = target_msg.text or target_msg.caption or ""
     
     if not text:
-        await message.reply("❌ No text found to translate.")
+        await reply(message, "❌ No text found to translate.")
         return
 
     try:
-        # Translate to English
-        translated = GoogleTranslator(source='auto', target='en').translate(text)
-        
-        await message.reply(
+        # Translate to English (off the event loop, cached)
+        translated = await translator.translate(text, "en")
+        if translated is None:
+            await reply(message, "ℹ️ This message is already in English.")
+            return
+
+        await reply(
+            message,
             f"🌍 **Translation (to English):**\n\n`{translated}`",
             reply_to_message_id=target_msg.id
         )
         
+    except asyncio.TimeoutError:
+        await reply(message, "❌ **Translation Failed:** The translation service timed out.")
     except Exception as e:
-        await message.reply(f"❌ **Translation Failed:** {e}")
+        await reply(message, f"❌ **Translation Failed:** {e}")
 
 
 
 @app.on_message(filters.group & (filters.text | filters.caption))
+async def intake_handler(client, message):
+    # Returns at once so Pyrogram's update queue never backs up; the message
+    # waits in the bounded per-chat queue instead
+    admission.submit(message.chat.id, client, message)
+
 async def message_handler(client, message):
+    if not ready.is_set():
+        # Updates arriving during startup wait for the caches (see main)
+        await ready.wait()
+    metrics.MESSAGES.inc()
+    with metrics.HANDLER_LATENCY.time(handler="message"), tracing.trace("message_handler", chat_id=message.chat.id) as root:
+        verdict = await moderate_message(client, message)
+        if root:
+            root.attributes["verdict"] = verdict
+    metrics.VERDICTS.inc(verdict=verdict)
+
+async def moderate_message(client, message):
+    # Returns the verdict for /metrics
     chat_id = message.chat.id
     user_id = message.from_user.id if message.from_user else 0
-    
-    # 1. Check if user is Admin/Owner (Immune)
-    try:
-        member = await client.get_chat_member(chat_id, user_id)
-        if is_admin(member):
-            return
-    except Exception:
-        pass # Failed to get member, proceed with caution or return
+    # Messages posted as a channel are rate-limited per channel
+    sender_id = user_id or (message.sender_chat.id if message.sender_chat else 0)
 
-    # 2. Check Whitelist (User)
-    if await db.is_user_whitelisted(user_id):
-        return
+    # 1. Content checks first, CPU only: the chat's lists are cached in
+    # memory and most messages need nothing else
+    with tracing.span("policy"):
+        policy = await db.get_policy(chat_id)
+    flood_limit = policy.settings.get("flood_limit", FLOOD_LIMIT)
+    flood_window = policy.settings.get("flood_window", FLOOD_WINDOW)
+    flooded = bool(sender_id) and flood_tracker.record(chat_id, sender_id, flood_limit, flood_window)
 
     text = message.text or message.caption or ""
-    
-    # 3. Check Blacklist (Words)
-    blacklist = await db.get_blacklist()
-    for word in blacklist:
-        if word in text.lower():
+
+    # Blacklist (words), links & mentions (in a worker process when WORKERS > 1)
+    payload = message_payload(message)
+    key = (chat_id, policy.revision, fingerprint(payload))
+    with tracing.span("detection"):
+        found = await verdict_cache.get_or_load(key, lambda: workers.evaluate(payload, policy))
+    matched_word = found["matched_word"]
+    has_link = found["has_link"]
+    mentions = found["mentions"]
+    # Mentions of whitelist keywords are fine, the rest are looked up below
+    candidates = [u for u in mentions if u.lower() not in MENTION_WHITELIST]
+
+    if not (flooded or matched_word or len(mentions) > 5 or candidates or (has_link and not found["link_whitelisted"])):
+        metrics.FAST_PATH.inc()
+        return "whitelisted_link" if has_link else "clean"
+
+    # 2. The message would be actioned: only now check who sent it
+    if user_id in policy.users:
+        return "whitelisted_user"
+    # A failed roster fetch falls back to the last known roster (see admins.py)
+    with tracing.span("admin_check"):
+        if await is_sender_admin(client, message):
+            return "admin"
+
+    # 3. Flood (message rate per user, counted in memory only)
+    if flooded:
+        with tracing.span("action", reason="flood"):
             try:
-                await message.delete()
+                await delete_message(message)
+                event_writer.record(chat_id, "delete", sender_id, "flood")
+                if log_channel_id != 0 and not admission.degraded:
+                    log_text = f"**User:** {sender_mention(message)} (`{sender_id}`)\n**Chat:** {message.chat.title}\n**Rate:** {flood_limit} messages in {flood_window:g}s"
+                    log_action("Flood Detected", log_text)
                 # Warn User
-                msg = await message.reply(f"⚠️ {message.from_user.mention}, that word is not allowed! (Warning checking...)")
-                warnings = await db.add_warning(user_id, msg.id)
-                limit = 3
-                
-                if warnings >= limit:
-                    # Punish
-                    try:
-                        await delete_previous_warnings(client, chat_id, user_id, exclude_id=msg.id)
-                        until_date = datetime.now() + timedelta(hours=24)
-                        await client.restrict_chat_member(
-                            chat_id, 
-                            user_id, 
-                            types.ChatPermissions(can_send_messages=False),
-                            until_date=until_date
-                        )
-                        button = types.InlineKeyboardMarkup([
-                            [types.InlineKeyboardButton("🔓 Unmute (Admin Only)", callback_data=f"unmute_{user_id}")]
-                        ])
-                        await msg.edit_text(f"🚫 {message.from_user.mention} has been muted for 24h due to using banned words.", reply_markup=button)
-                        await db.reset_warnings(user_id)
-                        # Mute message stays forever
-                    except Exception as e:
-                        await msg.edit_text(f"⚠️ {message.from_user.mention}, stop using banned words! (Warning {warnings}/{limit})\nI tried to mute you but failed: {e}")
-                        asyncio.create_task(scheduled_delete(msg, delay=120))
-                else:
-                    await msg.edit_text(f"⚠️ {message.from_user.mention}, that word is not allowed! (Warning {warnings}/{limit})")
-                    asyncio.create_task(scheduled_delete(msg, delay=120))
-                return # Stop processing if blacklisted word found
+                if await warn_user(client, message, "flood", "you are sending messages too fast", "flooding", "stop flooding"):
+                    flood_tracker.reset(chat_id, sender_id)
+                return "flood"
             except Exception as e:
-                print(f"Failed to delete blacklisted message: {e}")
-
-    # 4. Detect Links & Mentions
-    entities = message.entities or message.caption_entities or []
-    has_link = False
-    mentions = []
+                print(f"Failed to handle flood: {e}")
 
-    # Check regex
-    if url_pattern.search(text):
-        has_link = True
-    
-    # Check entities
-    for entity in entities:
-        if entity.type in [enums.MessageEntityType.URL, enums.MessageEntityType.TEXT_LINK]:
-            has_link = True
-        elif entity.type == enums.MessageEntityType.MENTION:
-            # Extract username (remove @)
-            username = text[entity.offset:entity.offset+entity.length].strip("@")
-            mentions.append(username)
+    # 4. Blacklisted word
+    if matched_word:
+        with tracing.span("action", reason="blacklisted_word"):
+            try:
+                await delete_message(message)
+                event_writer.record(chat_id, "delete", user_id, "blacklisted_word")
+                if log_channel_id != 0 and not admission.degraded:
+                    log_text = f"**User:** {sender_mention(message)} (`{user_id}`)\n**Chat:** {message.chat.title}\n**Word:** `{matched_word}`\n**Content:** {text[:1000]}"
+                    log_action("Blacklisted Word Deleted", log_text)
+                # Warn User
+                await warn_user(client, message, "blacklisted_word", "that word is not allowed", "using banned words", "stop using banned words")
+                return "blacklisted_word" # Stop processing if blacklisted word found
+            except Exception as e:
+                print(f"Failed to delete blacklisted message: {e}")
 
     # --- Max Mentions Limit ---
     if len(mentions) > 5:
-        try:
-            await message.delete()
-            msg = await message.reply(f"🚫 {message.from_user.mention}, too many mentions! (Max 5)")
-            asyncio.create_task(scheduled_delete(msg, delay=60))
-            return
-        except Exception:
-            pass
-
-    # --- Smart Mention Filter ---
-    for username in mentions:
-        # Ignore whitelist keywords
-        if username.lower() in ["everyone", "all", "admin", "admins"]:
-            continue
-            
-        # Check Cache
-        cache_key = (chat_id, username)
-        is_member = False
-        
-        if cache_key in member_cache:
-            cached_status, timestamp = member_cache[cache_key]
-            if time.time() - timestamp < CACHE_DURATION:
-                is_member = cached_status
-            else:
-                # Expired
-                del member_cache[cache_key]
-        
-        # If not in cache, check API
-        if cache_key not in member_cache:
+        with tracing.span("action", reason="too_many_mentions"):
             try:
-                # Try to get member
-                await client.get_chat_member(chat_id, username)
-                is_member = True
+                await delete_message(message)
+                event_writer.record(chat_id, "delete", user_id, "too_many_mentions")
+                if not admission.degraded:
+                    send_notice(message, f"🚫 {sender_mention(message)}, too many mentions! (Max 5)", delay=60)
+                return "too_many_mentions"
             except Exception:
-                # User not found or not in chat
-                is_member = False
-            
-            # Update Cache
-            member_cache[cache_key] = (is_member, time.time())
-
-        # If NOT a member -> SPAM
-        if not is_member:
-            try:
-                await message.delete()
-                msg = await message.reply(f"🚫 {message.from_user.mention}, mentioning external channels/users is not allowed!")
-                asyncio.create_task(scheduled_delete(msg, delay=60))
-                
-                # Warn User
-                msg = await message.reply(f"🚫 {message.from_user.mention}, mentioning external channels/users is not allowed!")
-                warnings = await db.add_warning(user_id, msg.id)
-                limit = 3
-                if warnings >= limit:
-                     # Punish (Mute)
-                    try:
-                        await delete_previous_warnings(client, chat_id, user_id, exclude_id=msg.id)
-                        until_date = datetime.now() + timedelta(hours=24)
-                        await client.restrict_chat_member(
-                            chat_id, 
-                            user_id, 
-                            types.ChatPermissions(can_send_messages=False),
-                            until_date=until_date
-                        )
-                        button = types.InlineKeyboardMarkup([
-                            [types.InlineKeyboardButton("🔓 Unmute (Admin Only)", callback_data=f"unmute_{user_id}")]
-                        ])
-                        await msg.edit_text(f"🚫 {message.from_user.mention} has been muted for 24h due to spam.", reply_markup=button)
-                        await db.reset_warnings(user_id)
-                        # Mute message stays forever
-                    except Exception:
-                        pass
-                else:
-                     asyncio.create_task(scheduled_delete(msg, delay=120))
-                return # Stop processing
-            except Exception as e:
-                print(f"Failed to handle mention spam: {e}")
-            return
+                pass
+
+    # --- Smart Mention Filter ---
+    # Resolve the mentioned usernames concurrently
+    if candidates:
+        with tracing.span("mention_lookup", count=len(candidates)):
+            results = await asyncio.gather(*(is_chat_member(client, chat_id, u) for u in candidates))
+        is_member = all(results)
+
+        with tracing.span("action", reason="external_mention"):
+            # If NOT a member -> SPAM
+            if not is_member:
+                try:
+                    await delete_message(message)
+                    event_writer.record(chat_id, "delete", user_id, "external_mention")
+                    # Warn User
+                    await warn_user(client, message, "external_mention", "mentioning external channels/users is not allowed", "spam", "stop mentioning external channels/users")
+                    return "external_mention" # Stop processing
+                except Exception as e:
+                    print(f"Failed to handle mention spam: {e}")
+                return "error"
 
     if not has_link:
-        return
+        return "clean"
 
     # 5. Check Whitelist (Domain)
-    if await db.is_domain_whitelisted(text):
-        return
+    if found["link_whitelisted"]:
+        return "whitelisted_link"
 
     # 6. Action: Delete & Warn (Links)
-    try:
-        await message.delete()
-    except Exception as e:
-        print(f"Failed to delete message: {e}")
-        return # If can't delete, maybe can't warn either
-
-    # Log to Channel
-    if log_channel_id != 0:
-        log_text = f"**User:** {message.from_user.mention} (`{user_id}`)\n**Chat:** {message.chat.title}\n**Content:** {text[:1000]}"
-        await log_action(client, "Link/Spam Deleted", log_text, message)
-
-    # Warn User
-    msg = await message.reply(f"⚠️ {message.from_user.mention}, links are not allowed! (Warning checking...)")
-    warnings = await db.add_warning(user_id, msg.id)
-    limit = 3
-    
-    if warnings >= limit:
-        # Punish
+    with tracing.span("action", reason="link"):
         try:
-            await delete_previous_warnings(client, chat_id, user_id, exclude_id=msg.id)
-            # Mute for 24 hours
-            until_date = datetime.now() + timedelta(hours=24)
-            await client.restrict_chat_member(
-                chat_id, 
-                user_id, 
-                types.ChatPermissions(can_send_messages=False),
-                until_date=until_date
-            )
-            
-            # Unmute Button
-            button = types.InlineKeyboardMarkup([
-                [types.InlineKeyboardButton("🔓 Unmute (Admin Only)", callback_data=f"unmute_{user_id}")]
-            ])
-            
-            await msg.edit_text(f"🚫 {message.from_user.mention} has been muted for 24h due to excessive links.", reply_markup=button)
-            await db.reset_warnings(user_id)
-            # Mute message stays forever
+            await delete_message(message)
         except Exception as e:
-            await msg.edit_text(f"⚠️ {message.from_user.mention}, stop sending links! (Warning {warnings}/{limit})\nI tried to mute you but failed: {e}")
-            asyncio.create_task(scheduled_delete(msg, delay=120))
-    else:
-        await msg.edit_text(f"⚠️ {message.from_user.mention}, links are not allowed! (Warning {warnings}/{limit})")
-        asyncio.create_task(scheduled_delete(msg, delay=120))
+            print(f"Failed to delete message: {e}")
+            return "error" # If can't delete, maybe can't warn either
+        event_writer.record(chat_id, "delete", user_id, "link", domains=found["hosts"])
+
+        # Log to Channel
+        if log_channel_id != 0 and not admission.degraded:
+            log_text = f"**User:** {sender_mention(message)} (`{user_id}`)\n**Chat:** {message.chat.title}\n**Content:** {text[:1000]}"
+            log_action("Link/Spam Deleted", log_text)
+
+        # Warn User
+        await warn_user(client, message, "link", "links are not allowed", "excessive links", "stop sending links")
+        return "link"
 
 @app.on_callback_query(filters.regex(r"^unmute_"))
 async def unmute_callback(client, callback_query):
     # Check Admin
-    member = await client.get_chat_member(callback_query.message.chat.id, callback_query.from_user.id)
-    if not is_admin(member):
+    if not await admin_cache.is_admin(client, callback_query.message.chat.id, callback_query.from_user.id):
         await callback_query.answer("❌ Only admins can unmute!", show_alert=True)
         return
 
@@ -605,7 +958,8 @@ async def unmute_callback(client, callback_query):
 
     try:
         # Unmute User (Give back default permissions)
-        await client.restrict_chat_member(
+        await restrict_member(
+            client,
             chat_id,
             target_user_id,
             types.ChatPermissions(
@@ -621,40 +975,87 @@ async def unmute_callback(client, callback_query):
         )
         
         # Reset Warnings
-        await db.reset_warnings(target_user_id)
+        await db.reset_warnings(chat_id, target_user_id)
+        event_writer.record(chat_id, "unmute", target_user_id)
         
         # Update Message
         admin_name = callback_query.from_user.mention
-        await callback_query.message.edit_text(f"✅ User unmuted by {admin_name}.\nWarnings have been reset.")
-        asyncio.create_task(scheduled_delete(callback_query.message, delay=120))
-        await log_action(client, "User Unmuted", f"**Admin:** {admin_name}\n**User ID:** `{target_user_id}`", callback_query.message)
+        await edit_text(callback_query.message, f"✅ User unmuted by {admin_name}.\nWarnings have been reset.")
+        schedule_delete(callback_query.message, delay=120)
+        log_action("User Unmuted", f"**Admin:** {admin_name}\n**User ID:** `{target_user_id}`")
         
     except Exception as e:
         await callback_query.answer(f"Failed to unmute: {e}", show_alert=True)
 
-# Dummy HTTP server to satisfy Koyeb Web Service health check
-class Handler(BaseHTTPRequestHandler):
-    def do_GET(self):
-        self.send_response(200)
-        self.end_headers()
-        self.wfile.write(b"Bot is running")
+# Health check / metrics endpoint (Koyeb Web Service)
+async def telegram_ready():
+    return app.is_connected
 
-    def do_HEAD(self):
-        self.send_response(200)
-        self.end_headers()
+async def mongo_ready():
+    return await db.ping()
 
-def run_server():
-    port = int(os.environ.get("PORT", 8080))
-    server = HTTPServer(("0.0.0.0", port), Handler)
-    server.serve_forever()
+async def startup_ready():
+    return ready.is_set()
 
-# Start HTTP server in a separate thread
-Thread(target=run_server).start()
+health_server = HealthServer(int(os.environ.get("PORT", 8080)), {
+    "telegram": telegram_ready,
+    "mongo": mongo_ready,
+    "startup": startup_ready,
+})
 
 from pyrogram import idle
 
+async def timed_phase(name, coro):
+    start = time.perf_counter()
+    try:
+        return await coro
+    finally:
+        startup_timings[name] = time.perf_counter() - start
+
+async def prepare_database():
+    # Indexes (and the legacy list migration) first, then the warnings
+    # journal and the global lists, then one bulk load of the lists of
+    # chats likely to be active. With MongoDB down the bot starts anyway,
+    # counting warnings in the journal, and Database retries the setup.
+    if not await db.prepare():
+        return []
+    try:
+        chats = await db.active_chats(PRELOAD_CHATS)
+        await db.preload_policies(chats)
+    except Exception as e:
+        print(f"Failed to preload chat lists: {e}")
+        return []
+    return chats
+
 async def main():
-    await app.start()
+    started = time.perf_counter()
+    startup_timings["imports"] = _imports_done - _imports_started
+    await health_server.start()
+
+    # Independent steps run at the same time. Telegram is connected early so
+    # admin rosters can be fetched, but messages wait until `ready` is set.
+    chats, *_ = await asyncio.gather(
+        timed_phase("database", prepare_database()),
+        timed_phase("scheduler", delete_scheduler.load()),
+        timed_phase("workers", workers.start()),
+        timed_phase("telegram", app.start()),
+    )
+    db.start_policy_sync()
+    db.start_journal()
+    api.start()
+    admission.start()
+    log_writer.start(app)
+    delete_scheduler.start(app)
+    event_writer.start()
+    tracing.start_exporter()
+
+    try:
+        await asyncio.wait_for(timed_phase("admins", admin_cache.preload(app, chats[:PRELOAD_ADMIN_CHATS])), PRELOAD_TIMEOUT)
+    except asyncio.TimeoutError:
+        print(f"Admin rosters still loading after {PRELOAD_TIMEOUT}s, continuing")
+    ready.set()
+    startup_timings["total"] = time.perf_counter() - started + startup_timings["imports"]
+    print("Startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_timings.items()) + f" ({len(chats)} chats preloaded)")
     print("Bot is running...")
     
     if log_channel_id != 0:
@@ -664,6 +1065,18 @@ async def main():
             print(f"Failed to send restart log: {e}")
 
     await idle()
+    await admission.stop()
+    await workers.stop()
+    await warning_notices.stop()
+    await log_writer.stop()
+    await delete_scheduler.stop()
+    await event_writer.stop()
+    await tracing.stop_exporter()
+    await api.stop()
+    translator.shutdown()
+    await health_server.stop()
+    await db.stop_policy_sync()
+    await db.stop_journal()
     await app.stop()
 
 if __name__ == "__main__":
@@ -1,129 +1,688 @@
 import os
-import motor.motor_asyncio
+import time
+import asyncio
+import functools
+from datetime import datetime, timezone, timedelta
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import PyMongoError, DuplicateKeyError, CollectionInvalid, BulkWriteError
+from detection import Policy
+from cache import TTLCache
+from journal import WarningJournal
+import listfile
+from metrics import DB_LATENCY
+import tracing
+
+# How often replicas without change streams re-check the policy version (seconds)
+POLICY_POLL_INTERVAL = int(os.environ.get("POLICY_POLL_INTERVAL", 30))
+# Chats whose policy snapshot is kept in memory; idle ones are reloaded on demand
+POLICY_CACHE_SIZE = int(os.environ.get("POLICY_CACHE_SIZE", 5000))
+# Safety net: snapshots are rebuilt after this long even without a change signal (seconds)
+POLICY_CACHE_TTL = 3600
+# After a snapshot fails to load, chats without one use the global lists for this long (seconds)
+POLICY_RETRY_DELAY = 30
+# chat_id of entries that apply in every chat
+GLOBAL_SCOPE = 0
+# "substring" blocks a banned word anywhere, "word" only as a whole word
+BLACKLIST_MODE = os.environ.get("BLACKLIST_MODE", "substring")
+# Strikes are forgotten after this long without a new one (seconds)
+WARNING_TTL = int(os.environ.get("WARNING_TTL", 7 * 24 * 3600))
+# Warning message IDs remembered per user (deleted when they get muted)
+MAX_WARNING_MSG_IDS = 10
+# Local SQLite file warnings are written to first (see journal.py); empty
+# to write them straight to MongoDB
+JOURNAL_PATH = os.environ.get("JOURNAL_PATH", "warnings_journal.db")
+# Journaled warnings are copied to MongoDB this often (seconds), at most this many per write
+JOURNAL_FLUSH_INTERVAL = float(os.environ.get("JOURNAL_FLUSH_INTERVAL", 2))
+JOURNAL_BATCH_SIZE = 500
+# How often setup (indexes, migration, lists) is retried while MongoDB is unreachable (seconds)
+PREPARE_RETRY_INTERVAL = 30
+# Raw moderation events are kept this long (seconds)
+EVENT_RETENTION = int(os.environ.get("EVENT_RETENTION", 30 * 24 * 3600))
+# Hourly / daily /stats counters are kept this long (seconds)
+ROLLUP_RETENTION = {"hour": 7 * 24 * 3600, "day": 400 * 24 * 3600}
+
+def timed(func):
+    # Records Mongo latency per method for /metrics and traces
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with DB_LATENCY.time(op=func.__name__), tracing.span(f"db.{func.__name__}"):
+            return await func(*args, **kwargs)
+    return wrapper
 
 class Database:
-    def __init__(self):
+    def __init__(self, client=None, journal_path=JOURNAL_PATH):
+        # `client` replaces the motor client built from MONGO_URL (benchmarks
+        # pass an in-memory stand-in), `journal_path` the JOURNAL_PATH file
+        # In-memory policy snapshots, so the message hot path never hits Mongo:
+        # the global entries (chat_id 0) plus one lazily loaded Policy per chat
+        self.word_boundary = BLACKLIST_MODE == "word"
+        self._global = Policy(word_boundary=self.word_boundary)
+        self._policies = TTLCache(maxsize=POLICY_CACHE_SIZE, ttl=POLICY_CACHE_TTL)
+        self._versions = {}  # chat_id -> policy version the cached snapshot reflects
+        self._sync_task = None
+        self._policy_retry_at = 0.0  # monotonic time before which snapshots aren't loaded
+        self._journal_task = None
+        self._journal_failing = False
+        self._prepare_task = None
+        self.prepared = False  # Indexes created and lists loaded
+
         mongo_url = os.environ.get("MONGO_URL")
-        if not mongo_url:
-            print("WARNING: MONGO_URL not found! Database will not work.")
+        # Warnings are counted in the journal even without MongoDB
+        self.journal = None
+        if journal_path:
+            write_behind = client is not None or bool(mongo_url)
+            self.journal = WarningJournal(journal_path, WARNING_TTL, MAX_WARNING_MSG_IDS, write_behind=write_behind)
+        if client is None and not mongo_url:
+            if self.journal is not None:
+                print(f"WARNING: MONGO_URL not found! Only warnings are kept (in {journal_path}).")
+            else:
+                print("WARNING: MONGO_URL not found! Database will not work.")
             self.db = None
             return
             
-        self.client = motor.motor_asyncio.AsyncIOMotorClient(mongo_url)
+        if client is None:
+            # Imported here so runs without MONGO_URL (and benchmarks) skip it
+            import motor.motor_asyncio
+            client = motor.motor_asyncio.AsyncIOMotorClient(mongo_url)
+        self.client = client
         self.db = self.client["TelegramBotDB"]
         self.warnings = self.db["warnings"]
-        self.warnings = self.db["warnings"]
-        self.whitelist = self.db["whitelist"]
-        self.blacklist = self.db["blacklist"]
+        self.policies = self.db["policies"]
+        self.settings = self.db["settings"]
+        self.meta = self.db["meta"]
+        self.scheduled_deletes = self.db["scheduled_deletes"]
+        self.events = self.db["events"]
+        self.rollups = self.db["event_rollups"]
+
+    async def ping(self):
+        # Readiness check; without MONGO_URL there is nothing to wait for
+        if self.db is None: return True
+        try:
+            await self.client.admin.command("ping")
+            return True
+        except PyMongoError:
+            return False
+
+    # --- Policy Snapshots ---
+    @timed
+    async def load_policies(self):
+        # Global entries, shared by every chat; chat snapshots are rebuilt on demand
+        if self.db is None: return
+        entries, version = await asyncio.gather(
+            self.policies.find({"chat_id": GLOBAL_SCOPE}, {"_id": 0, "kind": 1, "value": 1}).to_list(None),
+            self._get_policy_version(GLOBAL_SCOPE),
+        )
+        self._global = self._build_policy(entries)
+        self._policies.clear()
+        self._versions = {GLOBAL_SCOPE: version}
+
+    @timed
+    async def active_chats(self, limit):
+        # Chats worth warming up at startup: chats with unexpired warnings
+        # first, then chats with their own lists or settings
+        if self.db is None: return []
+        found = await asyncio.gather(
+            self.warnings.distinct("chat_id"),
+            self.policies.distinct("chat_id"),
+            self.settings.distinct("chat_id"),
+        )
+        chats = {}
+        for chat_ids in found:
+            for chat_id in chat_ids:
+                if chat_id != GLOBAL_SCOPE:
+                    chats.setdefault(chat_id, None)
+        return list(chats)[:limit]
+
+    @timed
+    async def preload_policies(self, chat_ids):
+        # Builds the snapshots of many chats with three queries instead of
+        # three per chat, so the first messages after a restart find them cached
+        if self.db is None or not chat_ids: return
+        chat_ids = list(chat_ids)
+        entries, settings, versions = await asyncio.gather(
+            self.policies.find({"chat_id": {"$in": chat_ids}}, {"_id": 0, "chat_id": 1, "kind": 1, "value": 1}).to_list(None),
+            self.settings.find({"chat_id": {"$in": chat_ids}}, {"_id": 0}).to_list(None),
+            self.meta.find({"type": "policy_version", "chat_id": {"$in": chat_ids}}, {"_id": 0, "chat_id": 1, "version": 1}).to_list(None),
+        )
+        by_chat = {chat_id: [] for chat_id in chat_ids}
+        for entry in entries:
+            by_chat[entry["chat_id"]].append(entry)
+        settings = {doc.pop("chat_id"): doc for doc in settings}
+        versions = {doc["chat_id"]: doc["version"] for doc in versions}
+        for chat_id, chat_entries in by_chat.items():
+            policy = self._build_policy(chat_entries, base=self._global)
+            policy.settings = settings.get(chat_id, {})
+            self._versions[chat_id] = versions.get(chat_id, 0)
+            self._policies.set(chat_id, policy)
+
+    def _build_policy(self, entries, base=None):
+        values = {kind: set(base and getattr(base, kind + "s") or ()) for kind in Policy.KINDS}
+        for entry in entries:
+            values[entry["kind"]].add(entry["value"])
+        return Policy(values["word"], values["domain"], self.word_boundary, values["user"])
+
+    async def get_policy(self, chat_id):
+        # Everything that applies in `chat_id`: its own entries plus the global
+        # ones. While MongoDB can't be reached, chats without a snapshot get
+        # the global lists, without waiting on a load for POLICY_RETRY_DELAY.
+        if self.db is None: return self._global
+        if time.monotonic() < self._policy_retry_at:
+            policy = self._policies.get(chat_id)
+            return policy if policy is not None else self._global
+        try:
+            return await self._policies.get_or_load(chat_id, lambda: self._load_chat_policy(chat_id))
+        except PyMongoError as e:
+            if time.monotonic() >= self._policy_retry_at:
+                print(f"Failed to load the lists of {chat_id}, using the global lists for {POLICY_RETRY_DELAY}s: {e}")
+                self._policy_retry_at = time.monotonic() + POLICY_RETRY_DELAY
+            return self._global
+
+    @timed
+    async def _load_chat_policy(self, chat_id):
+        entries, settings, version = await asyncio.gather(
+            self.policies.find({"chat_id": chat_id}, {"_id": 0, "kind": 1, "value": 1}).to_list(None),
+            self.settings.find_one({"chat_id": chat_id}, {"_id": 0, "chat_id": 0}),
+            self._get_policy_version(chat_id),
+        )
+        self._versions[chat_id] = version
+        policy = self._build_policy(entries, base=self._global)
+        policy.settings = settings or {}
+        return policy
+
+    async def _get_policy_version(self, chat_id):
+        doc = await self.meta.find_one({"type": "policy_version", "chat_id": chat_id})
+        return doc["version"] if doc else 0
+
+    @timed
+    async def _bump_policy_version(self, chat_id):
+        # Tells other replicas that this chat's lists changed
+        doc = await self.meta.find_one_and_update(
+            {"type": "policy_version", "chat_id": chat_id},
+            {"$inc": {"version": 1}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        if chat_id == GLOBAL_SCOPE:
+            # Every chat's snapshot includes the global entries: rebuild them all
+            await self.load_policies()
+        elif self._versions.get(chat_id) == doc["version"] - 1:
+            # Only our own change since the snapshot was built, already applied
+            self._versions[chat_id] = doc["version"]
+        else:
+            self._invalidate(chat_id)
+
+    def _invalidate(self, chat_id):
+        self._versions.pop(chat_id, None)
+        self._policies.pop(chat_id)
+
+    async def _apply_version(self, chat_id, version):
+        if chat_id == GLOBAL_SCOPE:
+            if version != self._versions.get(GLOBAL_SCOPE):
+                await self.load_policies()
+        elif chat_id in self._versions and version != self._versions[chat_id]:
+            self._invalidate(chat_id)
+
+    def start_policy_sync(self):
+        if self.db is None or self._sync_task: return
+        self._sync_task = asyncio.create_task(self._sync_policies())
+
+    async def stop_policy_sync(self):
+        # Also gives up on a setup retry still waiting for MongoDB
+        for task in (self._sync_task, self._prepare_task):
+            if not task: continue
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        self._sync_task = self._prepare_task = None
+
+    async def _sync_policies(self):
+        # Prefer a change stream on the version stamps (replica sets only), else poll them
+        pipeline = [{"$match": {"fullDocument.type": "policy_version"}}]
+        try:
+            async with self.meta.watch(pipeline, full_document="updateLookup") as stream:
+                async for change in stream:
+                    doc = change.get("fullDocument")
+                    if doc:
+                        await self._apply_version(doc.get("chat_id", GLOBAL_SCOPE), doc["version"])
+        except PyMongoError as e:
+            print(f"Policy change stream unavailable ({e}), polling every {POLICY_POLL_INTERVAL}s")
+
+        while True:
+            await asyncio.sleep(POLICY_POLL_INTERVAL)
+            try:
+                # Only chats with a cached snapshot can be stale
+                self._versions = {c: v for c, v in self._versions.items() if c == GLOBAL_SCOPE or c in self._policies}
+                docs = self.meta.find(
+                    {"type": "policy_version", "chat_id": {"$in": list(self._versions)}},
+                    {"_id": 0, "chat_id": 1, "version": 1}
+                )
+                async for doc in docs:
+                    await self._apply_version(doc["chat_id"], doc["version"])
+            except PyMongoError as e:
+                print(f"Failed to poll policy versions: {e}")
+
+    async def prepare(self):
+        # Indexes, the legacy list migration, the journal's view of the
+        # shared warnings and the global lists. Returns False if MongoDB
+        # can't be reached: the bot then starts on the journal and empty
+        # global lists, and this is retried in the background.
+        if self.db is None: return True
+        try:
+            await self._prepare()
+            return True
+        except PyMongoError as e:
+            print(f"MongoDB setup failed, retrying every {PREPARE_RETRY_INTERVAL}s (warnings are kept in the journal): {e}")
+            self._prepare_task = asyncio.create_task(self._retry_prepare())
+            return False
+
+    async def _prepare(self):
+        await self.ensure_indexes()
+        await self.load_journal()
+        await self.load_policies()
+        self.prepared = True
+
+    async def _retry_prepare(self):
+        while True:
+            await asyncio.sleep(PREPARE_RETRY_INTERVAL)
+            try:
+                await self._prepare()
+            except PyMongoError as e:
+                print(f"MongoDB setup failed again, retrying: {e}")
+                continue
+            print("MongoDB reachable again, indexes and lists are set up")
+            self._prepare_task = None
+            return
+
+    @timed
+    async def ensure_indexes(self):
+        if self.db is None: return
+        # Warnings are per chat; drop legacy documents keyed only by user_id
+        await self.warnings.delete_many({"chat_id": {"$exists": False}})
+        # The old global version stamp had no chat_id
+        await self.meta.delete_many({"type": "policy_version", "chat_id": {"$exists": False}})
+        await asyncio.gather(
+            self.warnings.create_index([("chat_id", 1), ("user_id", 1)], unique=True),
+            self.warnings.create_index("updated_at", expireAfterSeconds=WARNING_TTL),
+            self.scheduled_deletes.create_index([("chat_id", 1), ("message_id", 1)]),
+            # Safety net for entries a crashed instance never got to remove
+            self.scheduled_deletes.create_index("due_at", expireAfterSeconds=24 * 3600),
+            self.policies.create_index([("chat_id", 1), ("kind", 1), ("value", 1)], unique=True),
+            # /list pages through a chat's entries in insertion order
+            self.policies.create_index([("chat_id", 1), ("kind", 1), ("_id", 1)]),
+            self.meta.create_index([("type", 1), ("chat_id", 1)], unique=True, partialFilterExpression={"chat_id": {"$exists": True}}),
+            self.settings.create_index("chat_id", unique=True),
+            self.rollups.create_index([("chat_id", 1), ("period", 1), ("start", 1)], unique=True),
+            self.rollups.create_index("expires_at", expireAfterSeconds=0),
+            self._create_events_collection(),
+        )
+        await self.migrate_policies()
+
+    async def _create_events_collection(self):
+        # Time-series collection (MongoDB 5.0+), a plain one with a TTL index otherwise
+        if "events" in await self.db.list_collection_names(): return
+        try:
+            await self.db.create_collection(
+                "events",
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "minutes"},
+                expireAfterSeconds=EVENT_RETENTION
+            )
+        except CollectionInvalid:
+            pass # Created by another instance in the meantime
+        except PyMongoError as e:
+            print(f"Time-series collections unavailable ({e}), storing events in a regular collection")
+            await self.events.create_index("ts", expireAfterSeconds=EVENT_RETENTION)
+
+    @timed
+    async def migrate_policies(self):
+        # Moves the old one-document-per-list whitelist/blacklist arrays into
+        # per-entry documents in the global scope. Safe to run repeatedly.
+        if self.db is None: return
+        now = datetime.now(timezone.utc)
+        for name, kinds in (("whitelist", {"domain": "domain", "user": "user"}), ("blacklist", {"word": "word"})):
+            legacy = self.db[name]
+            async for doc in legacy.find({"list": {"$exists": True}}):
+                kind = kinds.get(doc.get("type"))
+                values = doc.get("list") or []
+                if kind and values:
+                    await self.policies.bulk_write([
+                        UpdateOne(
+                            {"chat_id": GLOBAL_SCOPE, "kind": kind, "value": value},
+                            {"$setOnInsert": {"added_at": now}},
+                            upsert=True
+                        )
+                        for value in values
+                    ], ordered=False)
+                    print(f"Migrated {len(values)} {name} entries ({kind}) to the global scope")
+                await legacy.delete_one({"_id": doc["_id"]})
+
+    # --- Warnings Journal ---
+    @timed
+    async def load_journal(self):
+        # Adopts the warnings Mongo has (other instances' too) under the
+        # journal's own unflushed changes
+        if self.journal is None or self.db is None: return
+        since = datetime.now(timezone.utc) - timedelta(seconds=WARNING_TTL)
+        docs = await self.warnings.find(
+            {"updated_at": {"$gt": since}},
+            {"_id": 0, "chat_id": 1, "user_id": 1, "count": 1, "msg_ids": 1, "updated_at": 1}
+        ).to_list(None)
+        adopted = self.journal.refresh(docs)
+        if adopted:
+            print(f"Loaded {adopted} users' warnings from MongoDB into the journal")
+
+    def start_journal(self):
+        if self.journal is None or self.db is None or self._journal_task: return
+        self._journal_task = asyncio.create_task(self._run_journal())
+
+    async def stop_journal(self):
+        # Copies what is still pending; whatever fails stays in the journal file
+        if self._journal_task:
+            self._journal_task.cancel()
+            try:
+                await self._journal_task
+            except asyncio.CancelledError:
+                pass
+            self._journal_task = None
+            try:
+                while await self.flush_journal() == JOURNAL_BATCH_SIZE:
+                    pass
+            except PyMongoError as e:
+                print(f"Failed to flush the warnings journal ({self.journal.backlog()} users pending): {e}")
+        if self.journal is not None:
+            self.journal.close()
+
+    async def _run_journal(self):
+        while True:
+            await asyncio.sleep(JOURNAL_FLUSH_INTERVAL)
+            try:
+                while await self.flush_journal() == JOURNAL_BATCH_SIZE:
+                    pass
+                if self._journal_failing:
+                    print("Warnings journal caught up with MongoDB")
+                    self._journal_failing = False
+            except PyMongoError as e:
+                # Retried on the next round; reported once per outage
+                if not self._journal_failing:
+                    print(f"Failed to flush the warnings journal, retrying: {e}")
+                    self._journal_failing = True
+            self.journal.prune()
+
+    @timed
+    async def flush_journal(self):
+        # Writes one batch of journaled changes, returns how many. Strikes
+        # are added with $inc so instances sharing the collection don't
+        # overwrite each other; each update only applies over an older seq
+        # from this journal, so writing a batch twice is harmless.
+        if self.journal is None or self.db is None or not self.prepared: return 0
+        batch = self.journal.pending(JOURNAL_BATCH_SIZE)
+        if not batch: return 0
+        applied = f"journals.{self.journal.id}"  # Last seq taken from this journal
+        requests = []
+        for chat_id, user_id, delta, msg_ids, reset, updated_at, seq in batch:
+            stamp = {"updated_at": datetime.fromtimestamp(updated_at, timezone.utc), applied: seq}
+            if reset:
+                update = {"$set": {"count": delta, "msg_ids": msg_ids, **stamp}}
+            else:
+                update = {"$inc": {"count": delta}, "$set": stamp}
+                if msg_ids:
+                    update["$push"] = {"msg_ids": {"$each": msg_ids, "$slice": -MAX_WARNING_MSG_IDS}}
+            requests.append(UpdateOne(
+                {"chat_id": chat_id, "user_id": user_id, applied: {"$not": {"$gte": seq}}},
+                update,
+                upsert=True
+            ))
+        try:
+            await self.warnings.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # A duplicate key is an upsert that found this seq already applied: nothing to write
+            details = e.details or {}
+            if details.get("writeConcernErrors") or any(err.get("code") != 11000 for err in details.get("writeErrors", [])):
+                raise
+        self.journal.mark_flushed(batch)
+        # Picks up what other instances added to (or reset for) these users
+        docs = await self.warnings.find(
+            {"$or": [{"chat_id": chat_id, "user_id": user_id} for chat_id, user_id, *_ in batch]},
+            {"_id": 0, "chat_id": 1, "user_id": 1, "count": 1, "msg_ids": 1, "updated_at": 1}
+        ).to_list(None)
+        self.journal.refresh(docs)
+        return len(batch)
+
+    def journal_lag(self):
+        return self.journal.lag() if self.journal is not None else 0.0
+
+    def journal_backlog(self):
+        return self.journal.backlog() if self.journal is not None else 0
 
     # --- Warnings ---
-    async def get_warnings(self, user_id):
+    @timed
+    async def get_warnings(self, chat_id, user_id):
+        if self.journal is not None: return self.journal.count(chat_id, user_id)
         if self.db is None: return 0
-        user = await self.warnings.find_one({"user_id": user_id})
+        user = await self.warnings.find_one({"chat_id": chat_id, "user_id": user_id})
         return user["count"] if user else 0
 
-    async def add_warning(self, user_id, message_id=None):
+    @timed
+    async def add_warning(self, chat_id, user_id, message_id=None):
+        # Atomic increment, returns the new count
+        if self.journal is not None: return self.journal.add_warning(chat_id, user_id, message_id)
         if self.db is None: return 0
-        user = await self.warnings.find_one({"user_id": user_id})
-        if user:
-            new_count = user["count"] + 1
-            update_query = {"$set": {"count": new_count}}
-            if message_id:
-                update_query["$push"] = {"msg_ids": message_id}
-            await self.warnings.update_one({"user_id": user_id}, update_query)
-            return new_count
-        else:
-            doc = {"user_id": user_id, "count": 1}
-            if message_id:
-                doc["msg_ids"] = [message_id]
-            await self.warnings.insert_one(doc)
-            return 1
+        update = {
+            "$inc": {"count": 1},
+            "$set": {"updated_at": datetime.now(timezone.utc)}
+        }
+        if message_id:
+            update["$push"] = {"msg_ids": {"$each": [message_id], "$slice": -MAX_WARNING_MSG_IDS}}
+        key = {"chat_id": chat_id, "user_id": user_id}
+        try:
+            user = await self.warnings.find_one_and_update(key, update, upsert=True, return_document=ReturnDocument.AFTER)
+        except DuplicateKeyError:
+            # Lost an upsert race with a concurrent first warning, the document exists now
+            user = await self.warnings.find_one_and_update(key, update, return_document=ReturnDocument.AFTER)
+        return user["count"]
 
-    async def get_warning_message_ids(self, user_id):
+    @timed
+    async def add_warning_message(self, chat_id, user_id, message_id):
+        # Records a warning notice for delete_previous_warnings without
+        # counting a warning (a notice can cover several)
+        if self.journal is not None: return self.journal.add_message(chat_id, user_id, message_id)
+        if self.db is None: return
+        await self.warnings.update_one(
+            {"chat_id": chat_id, "user_id": user_id},
+            {"$push": {"msg_ids": {"$each": [message_id], "$slice": -MAX_WARNING_MSG_IDS}}}
+        )
+
+    @timed
+    async def get_warning_message_ids(self, chat_id, user_id):
+        if self.journal is not None: return self.journal.message_ids(chat_id, user_id)
         if self.db is None: return []
-        user = await self.warnings.find_one({"user_id": user_id})
+        user = await self.warnings.find_one({"chat_id": chat_id, "user_id": user_id})
         return user.get("msg_ids", []) if user else []
 
-    async def reset_warnings(self, user_id):
+    @timed
+    async def reset_warnings(self, chat_id, user_id):
+        if self.journal is not None: return self.journal.reset(chat_id, user_id)
         if self.db is None: return
-        await self.warnings.delete_one({"user_id": user_id})
+        await self.warnings.delete_one({"chat_id": chat_id, "user_id": user_id})
+
+    # --- Scheduled Deletes ---
+    @timed
+    async def add_scheduled_deletes(self, entries):
+        if self.db is None or not entries: return
+        await self.scheduled_deletes.insert_many([
+            {"chat_id": chat_id, "message_id": message_id, "due_at": datetime.fromtimestamp(due_at, timezone.utc)}
+            for due_at, chat_id, message_id in entries
+        ])
 
-    # --- Whitelist ---
-    async def add_whitelist_domain(self, domain):
+    @timed
+    async def remove_scheduled_deletes(self, chat_id, message_ids):
         if self.db is None: return
-        await self.whitelist.update_one(
-            {"type": "domain"}, 
-            {"$addToSet": {"list": domain}}, 
-            upsert=True
-        )
+        await self.scheduled_deletes.delete_many({"chat_id": chat_id, "message_id": {"$in": message_ids}})
 
-    async def remove_whitelist_domain(self, domain):
+    @timed
+    async def get_scheduled_deletes(self):
+        if self.db is None: return []
+        entries = []
+        async for doc in self.scheduled_deletes.find({}, {"_id": 0}):
+            due_at = doc["due_at"].replace(tzinfo=timezone.utc).timestamp()
+            entries.append((due_at, doc["chat_id"], doc["message_id"]))
+        return entries
+
+    # --- Moderation Events ---
+    @timed
+    async def write_events(self, events, increments):
+        # A batch from EventWriter: the raw events plus their hourly/daily
+        # counters, {(chat_id, period, start): {"field.path": n}}
         if self.db is None: return
-        await self.whitelist.update_one(
-            {"type": "domain"}, 
-            {"$pull": {"list": domain}}
+        await asyncio.gather(
+            self.events.insert_many(events, ordered=False),
+            self.rollups.bulk_write([
+                UpdateOne(
+                    {"chat_id": chat_id, "period": period, "start": start},
+                    {"$inc": dict(counts), "$setOnInsert": {"expires_at": start + timedelta(seconds=ROLLUP_RETENTION[period])}},
+                    upsert=True
+                )
+                for (chat_id, period, start), counts in increments.items()
+            ], ordered=False),
         )
 
-    async def is_domain_whitelisted(self, text):
-        if self.db is None: return False
-        doc = await self.whitelist.find_one({"type": "domain"})
-        if not doc or "list" not in doc:
-            return False
-        
-        for domain in doc["list"]:
-            if domain in text:
-                return True
-        return False
+    @timed
+    async def get_rollups(self, chat_id, period, since):
+        # Counters of a chat for every `period` ("hour"/"day") starting at or after `since`
+        if self.db is None: return []
+        return await self.rollups.find(
+            {"chat_id": chat_id, "period": period, "start": {"$gte": since}},
+            {"_id": 0, "actions": 1, "violations": 1, "users": 1, "domains": 1}
+        ).to_list(None)
 
-    async def add_whitelist_user(self, user_id):
+    # --- Chat Settings ---
+    @timed
+    async def set_chat_settings(self, chat_id, **values):
         if self.db is None: return
-        await self.whitelist.update_one(
-            {"type": "user"}, 
-            {"$addToSet": {"list": user_id}}, 
+        await self.settings.update_one({"chat_id": chat_id}, {"$set": values}, upsert=True)
+        policy = self._policies.get(chat_id)
+        if policy:
+            policy.settings.update(values)
+        await self._bump_policy_version(chat_id)
+
+    # --- Whitelist / Blacklist ---
+    @timed
+    async def add_policy_entry(self, chat_id, kind, value):
+        # Returns False if the entry already existed
+        if self.db is None: return False
+        result = await self.policies.update_one(
+            {"chat_id": chat_id, "kind": kind, "value": value},
+            {"$setOnInsert": {"added_at": datetime.now(timezone.utc)}},
             upsert=True
         )
+        if result.upserted_id is None:
+            return False
+        policy = self._policies.get(chat_id)
+        if policy:
+            policy.add(kind, value)
+        await self._bump_policy_version(chat_id)
+        return True
 
-    async def remove_whitelist_user(self, user_id):
-        if self.db is None: return
-        await self.whitelist.update_one(
-            {"type": "user"}, 
-            {"$pull": {"list": user_id}}
-        )
+    @timed
+    async def add_policy_entries(self, chat_id, entries):
+        # Bulk add_policy_entry for /import: one bulk_write for the whole file,
+        # and the chat's snapshot is rebuilt once instead of patched per entry.
+        # `entries` are unique (kind, value) pairs. Returns how many were new.
+        if self.db is None or not entries: return 0
+        now = datetime.now(timezone.utc)
+        result = await self.policies.bulk_write([
+            UpdateOne({"chat_id": chat_id, "kind": kind, "value": value}, {"$setOnInsert": {"added_at": now}}, upsert=True)
+            for kind, value in entries
+        ], ordered=False)
+        if result.upserted_count:
+            await self._bump_policy_version(chat_id)
+            self._invalidate(chat_id)
+        return result.upserted_count
 
-    async def is_user_whitelisted(self, user_id):
+    @timed
+    async def remove_policy_entry(self, chat_id, kind, value):
+        # Returns False if the chat had no such entry
         if self.db is None: return False
-        doc = await self.whitelist.find_one({"type": "user"})
-        if not doc or "list" not in doc:
+        result = await self.policies.delete_one({"chat_id": chat_id, "kind": kind, "value": value})
+        if not result.deleted_count:
             return False
-        return user_id in doc["list"]
+        policy = self._policies.get(chat_id)
+        if policy and value not in getattr(self._global, kind + "s"):
+            policy.remove(kind, value)
+        await self._bump_policy_version(chat_id)
+        return True
 
-    async def get_whitelist_domains(self):
-        if self.db is None: return []
-        doc = await self.whitelist.find_one({"type": "domain"})
-        return doc["list"] if doc and "list" in doc else []
+    @timed
+    async def get_policy_entries(self, chat_id):
+        # All of a chat's own entries for /export: {kind: [values]}, oldest first
+        lists = {kind: [] for kind in Policy.KINDS}
+        if self.db is None: return lists
+        async for doc in self.policies.find({"chat_id": chat_id}, {"_id": 0, "kind": 1, "value": 1}).sort("_id", 1):
+            lists[doc["kind"]].append(doc["value"])
+        return lists
 
-    async def get_whitelist_users(self):
-        if self.db is None: return []
-        doc = await self.whitelist.find_one({"type": "user"})
-        return doc["list"] if doc and "list" in doc else []
+    def is_global_entry(self, kind, value):
+        return value in getattr(self._global, kind + "s")
 
-    # --- Blacklist ---
-    async def add_blacklist_word(self, word):
-        if self.db is None: return
-        await self.blacklist.update_one(
-            {"type": "word"}, 
-            {"$addToSet": {"list": word.lower()}}, 
-            upsert=True
-        )
+    @timed
+    async def list_policy_entries(self, chat_id, kind, after=None, limit=50):
+        # One page of a chat's own entries, oldest first. Returns (values, cursor
+        # for the next page or None); `after` is the previous page's cursor.
+        if self.db is None: return [], None
+        query = {"chat_id": chat_id, "kind": kind}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        docs = await self.policies.find(query, {"value": 1}).sort("_id", 1).limit(limit + 1).to_list(None)
+        next_after = docs[limit - 1]["_id"] if len(docs) > limit else None
+        return [d["value"] for d in docs[:limit]], next_after
 
-    async def remove_blacklist_word(self, word):
-        if self.db is None: return
-        await self.blacklist.update_one(
-            {"type": "word"}, 
-            {"$pull": {"list": word.lower()}}
-        )
+    @timed
+    async def count_policy_entries(self, chat_id, kind):
+        if self.db is None: return 0
+        return await self.policies.count_documents({"chat_id": chat_id, "kind": kind})
 
-    async def get_blacklist(self):
-        if self.db is None: return []
-        doc = await self.blacklist.find_one({"type": "word"})
-        return doc["list"] if doc and "list" in doc else []
+    def count_global_entries(self, kind):
+        return len(getattr(self._global, kind + "s"))
+
+    async def add_whitelist_domain(self, chat_id, domain):
+        # Stored the way /import stores it ("https://www.X.com/a" -> "www.x.com")
+        value = listfile.normalize("domain", domain)
+        if value is None:
+            raise ValueError(f"{domain!r} is not a domain")
+        return await self.add_policy_entry(chat_id, "domain", value)
+
+    async def remove_whitelist_domain(self, chat_id, domain):
+        value = listfile.normalize("domain", domain)
+        if value is not None and await self.remove_policy_entry(chat_id, "domain", value):
+            return True
+        # Entries added before domains were normalized were stored as typed
+        raw = domain.strip().lower()
+        return raw != value and await self.remove_policy_entry(chat_id, "domain", raw)
+
+    async def are_hosts_whitelisted(self, chat_id, hosts):
+        # Every link must point to a whitelisted domain (or a subdomain of one)
+        if self.db is None: return False
+        if not hosts: return False
+        policy = await self.get_policy(chat_id)
+        return all(policy.domain_index.match(host) for host in hosts)
+
+    async def add_whitelist_user(self, chat_id, user_id):
+        return await self.add_policy_entry(chat_id, "user", user_id)
+
+    async def remove_whitelist_user(self, chat_id, user_id):
+        return await self.remove_policy_entry(chat_id, "user", user_id)
+
+    async def is_user_whitelisted(self, chat_id, user_id):
+        if self.db is None: return False
+        return user_id in (await self.get_policy(chat_id)).users
+
+    async def add_blacklist_word(self, chat_id, word):
+        return await self.add_policy_entry(chat_id, "word", word.lower())
+
+    async def remove_blacklist_word(self, chat_id, word):
+        return await self.remove_policy_entry(chat_id, "word", word.lower())
+
+    async def find_blacklisted_word(self, chat_id, text):
+        if self.db is None: return None
+        return (await self.get_policy(chat_id)).blacklist_matcher.find(text)
@@ -0,0 +1,103 @@
+import hashlib
+import itertools
+from matcher import BlacklistMatcher
+from domains import DomainIndex
+import analysis
+
+# CPU-only part of moderation: blacklist matching, link and mention detection.
+# Works on a plain, picklable payload instead of a Pyrogram Message so it can
+# run in a worker process (see workers.py) as well as in the bot process.
+
+# Mentions everyone uses that never point at another chat
+MENTION_WHITELIST = {"everyone", "all", "admin", "admins"}
+
+
+def message_payload(message):
+    # The parts of a Message the checks need, as builtins only
+    entities = message.entities or message.caption_entities or []
+    return {
+        "chat_id": message.chat.id,
+        "text": message.text or message.caption or "",
+        "entities": [(e.type.name, e.offset, e.length, getattr(e, "url", None)) for e in entities],
+    }
+
+
+def fingerprint(payload):
+    # Identifies content that evaluate() would treat the same way: the exact
+    # text plus the entity layout. Nothing is normalized away that could
+    # change a verdict (case matters to the link regex, offsets to entities).
+    digest = hashlib.blake2b(payload["text"].encode("utf-8", "surrogatepass"), digest_size=16)
+    for kind, offset, length, url in payload["entities"]:
+        digest.update(f"\0{kind}:{offset}:{length}:{url or ''}".encode("utf-8", "surrogatepass"))
+    return digest.digest()
+
+
+class Policy:
+    # Blacklist and whitelists that apply in one chat (its own entries plus
+    # the global ones). `revision` changes whenever the lists do, so worker
+    # processes know when their copy is stale.
+    KINDS = ("word", "domain", "user")
+    _revisions = itertools.count(1)
+
+    def __init__(self, words=(), domains=(), word_boundary=False, users=()):
+        self.words = {w.lower() for w in words}
+        self.domains = set(domains)
+        self.users = set(users)
+        self.blacklist_matcher = BlacklistMatcher(self.words, word_boundary=word_boundary)
+        self.domain_index = DomainIndex(self.domains)
+        self.revision = next(self._revisions)
+        # Chat settings (e.g. flood threshold), stored with the lists so they
+        # share the cache and change tracking; not used by evaluate()
+        self.settings = {}
+
+    def add(self, kind, value):
+        if kind == "word" and value not in self.words:
+            self.words.add(value)
+            self.blacklist_matcher.add(value)
+        elif kind == "domain" and value not in self.domains:
+            self.domains.add(value)
+            self.domain_index.add(value)
+        elif kind == "user":
+            self.users.add(value)
+            return  # Workers don't use the user whitelist
+        self.revision = next(self._revisions)
+
+    def remove(self, kind, value):
+        if kind == "word" and value in self.words:
+            self.words.discard(value)
+            self.blacklist_matcher.remove(value)
+        elif kind == "domain" and value in self.domains:
+            self.domains.discard(value)
+            self.domain_index.remove(value)
+        elif kind == "user":
+            self.users.discard(value)
+            return
+        self.revision = next(self._revisions)
+
+    def state(self):
+        # Picklable copy of what evaluate() needs
+        return sorted(self.words), sorted(self.domains), self.blacklist_matcher.word_boundary
+
+
+def evaluate(payload, policy):
+    # Each stage does its text work once (see analysis.py)
+    text = payload["text"]
+    result = {
+        "matched_word": policy.blacklist_matcher.find(analysis.normalized(text), lowered=True),
+        "has_link": False,
+        "mentions": (),
+        "link_whitelisted": False,
+        "hosts": (),
+    }
+    if result["matched_word"]:
+        return result  # Deleted for the word, nothing else matters
+
+    mentions, hosts = analysis.scan(text, payload["entities"])
+    result["mentions"] = mentions
+    if hosts:
+        # Every link must point to a whitelisted domain (or a subdomain of one).
+        # Unparseable links stay in `hosts` as None; EventWriter skips them.
+        result["has_link"] = True
+        result["hosts"] = hosts
+        result["link_whitelisted"] = all(policy.domain_index.match(h) for h in hosts)
+    return result
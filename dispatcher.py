@@ -0,0 +1,211 @@
+import os
+import time
+import asyncio
+import itertools
+from pyrogram.errors import FloodWait
+from metrics import API_LATENCY
+import tracing
+
+# Priority classes, lower runs first
+PRIORITY_ACTION = 0   # Deleting spam, muting
+PRIORITY_NOTICE = 1   # Warnings and replies
+PRIORITY_LOG = 2      # Log channel, cleanup of old bot messages
+
+# Telegram allows ~30 requests/s per bot and ~20 messages/min per group
+API_GLOBAL_RATE = float(os.environ.get("API_GLOBAL_RATE", 25))
+API_CHAT_RATE = float(os.environ.get("API_CHAT_RATE", 0.33))
+API_CHAT_BURST = int(os.environ.get("API_CHAT_BURST", 5))
+API_WORKERS = int(os.environ.get("API_WORKERS", 8))
+# Give up on a call after this many FloodWaits
+MAX_FLOOD_RETRIES = 3
+# Idle per-chat buckets are dropped once there are more than this many
+MAX_CHAT_BUCKETS = 10000
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        # Seconds until a token is available (0 = take one now)
+        now = time.monotonic()
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0
+        return (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def block(self, seconds):
+        self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def idle(self):
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst and time.monotonic() >= self.blocked_until
+
+
+class Dispatcher:
+    # Central queue for outbound Telegram calls. Calls run in priority order
+    # under a global token bucket; replies and log messages additionally
+    # respect a per-chat bucket (deletions and mutes only use the global one,
+    # so a spam wave in one group is still cleaned up at full speed).
+    # FloodWait pauses the affected bucket and the call is retried.
+    def __init__(self, workers=API_WORKERS):
+        self.workers = workers
+        self._queue = asyncio.PriorityQueue()
+        self._seq = itertools.count()
+        self._global = TokenBucket(API_GLOBAL_RATE, max(1, int(API_GLOBAL_RATE)))
+        self._chats = {}
+        self._delayed = {}  # future -> timer handle of a call waiting out a rate limit or FloodWait
+        self._tasks = []
+        self.flood_waits = 0
+        self.failures = 0
+
+    def start(self):
+        if self._tasks: return
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self, timeout=10):
+        # Let queued and delayed calls finish (bounded), then stop the
+        # workers; calls still waiting fail instead of hanging their callers
+        if not self._tasks: return
+        try:
+            await asyncio.wait_for(self._drain(), timeout)
+        except asyncio.TimeoutError:
+            print(f"Dispatcher stopped with {self._queue.qsize() + len(self._delayed)} calls pending")
+        for future, handle in self._delayed.items():
+            handle.cancel()
+            _fail_stopped(future)
+        self._delayed.clear()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            _fail_stopped(self._queue.get_nowait()[6])
+            self._queue.task_done()
+
+    async def _drain(self):
+        while True:
+            await self._queue.join()
+            if not self._delayed: return
+            await asyncio.sleep(0.05)
+
+    def qsize(self):
+        return self._queue.qsize()
+
+    def submit(self, priority, chat_id, func, *args, **kwargs):
+        # Queue a call without waiting for it; returns a future with the result
+        future = asyncio.get_running_loop().create_future()
+        self._put((priority, next(self._seq), chat_id, func, args, kwargs, future, 0))
+        return future
+
+    async def call(self, priority, chat_id, func, *args, **kwargs):
+        # Traced from the caller's side, so the span includes time spent queued
+        with tracing.span(f"api.{getattr(func, '__name__', 'call')}", priority=priority):
+            return await self.submit(priority, chat_id, func, *args, **kwargs)
+
+    def send(self, priority, chat_id, func, *args, **kwargs):
+        # Fire-and-forget: failures are printed instead of raised
+        future = self.submit(priority, chat_id, func, *args, **kwargs)
+        future.add_done_callback(_report_failure)
+        return future
+
+    def _put(self, item):
+        self._queue.put_nowait(item)
+
+    def _requeue_later(self, item, delay):
+        # Keeps the worker free for other chats while this one waits
+        self._queue.task_done()
+        future = item[6]
+        self._delayed[future] = asyncio.get_running_loop().call_later(delay, self._resume, item)
+
+    def _resume(self, item):
+        del self._delayed[item[6]]
+        self._put(item)
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            if len(self._chats) >= MAX_CHAT_BUCKETS:
+                self._chats = {cid: b for cid, b in self._chats.items() if not b.idle()}
+            bucket = self._chats[chat_id] = TokenBucket(API_CHAT_RATE, API_CHAT_BURST)
+        return bucket
+
+    async def _worker(self):
+        while True:
+            item = await self._queue.get()
+            try:
+                await self._handle(item)
+            except asyncio.CancelledError:
+                # stop() gave up on this call
+                _fail_stopped(item[6])
+                raise
+
+    async def _handle(self, item):
+        priority, _, chat_id, func, args, kwargs, future, attempt = item
+        if future.cancelled():
+            self._queue.task_done()
+            return
+
+        chat_bucket = None
+        if chat_id is not None:
+            chat_bucket = self._chat_bucket(chat_id)
+            wait = chat_bucket.wait_time()
+            if priority == PRIORITY_ACTION:
+                wait = max(0, chat_bucket.blocked_until - time.monotonic())
+            if wait > 0:
+                self._requeue_later(item, wait)
+                return
+
+        wait = self._global.wait_time()
+        while wait > 0:
+            await asyncio.sleep(wait)
+            wait = self._global.wait_time()
+        self._global.take()
+        if chat_bucket and priority != PRIORITY_ACTION:
+            chat_bucket.take()
+
+        try:
+            with API_LATENCY.time(method=getattr(func, "__name__", "call")):
+                result = await func(*args, **kwargs)
+        except FloodWait as e:
+            self.flood_waits += 1
+            (chat_bucket or self._global).block(e.value)
+            if attempt < MAX_FLOOD_RETRIES:
+                self._requeue_later(item[:-1] + (attempt + 1,), e.value)
+                return
+            self.failures += 1
+            if not future.done():
+                future.set_exception(e)
+        except Exception as e:
+            self.failures += 1
+            if not future.done():
+                future.set_exception(e)
+        else:
+            if not future.done():
+                future.set_result(result)
+        self._queue.task_done()
+
+def _report_failure(future):
+    if future.cancelled():
+        return
+    error = future.exception()
+    if error:
+        print(f"Background API call failed: {error}")
+
+
+def _fail_stopped(future):
+    if not future.done():
+        future.set_exception(RuntimeError("Dispatcher stopped"))
@@ -0,0 +1,105 @@
+from urllib.parse import urlsplit
+
+# Suffixes under which anyone can register a site. Whitelisting one of these
+# must not allow every site below it, so such entries only match exactly.
+PUBLIC_SUFFIXES = {
+    "co.uk", "org.uk", "me.uk", "ac.uk", "gov.uk", "ltd.uk", "plc.uk",
+    "com.au", "net.au", "org.au", "edu.au", "gov.au",
+    "co.nz", "org.nz", "co.za", "org.za", "co.jp", "ne.jp", "or.jp",
+    "co.in", "net.in", "org.in", "co.kr", "or.kr", "co.id", "or.id",
+    "com.br", "net.br", "org.br", "com.cn", "net.cn", "org.cn",
+    "com.tr", "com.mx", "com.ar", "com.co", "com.sg", "com.my",
+    "com.hk", "com.tw", "com.ua", "com.pk", "com.ng", "com.eg",
+    "com.sa", "com.vn", "com.ph", "com.bd", "co.il", "co.th",
+    "github.io", "gitlab.io", "blogspot.com", "herokuapp.com",
+    "appspot.com", "firebaseapp.com", "web.app", "netlify.app",
+    "vercel.app", "pages.dev", "workers.dev", "azurewebsites.net",
+    "cloudfront.net", "ngrok.io", "ngrok-free.app", "glitch.me",
+    "repl.co", "onrender.com", "fly.dev",
+}
+
+_STRIP = "()[]{}<>\"'.,!?;:"
+
+
+def parse_host(url):
+    # Hostname of a link ("https://www.Example.com/x", "t.me/foo"), or None
+    url = url.strip().strip(_STRIP)
+    if not url:
+        return None
+    if "://" not in url:
+        url = "http://" + url
+    try:
+        host = urlsplit(url).hostname
+    except ValueError:
+        return None
+    if not host:
+        return None
+    host = host.rstrip(".")
+    try:
+        host = host.encode("idna").decode("ascii")
+    except UnicodeError:
+        pass
+    return host or None
+
+
+def is_public_suffix(host):
+    return "." not in host or host in PUBLIC_SUFFIXES
+
+
+class DomainIndex:
+    # Trie over reversed hostname labels: "m.youtube.com" -> com / youtube / m.
+    # A lookup walks at most one node per label, regardless of list size.
+    _COUNT = "\0"   # Entries allowing the domain and its subdomains
+    _EXACT = "\1"   # Public-suffix entries, allowing only that host
+
+    def __init__(self, domains=()):
+        self.rebuild(domains)
+
+    def rebuild(self, domains):
+        self._root = {}
+        for domain in domains:
+            self.add(domain)
+
+    def _key(self, domain):
+        host = parse_host(domain)
+        if not host:
+            return None, None
+        return host, self._EXACT if is_public_suffix(host) else self._COUNT
+
+    def add(self, domain):
+        host, key = self._key(domain)
+        if not host:
+            return
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.setdefault(label, {})
+        node[key] = node.get(key, 0) + 1
+
+    def remove(self, domain):
+        host, key = self._key(domain)
+        if not host:
+            return
+        node = self._root
+        for label in reversed(host.split(".")):
+            node = node.get(label)
+            if node is None:
+                return
+        if node.get(key, 0) > 1:
+            node[key] -= 1
+        else:
+            node.pop(key, None)
+
+    def match(self, host):
+        if not host:
+            return False
+        labels = host.lower().split(".")
+        node = self._root
+        for depth, label in enumerate(reversed(labels), 1):
+            node = node.get(label)
+            if node is None:
+                return False
+            if self._COUNT in node:
+                return True
+            if depth == len(labels) and self._EXACT in node:
+                return True
+        return False
@@ -0,0 +1,141 @@
+import os
+import time
+import asyncio
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+
+# Moderation events (delete, warn, mute, unmute) are buffered here and
+# written to MongoDB in batches: raw events to the "events" time-series
+# collection, plus $inc counters per chat and hour/day for /stats.
+
+# Events buffered before new ones are dropped
+EVENT_QUEUE_SIZE = int(os.environ.get("EVENT_QUEUE_SIZE", 10000))
+# A batch is written once it holds this many events or after this many seconds
+EVENT_BATCH_SIZE = 500
+EVENT_FLUSH_INTERVAL = float(os.environ.get("EVENT_FLUSH_INTERVAL", 5))
+
+ACTIONS = ("delete", "warn", "mute", "unmute")
+PERIODS = ("hour", "day")
+
+
+def encode_key(value):
+    # Field names can't contain "." or start with "$" (domains do, e.g. "t.me")
+    return str(value).replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def decode_key(key):
+    return key.replace("%24", "$").replace("%2E", ".").replace("%25", "%")
+
+
+def period_start(ts, period):
+    # Start of the hour/day `ts` (a UTC datetime) falls in
+    if period == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def rollup_increments(events):
+    # One $inc document per (chat_id, period, start) for a batch of events,
+    # so a batch costs one update per chat and period, not one per event
+    increments = defaultdict(Counter)
+    for event in events:
+        chat_id = event["meta"]["chat_id"]
+        action = event["meta"]["action"]
+        for period in PERIODS:
+            counts = increments[(chat_id, period, period_start(event["ts"], period))]
+            counts[f"actions.{action}"] += 1
+            if action == "delete":
+                # A deleted message is one violation, whatever followed it
+                counts[f"violations.{event['reason']}"] += 1
+                counts[f"users.{event['user_id']}"] += 1
+                for domain in event.get("domains", ()):
+                    counts[f"domains.{encode_key(domain)}"] += 1
+    return increments
+
+
+class EventWriter:
+    # record() never blocks or awaits; a background task flushes the buffer
+    # through Database.write_events().
+    def __init__(self, db):
+        self.db = db
+        self.queue = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        self._task = None
+        self._batch = []  # Batch being collected by the loop
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def __len__(self):
+        return self.queue.qsize()
+
+    def start(self):
+        if self.db.db is None or self._task: return
+        self._task = asyncio.create_task(self._run())
+
+    def record(self, chat_id, action, user_id, reason=None, domains=()):
+        if self.db.db is None: return
+        event = {
+            "ts": datetime.now(timezone.utc),
+            "meta": {"chat_id": chat_id, "action": action},
+            "user_id": user_id,
+            "reason": reason,
+        }
+        domains = sorted(d for d in domains if d)  # Unparseable links have no host
+        if domains:
+            event["domains"] = domains
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.dropped += 1
+
+    async def stop(self):
+        # Write whatever is still buffered
+        if not self._task: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._flush(self._batch + self._drain(len(self)))
+
+    def _drain(self, limit):
+        batch = []
+        while len(batch) < limit and not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+        return batch
+
+    async def _run(self):
+        while True:
+            self._batch = batch = [await self.queue.get()]
+            deadline = time.monotonic() + EVENT_FLUSH_INTERVAL
+            while len(batch) < EVENT_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+                batch.extend(self._drain(EVENT_BATCH_SIZE - len(batch)))
+            self._batch = []
+            await self._flush(batch)
+
+    async def _flush(self, batch):
+        if not batch: return
+        try:
+            await self.db.write_events(batch, rollup_increments(batch))
+            self.written += len(batch)
+        except Exception as e:
+            self.failed += len(batch)
+            print(f"Failed to write {len(batch)} moderation events: {e}")
+
+
+def merge_rollups(docs):
+    # Sums rollup documents into Counters for /stats
+    totals = {"actions": Counter(), "violations": Counter(), "users": Counter(), "domains": Counter()}
+    for doc in docs:
+        for field, counter in totals.items():
+            for key, count in doc.get(field, {}).items():
+                counter[decode_key(key)] += count
+    return totals
@@ -0,0 +1,62 @@
+import os
+import time
+from collections import OrderedDict, deque
+
+# Default flood threshold: FLOOD_LIMIT messages within FLOOD_WINDOW seconds.
+# Groups can change it with /flood; FLOOD_LIMIT=0 turns it off by default.
+FLOOD_LIMIT = int(os.environ.get("FLOOD_LIMIT", 10))
+FLOOD_WINDOW = float(os.environ.get("FLOOD_WINDOW", 10))
+# Bounds for /flood
+MAX_FLOOD_LIMIT = 100
+MAX_FLOOD_WINDOW = 300
+# Hard cap on tracked (chat, user) pairs, on top of idle eviction
+MAX_TRACKED = int(os.environ.get("FLOOD_MAX_TRACKED", 200000))
+
+
+class FloodTracker:
+    # Per-(chat, user) ring buffer of the last `limit` message times, kept in
+    # memory only. The OrderedDict is in order of last activity, so entries
+    # idle for longer than their window are dropped from the front as new
+    # messages come in and memory follows the number of active users.
+    def __init__(self, max_tracked=MAX_TRACKED):
+        self.max_tracked = max_tracked
+        self._entries = OrderedDict()  # (chat_id, user_id) -> (timestamps, window)
+        self.floods = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def record(self, chat_id, user_id, limit, window, now=None):
+        # Returns True when this message takes the user over `limit` in `window`
+        if limit <= 0:
+            return False
+        now = time.monotonic() if now is None else now
+
+        key = (chat_id, user_id)
+        entry = self._entries.get(key)
+        if entry is None or entry[0].maxlen != limit or entry[1] != window:
+            # New user or the chat's threshold changed
+            entry = (deque(maxlen=limit), window)
+            self._entries[key] = entry
+        else:
+            self._entries.move_to_end(key)
+        timestamps = entry[0]
+        timestamps.append(now)
+        flooded = len(timestamps) == limit and now - timestamps[0] <= window
+        if flooded:
+            # Start over, so a warning needs another full burst
+            timestamps.clear()
+            self.floods += 1
+        self._evict(now)
+        return flooded
+
+    def reset(self, chat_id, user_id):
+        self._entries.pop((chat_id, user_id), None)
+
+    def _evict(self, now):
+        entries = self._entries
+        while entries:
+            timestamps, window = next(iter(entries.values()))
+            if len(entries) <= self.max_tracked and timestamps and now - timestamps[-1] <= window:
+                break
+            entries.popitem(last=False)
@@ -0,0 +1,71 @@
+import json
+import asyncio
+import metrics
+
+# Seconds a readiness check may take before it counts as failed
+CHECK_TIMEOUT = 3
+
+
+class HealthServer:
+    # Small HTTP server on the bot's own event loop:
+    #   /, /healthz  liveness (the loop is answering)
+    #   /readyz      readiness (every check in `checks` passes)
+    #   /metrics     Prometheus metrics
+    def __init__(self, port, checks):
+        self.port = port
+        self.checks = checks  # name -> async function returning True when healthy
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "0.0.0.0", self.port)
+
+    async def stop(self):
+        if not self._server: return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def _run_check(self, check):
+        try:
+            return bool(await asyncio.wait_for(check(), CHECK_TIMEOUT))
+        except Exception:
+            return False
+
+    async def readiness(self):
+        results = await asyncio.gather(*(self._run_check(c) for c in self.checks.values()))
+        return dict(zip(self.checks, results))
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readline(), 5)
+            # Drain headers, we don't need them
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+                pass
+            parts = request.decode("latin-1").split()
+            method, path = (parts[0], parts[1].split("?")[0]) if len(parts) >= 2 else ("GET", "/")
+
+            if path in ("/", "/healthz"):
+                status, content_type, body = 200, "text/plain", "Bot is running"
+            elif path == "/readyz":
+                results = await self.readiness()
+                status = 200 if all(results.values()) else 503
+                content_type, body = "application/json", json.dumps(results)
+            elif path == "/metrics":
+                status, content_type, body = 200, "text/plain; version=0.0.4", metrics.render()
+            else:
+                status, content_type, body = 404, "text/plain", "Not Found"
+
+            payload = body.encode()
+            reason = {200: "OK", 404: "Not Found", 503: "Service Unavailable"}[status]
+            head = (
+                f"HTTP/1.1 {status} {reason}\r\n"
+                f"Content-Type: {content_type}\r\n"
+                f"Content-Length: {len(payload)}\r\n"
+                "Connection: close\r\n\r\n"
+            )
+            writer.write(head.encode() + (b"" if method == "HEAD" else payload))
+            await writer.drain()
+        except Exception:
+            pass
+        finally:
+            writer.close()
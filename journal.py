@@ -0,0 +1,239 @@
+import json
+import time
+import uuid
+import sqlite3
+from collections import OrderedDict
+from datetime import timezone
+
+# Warning counts live here: in memory for reads, in a local SQLite file for
+# durability, and (when MongoDB is configured) copied to the "warnings"
+# collection in the background by Database. A strike then costs a local
+# disk write instead of a Mongo round trip, and still counts while Mongo
+# is slow, down, or not configured at all.
+#
+# Several instances can share the collection, so what goes to Mongo is
+# this journal's changes (strikes to add, notices to append, a reset), not
+# its count; Mongo sums them. `count` and `msg_ids` are this instance's
+# view of the shared state, refreshed from Mongo after each flush.
+#
+# Every change to a user's warnings bumps their `seq`. Mongo remembers the
+# last seq it took from each journal (by `journal_id`) and skips older
+# ones, so replaying the journal after an outage (or twice) is harmless.
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS warnings (
+    chat_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    msg_ids TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    seq INTEGER NOT NULL,
+    flushed_seq INTEGER NOT NULL,
+    delta INTEGER NOT NULL,
+    new_msg_ids TEXT NOT NULL,
+    reset_seq INTEGER NOT NULL,
+    PRIMARY KEY (chat_id, user_id)
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+"""
+
+
+class _Warning:
+    __slots__ = ("count", "msg_ids", "updated_at", "seq", "flushed_seq", "delta", "new_msg_ids", "reset_seq")
+
+    def __init__(self, count=0, msg_ids=None, updated_at=0.0, seq=0, flushed_seq=0,
+                 delta=0, new_msg_ids=None, reset_seq=0):
+        self.count = count
+        self.msg_ids = msg_ids or []
+        self.updated_at = updated_at
+        self.seq = seq
+        self.flushed_seq = flushed_seq
+        # Not in Mongo yet: strikes, notice IDs, and whether a reset comes first
+        self.delta = delta
+        self.new_msg_ids = new_msg_ids or []
+        self.reset_seq = reset_seq
+
+    def reset_pending(self):
+        return self.reset_seq > self.flushed_seq
+
+    def values(self, key):
+        return (*key, self.count, json.dumps(self.msg_ids), self.updated_at, self.seq, self.flushed_seq,
+                self.delta, json.dumps(self.new_msg_ids), self.reset_seq)
+
+
+class WarningJournal:
+    # `ttl` matches the Mongo TTL index: warnings untouched for that long
+    # read as zero. With write_behind off (no Mongo) nothing is left pending.
+    def __init__(self, path, ttl, max_msg_ids, write_behind=True):
+        self.path = path
+        self.ttl = ttl
+        self.max_msg_ids = max_msg_ids
+        self.write_behind = write_behind
+        self._conn = sqlite3.connect(path)
+        if path != ":memory:":
+            # Survives a crash of the bot (not of the machine) without an fsync per strike
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        # Names this journal's changes in Mongo; kept with the file so a
+        # restart replays under the same name
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'journal_id'").fetchone()
+        if row is None:
+            with self._conn:
+                self._conn.execute("INSERT INTO meta VALUES ('journal_id', ?)", (uuid.uuid4().hex,))
+            row = self._conn.execute("SELECT value FROM meta WHERE key = 'journal_id'").fetchone()
+        self.id = row[0]
+        self._rows = {}  # (chat_id, user_id) -> _Warning
+        self._pending = OrderedDict()  # keys not yet in Mongo -> time of the oldest unflushed change
+        for chat_id, user_id, count, msg_ids, updated_at, seq, flushed_seq, delta, new_msg_ids, reset_seq in self._conn.execute("SELECT * FROM warnings"):
+            key = (chat_id, user_id)
+            self._rows[key] = _Warning(count, json.loads(msg_ids), updated_at, seq, flushed_seq,
+                                       delta, json.loads(new_msg_ids), reset_seq)
+            if seq > flushed_seq:
+                self._pending[key] = updated_at
+
+    def __len__(self):
+        return len(self._rows)
+
+    def close(self):
+        self._conn.close()
+
+    # --- Reads (memory only) ---
+    def _live(self, key):
+        row = self._rows.get(key)
+        if row is None or time.time() - row.updated_at > self.ttl:
+            return None
+        return row
+
+    def count(self, chat_id, user_id):
+        row = self._live((chat_id, user_id))
+        return row.count if row else 0
+
+    def message_ids(self, chat_id, user_id):
+        row = self._live((chat_id, user_id))
+        return list(row.msg_ids) if row else []
+
+    # --- Writes (memory + SQLite) ---
+    def add_warning(self, chat_id, user_id, message_id=None):
+        # Returns the new count
+        key = (chat_id, user_id)
+        row = self._live(key)
+        if row is None:
+            # New, or expired (unflushed expired strikes are dropped too):
+            # start over, keeping seq increasing
+            old = self._rows.get(key)
+            row = self._rows[key] = _Warning(seq=old.seq if old else 0, flushed_seq=old.flushed_seq if old else 0)
+        row.count += 1
+        row.delta += 1
+        if message_id:
+            self._append(row, message_id)
+        self._save(key, row)
+        return row.count
+
+    def add_message(self, chat_id, user_id, message_id):
+        row = self._live((chat_id, user_id))
+        if row is None: return
+        self._append(row, message_id)
+        self._save((chat_id, user_id), row)
+
+    def reset(self, chat_id, user_id):
+        # Also clears the strikes other instances counted, so it is sent
+        # even when this instance has nothing for the user
+        key = (chat_id, user_id)
+        row = self._rows.get(key)
+        if row is None:
+            row = self._rows[key] = _Warning()
+        row.count = row.delta = 0
+        row.msg_ids = []
+        row.new_msg_ids = []
+        row.reset_seq = row.seq + 1
+        self._save(key, row)
+
+    def _append(self, row, message_id):
+        row.msg_ids = (row.msg_ids + [message_id])[-self.max_msg_ids:]
+        row.new_msg_ids = (row.new_msg_ids + [message_id])[-self.max_msg_ids:]
+
+    def _save(self, key, row):
+        row.updated_at = time.time()
+        row.seq += 1
+        if not self.write_behind:
+            row.flushed_seq = row.seq
+            row.delta = 0
+            row.new_msg_ids = []
+        elif key not in self._pending:
+            self._pending[key] = row.updated_at
+        with self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", row.values(key))
+
+    # --- Replication (used by Database) ---
+    def pending(self, limit):
+        # Oldest unflushed changes first:
+        # (chat_id, user_id, strikes to add, notice IDs to append, reset first?, updated_at, seq)
+        batch = []
+        for key in self._pending:
+            row = self._rows[key]
+            batch.append((*key, row.delta, list(row.new_msg_ids), row.reset_pending(), row.updated_at, row.seq))
+            if len(batch) >= limit:
+                break
+        return batch
+
+    def mark_flushed(self, batch):
+        rows = []
+        for chat_id, user_id, delta, msg_ids, reset, _, seq in batch:
+            key = (chat_id, user_id)
+            row = self._rows.get(key)
+            if row is None: continue
+            if row.reset_seq <= seq:
+                # Keep only what changed while the batch was being written
+                # (a reset since then already cleared it all)
+                row.delta = max(0, row.delta - delta)
+                row.new_msg_ids = row.new_msg_ids[len(msg_ids):]
+            row.flushed_seq = max(row.flushed_seq, seq)
+            rows.append(row.values(key))
+            if row.flushed_seq >= row.seq:
+                self._pending.pop(key, None)
+            elif key in self._pending:
+                self._pending[key] = row.updated_at
+                self._pending.move_to_end(key)
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def refresh(self, docs):
+        # Adopts the shared state from Mongo (other instances' strikes and
+        # resets), with this journal's unflushed changes on top
+        rows = []
+        for doc in docs:
+            key = (doc["chat_id"], doc["user_id"])
+            row = self._rows.get(key)
+            if row is None:
+                row = self._rows[key] = _Warning()
+            elif row.reset_pending():
+                continue
+            updated_at = doc.get("updated_at")
+            # Mongo returns naive UTC datetimes
+            updated_at = updated_at.replace(tzinfo=timezone.utc).timestamp() if updated_at else time.time()
+            row.count = doc.get("count", 0) + row.delta
+            row.msg_ids = (list(doc.get("msg_ids", [])) + row.new_msg_ids)[-self.max_msg_ids:]
+            row.updated_at = max(row.updated_at, updated_at)
+            rows.append(row.values(key))
+        with self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO warnings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        return len(rows)
+
+    def prune(self):
+        # Drops expired warnings that Mongo already has
+        cutoff = time.time() - self.ttl
+        expired = [key for key, row in self._rows.items() if row.updated_at < cutoff and row.flushed_seq >= row.seq]
+        for key in expired:
+            del self._rows[key]
+        with self._conn:
+            self._conn.executemany("DELETE FROM warnings WHERE chat_id = ? AND user_id = ?", expired)
+        return len(expired)
+
+    def lag(self):
+        # Seconds since the oldest change Mongo doesn't have yet (0 when in sync)
+        if not self._pending: return 0.0
+        return time.time() - next(iter(self._pending.values()))
+
+    def backlog(self):
+        return len(self._pending)
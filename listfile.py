@@ -0,0 +1,132 @@
+import io
+import csv
+import json
+from domains import parse_host
+
+# Files read by /import and written by /export:
+#   .json  {"word": [...], "domain": [...], "user": [...]}
+#   .csv   kind,value rows (the header row is optional)
+#   .txt   one value per line for a single list, chosen in the command
+#          (e.g. "/import blacklist"); lines starting with # are skipped
+
+FORMATS = ("csv", "json", "txt")
+# Largest file /import accepts (bytes) and most entries it adds at once
+MAX_IMPORT_SIZE = 1024 * 1024
+MAX_IMPORT_ENTRIES = 10000
+MAX_VALUE_LENGTH = 100
+
+# Names accepted for each list, in files and in commands
+KINDS = {
+    "word": "word", "words": "word", "blacklist": "word",
+    "domain": "domain", "domains": "domain", "whitelist": "domain",
+    "user": "user", "users": "user",
+}
+
+
+class ImportResult:
+    def __init__(self):
+        self.entries = []    # unique (kind, value) pairs, in file order
+        self.duplicates = 0
+        self.invalid = []    # rejected raw values, for the summary
+
+
+def file_format(filename):
+    # "words.CSV" -> "csv"; None for anything else
+    ext = filename.rsplit(".", 1)[-1].lower() if "." in filename else ""
+    return ext if ext in FORMATS else None
+
+
+def normalize(kind, value):
+    # The value as it is stored, or None if it isn't valid for `kind`
+    value = str(value).strip()
+    if not value or len(value) > MAX_VALUE_LENGTH:
+        return None
+    if kind == "word":
+        # Same as /blacklist: one lowercase token, not just wildcards
+        value = value.lower()
+        if any(c.isspace() for c in value) or not value.strip("*"):
+            return None
+        return value
+    if kind == "domain":
+        host = parse_host(value)
+        return host if host and "." in host else None
+    if kind == "user":
+        return int(value) if value.isdigit() else None
+    return None
+
+
+def _rows(data, fmt, kind):
+    # Yields (kind name, raw value) pairs from the file
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise ValueError("The file is not UTF-8 text.")
+
+    if fmt == "json":
+        try:
+            lists = json.loads(text)
+        except ValueError as e:
+            raise ValueError(f"Invalid JSON: {e}")
+        if not isinstance(lists, dict) or not all(isinstance(v, list) for v in lists.values()):
+            raise ValueError('Expected a JSON object of lists, e.g. {"word": ["casino"], "domain": ["youtube.com"]}.')
+        for name, values in lists.items():
+            for value in values:
+                yield name, value
+    elif fmt == "csv":
+        for row in csv.reader(io.StringIO(text)):
+            if not row or not "".join(row).strip():
+                continue
+            if len(row) < 2:
+                if kind is None:
+                    raise ValueError("Each CSV row needs a kind and a value, e.g. `word,casino`.")
+                row = [kind, row[0]]
+            if row[0].strip().lower() == "kind":
+                continue  # Header
+            yield row[0], row[1]
+    else:
+        if kind is None:
+            raise ValueError("Say which list a .txt file is for, e.g. `/import blacklist`.")
+        for line in text.splitlines():
+            line = line.strip()
+            if line and not line.startswith("#"):
+                yield kind, line
+
+
+def parse(data, fmt, kind=None):
+    # Validates and dedups the file; raises ValueError if it can't be read at all
+    result = ImportResult()
+    seen = set()
+    for name, raw in _rows(data, fmt, kind):
+        entry_kind = KINDS.get(str(name).strip().lower())
+        value = normalize(entry_kind, raw) if entry_kind else None
+        if value is None:
+            result.invalid.append(f"{name}: {raw}")
+            continue
+        if kind and entry_kind != kind:
+            continue  # Only the list chosen in the command
+        if (entry_kind, value) in seen:
+            result.duplicates += 1
+            continue
+        seen.add((entry_kind, value))
+        result.entries.append((entry_kind, value))
+        if len(result.entries) > MAX_IMPORT_ENTRIES:
+            raise ValueError(f"Too many entries, the limit is {MAX_IMPORT_ENTRIES} per file.")
+    return result
+
+
+def export(lists, fmt, kind=None):
+    # `lists` is {kind: [values]}; returns the file contents as bytes
+    if kind:
+        lists = {kind: lists.get(kind, [])}
+    if fmt == "json":
+        return json.dumps(lists, indent=2, ensure_ascii=False).encode()
+    if fmt == "csv":
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["kind", "value"])
+        for name, values in lists.items():
+            writer.writerows((name, value) for value in values)
+        return out.getvalue().encode()
+    if not kind:
+        raise ValueError("Say which list to export as .txt, e.g. `/export txt blacklist`.")
+    return "".join(f"{value}\n" for value in lists[kind]).encode()
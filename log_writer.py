@@ -0,0 +1,123 @@
+import os
+import time
+import asyncio
+from collections import Counter
+from dispatcher import PRIORITY_LOG
+
+# Events waiting to be sent; anything beyond this is dropped and summarized
+LOG_QUEUE_SIZE = int(os.environ.get("LOG_QUEUE_SIZE", 1000))
+# A digest is sent once it holds this many events...
+LOG_BATCH_SIZE = int(os.environ.get("LOG_BATCH_SIZE", 10))
+# ...or the oldest event in it has waited this long (seconds)
+LOG_BATCH_WINDOW = float(os.environ.get("LOG_BATCH_WINDOW", 5))
+# Minimum gap between two messages to the log channel (seconds)
+LOG_SEND_INTERVAL = float(os.environ.get("LOG_SEND_INTERVAL", 3))
+# Telegram rejects messages over 4096 characters, leave room for the footer
+MAX_DIGEST_CHARS = 3800
+SEPARATOR = "\n\n"
+
+
+class LogWriter:
+    # Background pipeline for the log channel: log() never blocks, events are
+    # grouped into digest messages and sent at a rate the channel can take.
+    def __init__(self, chat_id, api):
+        self.chat_id = chat_id
+        self.api = api
+        self.queue = asyncio.Queue(maxsize=LOG_QUEUE_SIZE)
+        self._client = None
+        self._task = None
+        self._batch = []           # Digest being collected by the loop
+        self._last_send = 0.0
+        self._dropped = Counter()  # action -> events dropped since last digest
+        self.sent_messages = 0
+        self.sent_events = 0
+        self.dropped_events = 0
+        self.failed_messages = 0
+
+    @property
+    def enabled(self):
+        return self.chat_id != 0
+
+    def start(self, client):
+        if not self.enabled or self._task: return
+        self._client = client
+        self._task = asyncio.create_task(self._run())
+
+    def log(self, action, details):
+        if not self.enabled: return
+        text = f"**{action}**\n{details}"
+        if len(text) > MAX_DIGEST_CHARS:
+            text = text[:MAX_DIGEST_CHARS - 3] + "..."
+        try:
+            self.queue.put_nowait(text)
+        except asyncio.QueueFull:
+            self._dropped[action] += 1
+            self.dropped_events += 1
+
+    async def stop(self):
+        # Stop the loop and send whatever is still queued
+        if not self._task: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        pending = self._batch
+        while not self.queue.empty():
+            pending.append(self.queue.get_nowait())
+        for batch in self._split(pending) or [[]]:
+            await self._send(batch)
+
+    async def _run(self):
+        while True:
+            self._batch = [await self.queue.get()]
+            deadline = time.monotonic() + LOG_BATCH_WINDOW
+            while len(self._batch) < LOG_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            for batch in self._split(self._batch):
+                await self._send(batch)
+            self._batch = []
+
+    def _split(self, events):
+        # Pack events into as few digests as fit in one message each
+        batches = []
+        size = 0
+        for text in events:
+            if batches and size + len(SEPARATOR) + len(text) <= MAX_DIGEST_CHARS:
+                batches[-1].append(text)
+                size += len(SEPARATOR) + len(text)
+            else:
+                batches.append([text])
+                size = len(text)
+        return batches
+
+    def _drop_summary(self):
+        if not self._dropped: return ""
+        total = sum(self._dropped.values())
+        kinds = ", ".join(f"{action} ×{count}" for action, count in self._dropped.most_common())
+        self._dropped.clear()
+        return f"⚠️ _{total} more events not logged (queue full): {kinds}_"
+
+    async def _send(self, batch):
+        summary = self._drop_summary()
+        parts = batch + [summary] if summary else batch
+        if not parts: return
+        text = SEPARATOR.join(parts)
+        # Respect the channel's send rate
+        await asyncio.sleep(max(0, self._last_send + LOG_SEND_INTERVAL - time.monotonic()))
+        self._last_send = time.monotonic()
+        try:
+            # FloodWait is retried by the dispatcher
+            await self.api.call(PRIORITY_LOG, self.chat_id, self._client.send_message, self.chat_id, text, disable_web_page_preview=True)
+            self.sent_messages += 1
+            self.sent_events += len(batch)
+        except Exception as e:
+            print(f"Failed to log action: {e}")
+            self.failed_messages += 1
@@ -0,0 +1,163 @@
+import re
+from collections import deque
+
+# Aho-Corasick matcher for blacklisted words.
+# All terms are found in a single pass over the (lowercased) text.
+# A "*" inside a term matches any run of letters/digits, e.g. "cas*no".
+# In word-boundary mode a term only matches as a whole word.
+
+WILDCARD = "*"
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+class BlacklistMatcher:
+    def __init__(self, words=(), word_boundary=False):
+        self.word_boundary = word_boundary
+        self.rebuild(words)
+
+    def rebuild(self, words):
+        # Trie: per-state transitions, failure links and the anchors ending there
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [set()]
+        self._anchors = {}   # anchor -> set of terms using it
+        self._patterns = {}  # term -> (anchor, regex or None)
+        self._dirty = False
+        for word in words:
+            self.add(word)
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def __contains__(self, term):
+        return term.lower() in self._patterns
+
+    def add(self, term):
+        term = term.lower()
+        if term in self._patterns:
+            return
+        anchor, regex = self._compile(term)
+        if not anchor:
+            return  # Only wildcards, would match everything
+
+        state = 0
+        for ch in anchor:
+            nxt = self._goto[state].get(ch)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append(set())
+                self._goto[state][ch] = nxt
+            state = nxt
+        self._out[state].add(anchor)
+        self._anchors.setdefault(anchor, set()).add(term)
+        self._patterns[term] = (anchor, regex)
+        # New states can become failure targets of existing ones
+        self._dirty = True
+
+    def remove(self, term):
+        term = term.lower()
+        entry = self._patterns.pop(term, None)
+        if entry is None:
+            return
+        anchor = entry[0]
+        terms = self._anchors[anchor]
+        terms.discard(term)
+        if terms:
+            return
+        del self._anchors[anchor]
+        # Leave the states in place, just stop reporting the anchor
+        state = 0
+        for ch in anchor:
+            state = self._goto[state][ch]
+        self._out[state].discard(anchor)
+
+    def _compile(self, term):
+        parts = term.split(WILDCARD)
+        if len(parts) == 1 and not self.word_boundary:
+            return term, None
+        anchor = max(parts, key=len)
+        if len(parts) == 1:
+            # Plain word, boundaries are checked around the hit itself
+            return anchor, None
+        body = r"\w*".join(re.escape(p) for p in parts)
+        if self.word_boundary:
+            body = rf"(?<!\w){body}(?!\w)"
+        return anchor, re.compile(body)
+
+    def _build_links(self):
+        queue = deque()
+        for nxt in self._goto[0].values():
+            self._fail[nxt] = 0
+            queue.append(nxt)
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in self._goto[state].items():
+                queue.append(nxt)
+                f = self._fail[state]
+                while f and ch not in self._goto[f]:
+                    f = self._fail[f]
+                self._fail[nxt] = self._goto[f].get(ch, 0)
+        self._dirty = False
+
+    def _scan(self, text):
+        # Yields (anchor, end) for every anchor occurrence in one pass
+        if self._dirty:
+            self._build_links()
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            s = state
+            while s:
+                for anchor in out[s]:
+                    yield anchor, i + 1
+                s = fail[s]
+
+    def _bounded(self, text, start, end):
+        if start > 0 and _is_word_char(text[start - 1]):
+            return False
+        if end < len(text) and _is_word_char(text[end]):
+            return False
+        return True
+
+    def _iter_hits(self, text, lowered):
+        if not self._patterns or not text:
+            return
+        if not lowered:
+            text = text.lower()
+        reported = set()
+        verified = set()
+        for anchor, end in self._scan(text):
+            for term in self._anchors.get(anchor, ()):
+                if term in reported:
+                    continue
+                regex = self._patterns[term][1]
+                if regex is not None:
+                    # Wildcard terms are verified once, on their first anchor hit
+                    if term in verified:
+                        continue
+                    verified.add(term)
+                    matched = regex.search(text) is not None
+                elif self.word_boundary:
+                    matched = self._bounded(text, end - len(anchor), end)
+                else:
+                    matched = True
+                if matched:
+                    reported.add(term)
+                    yield term
+
+    # lowered=True: `text` is already lowercase (e.g. analysis.normalized())
+    def find_all(self, text, lowered=False):
+        # Every matching term, in order of first appearance
+        return list(self._iter_hits(text, lowered))
+
+    def find(self, text, lowered=False):
+        # First matching term or None
+        return next(self._iter_hits(text, lowered), None)
@@ -0,0 +1,156 @@
+import time
+from contextlib import contextmanager
+
+# Minimal Prometheus-style metrics, rendered in the text exposition format.
+# Kept dependency-free on purpose: the bot only needs counters, gauges
+# and histograms for its /metrics page.
+
+_registry = []
+
+
+def _format_labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        _registry.append(self)
+
+    def _key(self, labels):
+        return tuple(labels.get(n, "") for n in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(self._key(labels), 0)
+
+    def _samples(self):
+        for key, value in self._values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class Gauge(_Metric):
+    # Either set() directly or computed at scrape time by `callback`, which
+    # returns a number or a {label_values_tuple: number} dict
+    kind = "gauge"
+
+    def __init__(self, name, documentation, labelnames=(), callback=None):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self.callback = callback
+
+    def set(self, value, **labels):
+        self._values[self._key(labels)] = value
+
+    def _samples(self):
+        values = self._values
+        if self.callback:
+            result = self.callback()
+            values = result if isinstance(result, dict) else {(): result}
+        for key, value in values.items():
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {value}"
+
+
+class CallbackCounter(Gauge):
+    # Counter whose value is read at scrape time from a counter kept elsewhere
+    kind = "counter"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+    DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # key -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        series = self._series.get(key)
+        if series is None:
+            series = self._series[key] = [0] * (len(self.buckets) + 2)
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+                break
+        series[-2] += value
+        series[-1] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self):
+        for key, series in self._series.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                yield f"{self.name}_bucket{labels} {cumulative}"
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            yield f"{self.name}_bucket{labels} {series[-1]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {series[-2]}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {series[-1]}"
+
+
+def render():
+    return "\n".join(metric.render() for metric in _registry) + "\n"
+
+
+# --- Bot metrics ---
+MESSAGES = Counter("bot_messages_total", "Group messages handled")
+VERDICTS = Counter("bot_verdicts_total", "Moderation outcome per message", ["verdict"])
+DEGRADED_SKIPS = Counter("bot_degraded_skipped_warnings_total", "Warnings skipped in delete-only mode")
+FAST_PATH = Counter("bot_fast_path_messages_total", "Messages passed on content checks alone, without admin, whitelist or member lookups")
+HANDLER_LATENCY = Histogram("bot_handler_seconds", "Time spent in update handlers", ["handler"])
+DB_LATENCY = Histogram("bot_db_seconds", "MongoDB call latency", ["op"])
+API_LATENCY = Histogram("bot_api_seconds", "Telegram API call latency (excluding queueing)", ["method"])
+
+_caches = {}
+
+
+def _cache_stat(stat):
+    return lambda: {(name,): cache.stats()[stat] for name, cache in _caches.items()}
+
+
+CACHE_HITS = CallbackCounter("bot_cache_hits_total", "Cache hits", ["cache"], callback=_cache_stat("hits"))
+CACHE_MISSES = CallbackCounter("bot_cache_misses_total", "Cache misses", ["cache"], callback=_cache_stat("misses"))
+CACHE_EVICTIONS = CallbackCounter("bot_cache_evictions_total", "Cache evictions", ["cache"], callback=_cache_stat("evictions"))
+CACHE_SIZE = Gauge("bot_cache_entries", "Entries held in cache", ["cache"], callback=_cache_stat("size"))
+
+
+def register_cache(name, cache):
+    # `cache` must have a stats() method returning hits/misses/evictions/size
+    _caches[name] = cache
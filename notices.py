@@ -0,0 +1,122 @@
+import os
+import time
+import asyncio
+from collections import OrderedDict
+from dispatcher import PRIORITY_NOTICE
+
+# A user's warning notice is reused (edited in place) for violations within
+# this many seconds of it being posted; it is deleted after twice as long,
+# so its last edit stays readable for at least this long
+NOTICE_WINDOW = float(os.environ.get("WARNING_NOTICE_WINDOW", 60))
+# Edits arriving closer together than this are merged into one (seconds)
+NOTICE_EDIT_DELAY = 1.0
+
+
+class _Notice:
+    __slots__ = ("created", "message", "text", "shown", "edit_task")
+
+    def __init__(self, text):
+        self.created = time.monotonic()
+        self.message = None  # Set once the reply has been sent
+        self.text = text     # Latest text
+        self.shown = text    # Text the message has now
+        self.edit_task = None
+
+
+class WarningNotices:
+    # One warning message per (chat, user): the first violation replies, later
+    # ones within the window only update the text, and the edits are
+    # coalesced, so a burst of violations costs one reply and about one edit.
+    def __init__(self, api, scheduler, window=NOTICE_WINDOW):
+        self.api = api
+        self.scheduler = scheduler
+        self.window = window
+        self._notices = OrderedDict()  # (chat_id, user_id) -> _Notice, oldest first
+        self._pending = set()  # Replies being sent, edits and on_sent calls
+        self.sent = 0
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._notices)
+
+    def show(self, message, user_id, text, on_sent=None):
+        # Doesn't wait for Telegram: a new notice is sent through the
+        # dispatcher and `on_sent(message_id)` is awaited once it is out.
+        # Updates to an existing notice don't call on_sent.
+        chat_id = message.chat.id
+        key = (chat_id, user_id)
+        self._expire()
+        notice = self._notices.get(key)
+        if notice is not None:
+            notice.text = text
+            self.coalesced += 1
+            if notice.message is not None:
+                self._schedule_edit(chat_id, notice)
+            # else: the reply is still being sent, _sent() picks the text up
+            return
+
+        notice = self._notices[key] = _Notice(text)
+        future = self.api.send(PRIORITY_NOTICE, chat_id, message.reply, text)
+        future.add_done_callback(lambda f: self._sent(key, notice, f, on_sent))
+        self._track(future)
+
+    async def stop(self):
+        # Lets pending replies and edits go out before the dispatcher stops
+        while self._pending:
+            await asyncio.gather(*self._pending, return_exceptions=True)
+
+    def _track(self, pending):
+        self._pending.add(pending)
+        pending.add_done_callback(self._pending.discard)
+
+    def _sent(self, key, notice, future, on_sent):
+        if future.cancelled() or future.exception():
+            # The dispatcher has printed why; the next violation tries again
+            if self._notices.get(key) is notice:
+                del self._notices[key]
+            return
+        chat_id = key[0]
+        notice.message = future.result()
+        self.sent += 1
+        self.scheduler.schedule(chat_id, notice.message.id, self.window * 2)
+        if notice.text != notice.shown:
+            self._schedule_edit(chat_id, notice)
+        if on_sent is not None:
+            self._track(asyncio.ensure_future(self._call(on_sent, notice.message.id)))
+
+    async def _call(self, on_sent, message_id):
+        try:
+            await on_sent(message_id)
+        except Exception as e:
+            print(f"Failed to record warning notice: {e}")
+
+    def forget(self, chat_id, user_id):
+        # The next violation gets a new notice (e.g. after a mute)
+        notice = self._notices.pop((chat_id, user_id), None)
+        if notice and notice.edit_task:
+            notice.edit_task.cancel()
+
+    def _expire(self):
+        now = time.monotonic()
+        while self._notices:
+            notice = next(iter(self._notices.values()))
+            if now - notice.created <= self.window:
+                break
+            self._notices.popitem(last=False)
+
+    def _schedule_edit(self, chat_id, notice):
+        if notice.edit_task is None:
+            notice.edit_task = asyncio.create_task(self._edit(chat_id, notice))
+            self._track(notice.edit_task)
+
+    async def _edit(self, chat_id, notice):
+        await asyncio.sleep(NOTICE_EDIT_DELAY)
+        notice.edit_task = None
+        text = notice.text
+        if text == notice.shown:
+            return
+        try:
+            await self.api.call(PRIORITY_NOTICE, chat_id, notice.message.edit_text, text)
+            notice.shown = text
+        except Exception as e:
+            print(f"Failed to update warning notice: {e}")
@@ -0,0 +1,94 @@
+import time
+import heapq
+import asyncio
+from collections import defaultdict
+from dispatcher import PRIORITY_LOG
+
+# Telegram accepts at most 100 message IDs per delete_messages call
+DELETE_BATCH_LIMIT = 100
+
+
+class DeleteScheduler:
+    # One task for all pending auto-deletions. Only (due_at, chat_id, message_id)
+    # is kept, entries are persisted so they survive restarts, and everything
+    # due in the same chat is removed with a single delete_messages call.
+    def __init__(self, db, api):
+        self.db = db
+        self.api = api
+        self._heap = []     # (due_at, chat_id, message_id), due_at is a unix timestamp
+        self._unsaved = []  # Scheduled but not yet persisted
+        self._wakeup = asyncio.Event()
+        self._client = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def load(self):
+        try:
+            entries = await self.db.get_scheduled_deletes()
+        except Exception as e:
+            # MongoDB down at startup: those messages stay up, their entries expire on their own
+            print(f"Failed to load scheduled deletes: {e}")
+            return
+        for entry in entries:
+            heapq.heappush(self._heap, entry)
+
+    def start(self, client):
+        if self._task: return
+        self._client = client
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if not self._task: return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._persist()
+
+    def schedule(self, chat_id, message_id, delay):
+        entry = (time.time() + delay, chat_id, message_id)
+        heapq.heappush(self._heap, entry)
+        self._unsaved.append(entry)
+        self._wakeup.set()
+
+    async def _persist(self):
+        if not self._unsaved: return
+        entries, self._unsaved = self._unsaved, []
+        try:
+            await self.db.add_scheduled_deletes(entries)
+        except Exception as e:
+            print(f"Failed to persist scheduled deletes: {e}")
+
+    async def _run(self):
+        while True:
+            self._wakeup.clear()
+            await self._persist()
+            await self._fire_due()
+            timeout = self._heap[0][0] - time.time() if self._heap else None
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _fire_due(self):
+        now = time.time()
+        due = defaultdict(list)
+        while self._heap and self._heap[0][0] <= now:
+            _, chat_id, message_id = heapq.heappop(self._heap)
+            due[chat_id].append(message_id)
+
+        for chat_id, message_ids in due.items():
+            for i in range(0, len(message_ids), DELETE_BATCH_LIMIT):
+                try:
+                    await self.api.call(PRIORITY_LOG, chat_id, self._client.delete_messages, chat_id, message_ids[i:i + DELETE_BATCH_LIMIT])
+                except Exception as e:
+                    # Already deleted or no rights anymore, nothing to retry
+                    print(f"Failed to auto-delete messages in {chat_id}: {e}")
+            try:
+                await self.db.remove_scheduled_deletes(chat_id, message_ids)
+            except Exception as e:
+                print(f"Failed to clear scheduled deletes: {e}")
@@ -0,0 +1,211 @@
+import io
+import os
+import json
+import time
+import random
+import asyncio
+import contextvars
+from contextlib import contextmanager
+
+# Share of messages traced, 0 disables tracing (0.01 = 1 in 100)
+TRACE_SAMPLE_RATE = float(os.environ.get("TRACE_SAMPLE_RATE", 0))
+# Where finished spans go: a local JSONL file and/or an OTLP/HTTP collector
+# (e.g. http://localhost:4318/v1/traces)
+TRACE_FILE = os.environ.get("TRACE_FILE", "")
+TRACE_OTLP_ENDPOINT = os.environ.get("TRACE_OTLP_ENDPOINT", "")
+TRACE_EXPORT_INTERVAL = 5
+# Spans kept in memory waiting for export; more than this are dropped
+MAX_PENDING_SPANS = 20000
+SERVICE_NAME = "telegram-link-bot"
+
+_current = contextvars.ContextVar("current_span", default=None)
+_pending = []
+_exporter = None
+dropped_spans = 0
+
+
+class Span:
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "start", "end", "attributes")
+
+    def __init__(self, trace_id, parent_id, name, attributes):
+        self.trace_id = trace_id
+        self.span_id = random.getrandbits(64)
+        self.parent_id = parent_id
+        self.name = name
+        self.start = time.time_ns()
+        self.end = None
+        self.attributes = attributes
+
+    def to_dict(self):
+        return {
+            "trace_id": f"{self.trace_id:032x}",
+            "span_id": f"{self.span_id:016x}",
+            "parent_id": f"{self.parent_id:016x}" if self.parent_id else None,
+            "name": self.name,
+            "start_ns": self.start,
+            "duration_ms": round((self.end - self.start) / 1e6, 3),
+            "attributes": self.attributes,
+        }
+
+
+def enabled():
+    return TRACE_SAMPLE_RATE > 0 and bool(TRACE_FILE or TRACE_OTLP_ENDPOINT)
+
+
+@contextmanager
+def _record(trace_id, parent_id, name, attributes):
+    span = Span(trace_id, parent_id, name, attributes)
+    token = _current.set(span)
+    try:
+        yield span
+    finally:
+        span.end = time.time_ns()
+        _current.reset(token)
+        _finish(span)
+
+
+@contextmanager
+def trace(name, **attributes):
+    # Root span, sampled with TRACE_SAMPLE_RATE. Yields None when not sampled.
+    if not enabled() or random.random() >= TRACE_SAMPLE_RATE:
+        yield None
+        return
+    with _record(random.getrandbits(128), None, name, attributes) as span:
+        yield span
+
+
+@contextmanager
+def span(name, **attributes):
+    # Child of the current span; free when the message isn't being traced
+    parent = _current.get()
+    if parent is None:
+        yield None
+        return
+    with _record(parent.trace_id, parent.span_id, name, attributes) as child:
+        yield child
+
+
+def _finish(span):
+    global dropped_spans
+    if len(_pending) >= MAX_PENDING_SPANS:
+        dropped_spans += 1
+        return
+    _pending.append(span)
+
+
+# --- Export ---
+def start_exporter():
+    global _exporter
+    if not enabled() or _exporter: return
+    _exporter = asyncio.create_task(_export_loop())
+
+
+async def stop_exporter():
+    global _exporter
+    if not _exporter: return
+    _exporter.cancel()
+    try:
+        await _exporter
+    except asyncio.CancelledError:
+        pass
+    _exporter = None
+    await flush()
+
+
+async def _export_loop():
+    while True:
+        await asyncio.sleep(TRACE_EXPORT_INTERVAL)
+        await flush()
+
+
+async def flush():
+    if not _pending: return
+    batch = _pending[:]
+    del _pending[:]
+    try:
+        # File and network I/O stay off the event loop
+        await asyncio.get_running_loop().run_in_executor(None, _export, batch)
+    except Exception as e:
+        print(f"Failed to export traces: {e}")
+
+
+def _export(batch):
+    if TRACE_FILE:
+        with open(TRACE_FILE, "a", encoding="utf-8") as f:
+            for span in batch:
+                f.write(json.dumps(span.to_dict()) + "\n")
+    if TRACE_OTLP_ENDPOINT:
+        import urllib.request  # Only needed when exporting, keeps it out of startup
+        body = json.dumps(_to_otlp(batch)).encode()
+        request = urllib.request.Request(TRACE_OTLP_ENDPOINT, data=body, headers={"Content-Type": "application/json"})
+        urllib.request.urlopen(request, timeout=10).close()
+
+
+def _otlp_value(value):
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _to_otlp(batch):
+    # OTLP/HTTP JSON encoding
+    spans = [{
+        "traceId": f"{s.trace_id:032x}",
+        "spanId": f"{s.span_id:016x}",
+        "parentSpanId": f"{s.parent_id:016x}" if s.parent_id else "",
+        "name": s.name,
+        "kind": 1,
+        "startTimeUnixNano": str(s.start),
+        "endTimeUnixNano": str(s.end),
+        "attributes": [{"key": k, "value": _otlp_value(v)} for k, v in s.attributes.items()],
+    } for s in batch]
+    return {"resourceSpans": [{
+        "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": SERVICE_NAME}}]},
+        "scopeSpans": [{"scope": {"name": "bot"}, "spans": spans}],
+    }]}
+
+
+# --- On-demand profiling ---
+_profiling = False
+
+
+async def profile(seconds, sort="cumulative", limit=40):
+    # Profiles the event loop thread for `seconds` and returns a text report.
+    # Uses yappi (sees across coroutines) when installed, else cProfile.
+    global _profiling
+    if _profiling:
+        raise RuntimeError("A profile is already running")
+    _profiling = True
+    try:
+        try:
+            import yappi
+        except ImportError:
+            yappi = None
+
+        if yappi:
+            yappi.set_clock_type("wall")
+            yappi.start()
+            await asyncio.sleep(seconds)
+            yappi.stop()
+            out = io.StringIO()
+            stats = yappi.get_func_stats()
+            stats.sort("ttot" if sort == "cumulative" else "tsub")
+            stats.print_all(out=out)
+            yappi.clear_stats()
+            return "yappi (wall clock)\n" + "\n".join(out.getvalue().splitlines()[:limit + 10])
+
+        import cProfile
+        import pstats
+        profiler = cProfile.Profile()
+        profiler.enable()
+        await asyncio.sleep(seconds)
+        profiler.disable()
+        out = io.StringIO()
+        pstats.Stats(profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return "cProfile\n" + out.getvalue()
+    finally:
+        _profiling = False
@@ -0,0 +1,102 @@
+import os
+import re
+import time
+import asyncio
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from cache import TTLCache
+
+# "google" (deep-translator) or "stub" (offline, for tests and benchmarks)
+TRANSLATE_BACKEND = os.environ.get("TRANSLATE_BACKEND", "google")
+TRANSLATE_WORKERS = int(os.environ.get("TRANSLATE_WORKERS", 4))
+TRANSLATE_TIMEOUT = float(os.environ.get("TRANSLATE_TIMEOUT", 10))
+TRANSLATE_CACHE_SIZE = int(os.environ.get("TRANSLATE_CACHE_SIZE", 2000))
+TRANSLATE_CACHE_TTL = 24 * 3600
+
+_WORDS = re.compile(r"[^\W\d_]+")
+# Common words used to guess that a text is already in the target language.
+# Only words that aren't also common in other languages written in the same
+# alphabet ("a", "no", "in", "die"...), so a hit is real evidence.
+LANGUAGE_HINTS = {
+    "en": {
+        "the", "and", "are", "with", "this", "that", "you", "they", "your",
+        "have", "what", "how", "please", "thanks", "hello", "yes", "it", "of",
+        "not", "would", "there", "their", "from", "about", "just", "know",
+        "think", "because", "been", "were", "should", "could",
+    },
+}
+# Share of words that must be hints (and at least two of them)
+LANGUAGE_HINT_RATIO = 0.35
+
+
+class GoogleBackend:
+    def translate(self, text, target):
+        # deep-translator pulls in requests/bs4, only load it when /tr is used
+        from deep_translator import GoogleTranslator
+        return GoogleTranslator(source="auto", target=target).translate(text)
+
+
+class StubBackend:
+    # Offline stand-in; `delay` simulates the HTTP round trip
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.calls = 0
+
+    def translate(self, text, target):
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        return f"[{target}] {text}"
+
+
+BACKENDS = {"google": GoogleBackend, "stub": StubBackend}
+
+
+def is_probably_language(text, target):
+    # Cheap local check, only says yes when it's fairly sure
+    hints = LANGUAGE_HINTS.get(target)
+    if not hints:
+        return False
+    letters = [c for c in text if c.isalpha()]
+    if not letters:
+        return True  # Nothing to translate (emoji, numbers, links...)
+    if target == "en" and sum(not c.isascii() for c in letters) > len(letters) // 10:
+        return False
+    words = _WORDS.findall(text.lower())
+    if len(words) < 3:
+        return False
+    hits = sum(w in hints for w in words)
+    return hits >= 2 and hits >= len(words) * LANGUAGE_HINT_RATIO
+
+
+class TranslationService:
+    # Runs the blocking translator on a small thread pool so it never stalls
+    # the event loop, with a timeout and an LRU cache of recent results.
+    def __init__(self, backend=None, workers=TRANSLATE_WORKERS, timeout=TRANSLATE_TIMEOUT):
+        self.backend = backend or BACKENDS[TRANSLATE_BACKEND]()
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="translate")
+        self._slots = asyncio.Semaphore(workers)
+        self.cache = TTLCache(maxsize=TRANSLATE_CACHE_SIZE, ttl=TRANSLATE_CACHE_TTL)
+        self.skipped = 0
+
+    async def translate(self, text, target="en"):
+        # Returns None when the text already looks like it's in `target`
+        if is_probably_language(text, target):
+            self.skipped += 1
+            return None
+        key = (hashlib.sha1(text.encode()).hexdigest(), target)
+        return await self.cache.get_or_load(key, lambda: self._run(text, target))
+
+    async def _run(self, text, target):
+        loop = asyncio.get_running_loop()
+
+        async def run():
+            # Bound in-flight requests so a slow backend can't pile up threads
+            async with self._slots:
+                return await loop.run_in_executor(self._executor, self.backend.translate, text, target)
+
+        return await asyncio.wait_for(run(), self.timeout)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
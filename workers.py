@@ -0,0 +1,225 @@
+import os
+import sys
+import types
+import signal
+import asyncio
+import itertools
+import threading
+import multiprocessing
+from collections import OrderedDict
+from detection import Policy, evaluate
+
+# Processes that run the CPU-bound checks (blacklist, links, mentions).
+# 0 or 1 keeps everything in the bot process.
+WORKERS = int(os.environ.get("WORKERS", 0))
+# Seconds a new worker gets to boot before its messages fall back to local evaluation
+WORKER_START_TIMEOUT = 30
+# Seconds a worker gets to exit on shutdown before it is killed
+WORKER_STOP_TIMEOUT = 5
+# How often dead workers are looked for (seconds)
+WORKER_CHECK_INTERVAL = 5
+# Chat policies each worker keeps a copy of (least recently used are dropped)
+WORKER_POLICY_CACHE = 2000
+# Most workers /workers can ask for
+MAX_WORKERS = os.cpu_count() or 1
+
+
+def _worker_main(inbox, outbox):
+    # Shutdown is driven by the bot process, not by Ctrl+C on the group
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Same size and access order as WorkerPool's record of what it sent, so
+    # both sides drop the same chats
+    policies = OrderedDict()
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        if item[0] == "policy":
+            _, chat_id, words, domains, word_boundary = item
+            policies[chat_id] = Policy(words, domains, word_boundary)
+            continue
+        _, request_id, payload = item
+        try:
+            chat_id = payload["chat_id"]
+            policies.move_to_end(chat_id)
+            while len(policies) > WORKER_POLICY_CACHE:
+                policies.popitem(last=False)
+            outbox.put((request_id, evaluate(payload, policies[chat_id]), None))
+        except Exception as e:
+            outbox.put((request_id, None, repr(e)))
+
+
+class WorkerPool:
+    # The bot process keeps the Telegram connection and does all API and
+    # database work; messages are evaluated by worker processes, picked by
+    # chat_id so each chat always goes to the same worker and its messages
+    # are evaluated in order. Workers keep a copy of each chat's lists,
+    # resent when the chat's Policy.revision changes. Any worker problem
+    # falls back to evaluating in this process.
+    def __init__(self, workers=WORKERS):
+        self.size = workers if workers > 1 else 0
+        self._context = multiprocessing.get_context("spawn")
+        self._workers = []       # [(process, inbox, {chat_id: policy revision sent})], index = chat_id % len
+        self._outbox = None
+        self._reader = None
+        self._pending = {}       # request_id -> (future, worker index)
+        self._ids = itertools.count()
+        self._accepting = asyncio.Event()
+        self._accepting.set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self._resize_lock = asyncio.Lock()
+        self._monitor = None
+        self._loop = None
+        self.fallbacks = 0
+
+    def __len__(self):
+        return len(self._workers)
+
+    def pending(self):
+        return len(self._pending)
+
+    # --- Lifecycle ---
+    async def start(self):
+        if not self.size or self._workers: return
+        await self.resize(self.size)
+
+    async def stop(self):
+        # Lets in-flight messages finish, then shuts the workers down
+        if not self._outbox: return
+        await self.resize(0)
+        self._monitor.cancel()
+        self._monitor = None
+        self._outbox.put(None)
+        await asyncio.to_thread(self._reader.join)
+        self._outbox.close()
+        self._outbox = None
+
+    async def resize(self, workers):
+        # Also used at runtime (/workers). Changing the worker count changes
+        # which worker owns a chat, so new messages wait until everything
+        # already sent has been evaluated; 0 evaluates in this process again.
+        async with self._resize_lock:
+            if workers and self._outbox is None:
+                self._open()
+            self._accepting.clear()
+            try:
+                await self._drained.wait()
+                while len(self._workers) > workers:
+                    await self._stop_worker(*self._workers.pop())
+                added = range(len(self._workers), workers)
+                for _ in added:
+                    self._workers.append(self._spawn())
+                self.size = len(self._workers)
+                # Wait for new workers to finish booting, so the first
+                # messages routed to them aren't stuck behind the imports
+                boot = asyncio.gather(*(self._submit(i, {"chat_id": i, "text": "", "entities": []}) for i in added), return_exceptions=True)
+                try:
+                    await asyncio.wait_for(boot, WORKER_START_TIMEOUT)
+                except asyncio.TimeoutError:
+                    print(f"Workers did not start within {WORKER_START_TIMEOUT}s")
+                    for i in added:
+                        self._fail_pending(i)
+            finally:
+                self._accepting.set()
+
+    def _open(self):
+        self._loop = asyncio.get_running_loop()
+        self._outbox = self._context.Queue()
+        self._reader = threading.Thread(target=self._read_results, name="worker-results", daemon=True)
+        self._reader.start()
+        self._monitor = asyncio.create_task(self._watch())
+
+    def _spawn(self):
+        inbox = self._context.Queue()
+        process = self._context.Process(target=_worker_main, args=(inbox, self._outbox), name="moderation-worker", daemon=True)
+        # A spawned child first re-runs the parent's __main__, which is
+        # bot.py (Telegram client, MongoDB, the journal...). Hide it for the
+        # start, so the child only imports this module and detection.
+        main = sys.modules["__main__"]
+        sys.modules["__main__"] = types.ModuleType("__main__")
+        try:
+            process.start()
+        finally:
+            sys.modules["__main__"] = main
+        return process, inbox, OrderedDict()
+
+    async def _stop_worker(self, process, inbox, sent):
+        inbox.put(None)
+        await asyncio.to_thread(process.join, WORKER_STOP_TIMEOUT)
+        if process.is_alive():
+            process.kill()
+            await asyncio.to_thread(process.join)
+        inbox.close()
+
+    async def _watch(self):
+        # Replace crashed workers in place, so chat routing stays the same
+        while True:
+            await asyncio.sleep(WORKER_CHECK_INTERVAL)
+            for index, (process, inbox, _) in enumerate(self._workers):
+                if process.is_alive():
+                    continue
+                print(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                self._fail_pending(index)
+                inbox.close()
+                self._workers[index] = self._spawn()
+
+    # --- Evaluation ---
+    async def evaluate(self, payload, policy):
+        # `policy` is the chat's live Policy from Database.get_policy()
+        if not self._workers and self._accepting.is_set():
+            return evaluate(payload, policy)
+        await self._accepting.wait()
+        if not self._workers:
+            return evaluate(payload, policy)
+
+        chat_id = payload["chat_id"]
+        index = chat_id % len(self._workers)
+        _, inbox, sent = self._workers[index]
+        if sent.get(chat_id) != policy.revision:
+            inbox.put(("policy", chat_id, *policy.state()))
+            sent[chat_id] = policy.revision
+        sent.move_to_end(chat_id)
+        while len(sent) > WORKER_POLICY_CACHE:
+            sent.popitem(last=False)
+
+        try:
+            return await self._submit(index, payload)
+        except Exception as e:
+            sent.pop(chat_id, None)
+            self.fallbacks += 1
+            print(f"Worker evaluation failed ({e}), evaluating locally")
+            return evaluate(payload, policy)
+
+    def _submit(self, index, payload):
+        request_id = next(self._ids)
+        future = self._loop.create_future()
+        self._pending[request_id] = (future, index)
+        self._drained.clear()
+        self._workers[index][1].put(("eval", request_id, payload))
+        return future
+
+    def _read_results(self):
+        while True:
+            try:
+                item = self._outbox.get()
+            except (EOFError, OSError):
+                return
+            if item is None:
+                return
+            self._loop.call_soon_threadsafe(self._resolve, *item)
+
+    def _resolve(self, request_id, result, error):
+        entry = self._pending.pop(request_id, None)
+        if entry and not entry[0].done():
+            if error:
+                entry[0].set_exception(RuntimeError(error))
+            else:
+                entry[0].set_result(result)
+        if not self._pending:
+            self._drained.set()
+
+    def _fail_pending(self, index):
+        for request_id, (future, owner) in list(self._pending.items()):
+            if owner == index:
+                self._resolve(request_id, None, "worker exited")